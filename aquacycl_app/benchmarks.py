@@ -0,0 +1,402 @@
+import base64
+import contextlib
+import csv
+import hashlib
+import http.server
+import io
+import json
+import threading
+import time
+import tracemalloc
+
+from django.db import connections
+from django.db.backends import utils
+from django.db.backends.signals import connection_created
+
+from aquacycl_app import github_client
+from aquacycl_project import constants, settings
+
+
+def get_blob_sha(content: bytes) -> str:
+    """
+    To compute the git blob SHA of a file content
+    Params:
+        content: raw content of the file
+    Returns:
+        blob_sha: hex SHA-1 of the git blob object
+    """
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def build_manifest_csv(
+    file_index: int, row_count: int, seed: int = 0
+) -> bytes:
+    """
+    To generate a synthetic manifest csv file
+    Params:
+        file_index: index of the file, used to vary the generated values
+        row_count: number of data rows
+        seed: value mixed into the generated descriptions to produce a new revision of the file
+    Returns:
+        content: raw content of the csv file
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        [
+            constants.Manifest.SUBTOPIC_BIT_NUMBER,
+            constants.Manifest.SUBTOPIC_REPORTED_ON,
+            "subtopicName",
+            "subtopicDescription",
+            "severity",
+            "threshold",
+            "isAlarm",
+        ]
+    )
+    for row_index in range(row_count):
+        writer.writerow(
+            [
+                row_index % 64,
+                f"controller{row_index // 64}",
+                f"subtopic {file_index}-{row_index}",
+                f"synthetic subtopic {row_index} revision {seed}",
+                row_index % 5,
+                round(row_index * 0.25, 2),
+                "True" if row_index % 7 == 0 else "False",
+            ]
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+class FakeGithubRepo:
+    """
+    Synthetic siteDeployment repository holding a config.json and a set of
+    manifest csv files, addressed by git style commit, tree and blob SHAs.
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        customer: str,
+        site_name: str,
+        file_count: int,
+        row_count: int,
+    ):
+        self.owner = owner
+        self.repo = repo
+        self.customer = customer
+        self.site_name = site_name
+        self.row_count = row_count
+        self.blobs = {}
+        self.trees = {}
+        self.files = {
+            self.get_file_name(file_index): build_manifest_csv(
+                file_index=file_index, row_count=row_count
+            )
+            for file_index in range(file_count)
+        }
+        self.commit_sha = None
+        self.tree_sha = None
+        self.commit()
+
+    def get_file_name(self, file_index: int) -> str:
+        return f"manifest_{self.site_name}_v{file_index + 1}.csv"
+
+    def commit(self):
+        """
+        To record the current files of the repository as a new head commit
+        Returns:
+            None
+        """
+        config = {
+            "production": {
+                "customer": self.customer,
+                "siteName": self.site_name,
+                "manifestCSVFilename": self.get_file_name(0),
+            }
+        }
+        files = {
+            constants.Manifest.CONFIG_FILE_NAME: json.dumps(config).encode(
+                "utf-8"
+            ),
+            **self.files,
+        }
+        tree = {}
+        for name, content in files.items():
+            blob_sha = get_blob_sha(content)
+            self.blobs[blob_sha] = content
+            tree[name] = blob_sha
+        self.tree_sha = hashlib.sha1(
+            json.dumps(tree, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.trees[self.tree_sha] = tree
+        self.commit_sha = hashlib.sha1(
+            f"{self.tree_sha}{time.time()}".encode("utf-8")
+        ).hexdigest()
+
+    def update_files(self, changed_file_count: int, seed: int):
+        """
+        To rewrite some of the manifest files and commit the change
+        Params:
+            changed_file_count: number of files to rewrite
+            seed: value producing the new revision of the files
+        Returns:
+            None
+        """
+        for file_index in range(min(changed_file_count, len(self.files))):
+            self.files[self.get_file_name(file_index)] = build_manifest_csv(
+                file_index=file_index, row_count=self.row_count, seed=seed
+            )
+        self.commit()
+
+
+class FakeGithubRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the subset of the GitHub REST API used by GithubRepoClient for the
+    repository of the server, including raw blob downloads
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: dict, headers: dict = None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_raw(self, content: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_status(self, status_code: int, message: str = ""):
+        body = json.dumps({"message": message}).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        repo = server.repo
+        prefix = f"/repos/{repo.owner}/{repo.repo}/"
+        if not self.path.startswith(prefix):
+            return self._send_status(404, "Not Found")
+        path = self.path[len(prefix) :]
+
+        if path == "commits/HEAD":
+            etag = f'"{repo.commit_sha}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return None
+            return self._send_json(
+                {
+                    "sha": repo.commit_sha,
+                    "commit": {"tree": {"sha": repo.tree_sha}},
+                },
+                headers={"ETag": etag},
+            )
+        if path.startswith("git/trees/"):
+            tree = repo.trees.get(path[len("git/trees/") :])
+            if tree is None:
+                return self._send_status(404, "Not Found")
+            return self._send_json(
+                {
+                    "tree": [
+                        {"path": name, "type": "blob", "sha": blob_sha}
+                        for name, blob_sha in tree.items()
+                    ]
+                }
+            )
+        if path.startswith("git/blobs/"):
+            content = repo.blobs.get(path[len("git/blobs/") :])
+            if content is None:
+                return self._send_status(404, "Not Found")
+            if self.headers.get("Accept") == github_client.RAW_MEDIA_TYPE:
+                return self._send_raw(content)
+            return self._send_json(
+                {
+                    "encoding": "base64",
+                    "content": base64.b64encode(content).decode("ascii"),
+                    "size": len(content),
+                }
+            )
+        return self._send_status(404, "Not Found")
+
+
+class FakeGithubServer(http.server.ThreadingHTTPServer):
+    """
+    Local stand-in for the GitHub API serving a single FakeGithubRepo. The
+    server runs in a daemon thread and counts the requests it receives.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, repo: FakeGithubRepo):
+        super().__init__(("127.0.0.1", 0), FakeGithubRequestHandler)
+        self.repo = repo
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements executed on every database connection,
+    including connections opened later by worker threads. COPY statements
+    sent with cursor.copy_expert bypass the execute wrappers and are counted
+    by wrapping copy_expert on the Django cursor wrappers, including the
+    PostgreSQL debug cursor used when DEBUG is on.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.copy_count = 0
+        self._lock = threading.Lock()
+        self._original_copy_experts = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        self._install(connection)
+
+    def _wrap_copy_expert(self, cursor_class):
+        # CursorWrapper forwards copy_expert to the driver cursor through
+        # __getattr__, a class attribute takes precedence over it. The
+        # PostgreSQL CursorDebugWrapper defines its own copy_expert, which is
+        # kept so that COPY statements still show up in connection.queries.
+        original_copy_expert = cursor_class.__dict__.get("copy_expert")
+        self._original_copy_experts[cursor_class] = original_copy_expert
+
+        def copy_expert(cursor_wrapper, *args, **kwargs):
+            with self._lock:
+                self.count += 1
+                self.copy_count += 1
+            if original_copy_expert is None:
+                return cursor_wrapper.cursor.copy_expert(*args, **kwargs)
+            return original_copy_expert(cursor_wrapper, *args, **kwargs)
+
+        cursor_class.copy_expert = copy_expert
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._install(connection)
+        connection_created.connect(self._on_connection_created)
+        for cursor_class in get_cursor_classes():
+            self._wrap_copy_expert(cursor_class)
+        return self
+
+    def __exit__(self, *args):
+        for (
+            cursor_class,
+            original_copy_expert,
+        ) in self._original_copy_experts.items():
+            if original_copy_expert is None:
+                del cursor_class.copy_expert
+            else:
+                cursor_class.copy_expert = original_copy_expert
+        self._original_copy_experts = {}
+        connection_created.disconnect(self._on_connection_created)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def get_cursor_classes() -> list:
+    """
+    To get the Django cursor wrapper classes COPY statements can be sent through
+    Returns:
+        cursor_classes: CursorWrapper, and the PostgreSQL CursorDebugWrapper when
+                        psycopg2 is installed
+    """
+    cursor_classes = [utils.CursorWrapper]
+    try:
+        from django.db.backends.postgresql import base as postgresql_base
+    except ImportError:
+        return cursor_classes
+    cursor_classes.append(postgresql_base.CursorDebugWrapper)
+    return cursor_classes
+
+
+@contextlib.contextmanager
+def github_api_url(url: str):
+    """
+    To point the GitHub client at another API URL for the duration of the block
+    """
+    original_url = settings.GITHUB_API_URL
+    settings.GITHUB_API_URL = url
+    try:
+        yield
+    finally:
+        settings.GITHUB_API_URL = original_url
+
+
+def measure(name: str, server: FakeGithubServer, func, *args, **kwargs):
+    """
+    To run a benchmark step and collect its metrics. Memory is traced with
+    tracemalloc from the start of the step, so that the peak belongs to the
+    step alone instead of being the high-water mark of the whole process.
+    Params:
+        name: name of the step
+        server: fake GitHub server the step talks to
+        func: callable running the step
+    Returns:
+        metrics: dictionary with the wall time, query and COPY counts, peak traced memory and GitHub call count
+    """
+    github_calls = server.request_count
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        with QueryCounter() as query_counter:
+            func(*args, **kwargs)
+        wall_time = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "step": name,
+        "wall_time": round(wall_time, 3),
+        "queries": query_counter.count,
+        "copies": query_counter.copy_count,
+        "peak_memory_mb": round(peak_memory / (1024 * 1024), 1),
+        "github_calls": server.request_count - github_calls,
+    }
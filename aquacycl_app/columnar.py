@@ -0,0 +1,341 @@
+import array
+import bisect
+import itertools
+import json
+import sys
+import zlib
+
+from aquacycl_app import loaders, models
+from aquacycl_project import settings
+
+FORMAT_VERSION = 2
+
+ARRAY_TYPECODES = {
+    "int": "q",
+    "float": "d",
+    "str": "I",
+    "json": "I",
+}
+
+MIN_INT = -(2**63)
+MAX_INT = 2**63 - 1
+
+
+def _get_encoding(values: list) -> str:
+    # a segment is typed only when every value has the same exact type, any
+    # other mix is kept as JSON so that values come back unchanged
+    value_types = {type(value) for value in values if value is not None}
+    if not value_types:
+        return "null"
+    if len(value_types) > 1:
+        return "json"
+    value_type = value_types.pop()
+    if value_type is int:
+        if all(
+            MIN_INT <= value <= MAX_INT
+            for value in values
+            if value is not None
+        ):
+            return "int"
+        return "json"
+    if value_type is bool:
+        return "bool"
+    if value_type is float:
+        return "float"
+    if value_type is str:
+        return "str"
+    return "json"
+
+
+def _to_bytes(values: array.array) -> bytes:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, content: bytes) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(content)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _encode_column(values: list, encoding: str) -> tuple:
+    nulls = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value is None:
+            nulls[index // 8] |= 1 << (index % 8)
+    dictionary = None
+    if encoding == "null":
+        encoded = b""
+    elif encoding == "bool":
+        encoded = bytes(1 if value else 0 for value in values)
+    elif encoding in ("str", "json"):
+        dictionary = []
+        positions = {}
+        indexes = array.array(ARRAY_TYPECODES[encoding])
+        for value in values:
+            if value is None:
+                value = ""
+            elif encoding == "json":
+                value = json.dumps(value)
+            if value not in positions:
+                positions[value] = len(dictionary)
+                dictionary.append(value)
+            indexes.append(positions[value])
+        encoded = _to_bytes(indexes)
+    else:
+        encoded = _to_bytes(
+            array.array(
+                ARRAY_TYPECODES[encoding],
+                (0 if value is None else value for value in values),
+            )
+        )
+    return bytes(nulls), encoded, dictionary
+
+
+def _decode_column(
+    segment: dict, nulls: bytes, encoded: bytes, row_count: int
+) -> list:
+    encoding = segment["encoding"]
+    if encoding == "null":
+        return [None] * row_count
+    if encoding == "bool":
+        values = [bool(value) for value in encoded]
+    elif encoding in ("str", "json"):
+        dictionary = segment["dictionary"]
+        if encoding == "json":
+            dictionary = [json.loads(value) for value in dictionary]
+        values = [
+            dictionary[index]
+            for index in _from_bytes(ARRAY_TYPECODES[encoding], encoded)
+        ]
+    else:
+        values = list(_from_bytes(ARRAY_TYPECODES[encoding], encoded))
+    for index in range(row_count):
+        if nulls[index // 8] & (1 << (index % 8)):
+            values[index] = None
+    return values
+
+
+def _encode_row_group(column_names: list, rows: list, offset: int) -> tuple:
+    segments = []
+    buffer = []
+    position = 0
+    for name in column_names:
+        values = [row.get(name) for row in rows]
+        encoding = _get_encoding(values)
+        nulls, encoded, dictionary = _encode_column(values, encoding)
+        segments.append(
+            {
+                "encoding": encoding,
+                "dictionary": dictionary,
+                "nulls": [position, len(nulls)],
+                "values": [position + len(nulls), len(encoded)],
+            }
+        )
+        buffer.extend([nulls, encoded])
+        position += len(nulls) + len(encoded)
+    compressed = zlib.compress(b"".join(buffer))
+    row_group = {
+        "row_count": len(rows),
+        "offset": offset,
+        "length": len(compressed),
+        "columns": segments,
+    }
+    return row_group, compressed
+
+
+def encode_manifest(
+    content: loaders.ManifestContent, row_group_size: int = None
+) -> tuple:
+    """
+    To convert a manifest csv file into its columnar representation. Rows are encoded in
+    row groups of row_group_size rows, each compressed on its own, so that only one row
+    group of decoded values is held in memory at a time.
+    Params:
+        content: raw content of the csv file, as bytes or a binary file
+        row_group_size: number of rows per row group, defaults to
+                        settings.MANIFEST_LOAD_CHUNK_SIZE
+    Returns:
+        columns: column schema with the name of each column
+        row_groups: row count, payload offset and length and the encoding, dictionary
+                    and segment offsets of each column of every row group
+        row_count: number of rows
+        payload: compressed row groups
+    """
+    row_group_size = row_group_size or settings.MANIFEST_LOAD_CHUNK_SIZE
+    rows = loaders.iter_manifest_rows(content)
+    column_names = None
+    row_groups = []
+    payload = []
+    offset = 0
+    row_count = 0
+    while True:
+        chunk = list(itertools.islice(rows, row_group_size))
+        if not chunk:
+            break
+        if column_names is None:
+            column_names = list(chunk[0].keys())
+        row_group, compressed = _encode_row_group(
+            column_names=column_names, rows=chunk, offset=offset
+        )
+        row_groups.append(row_group)
+        payload.append(compressed)
+        offset += len(compressed)
+        row_count += len(chunk)
+    columns = [{"name": name} for name in column_names or []]
+    return columns, row_groups, row_count, b"".join(payload)
+
+
+class ColumnarManifestReader:
+    """
+    Reads manifest rows back from a columnar manifest file. Row groups are
+    decompressed and decoded only when one of their records is requested, and
+    only the last decoded row group is kept.
+    """
+
+    def __init__(self, columnar_file: models.ManifestColumnarFile):
+        self.column_names = [
+            column["name"] for column in columnar_file.columns
+        ]
+        self.row_groups = columnar_file.row_groups
+        self.row_count = columnar_file.row_count
+        self._payload = columnar_file.payload
+        self._row_group_starts = list(
+            itertools.accumulate(
+                [0] + [row_group["row_count"] for row_group in self.row_groups]
+            )
+        )[:-1]
+        self._decoded_row_group = (None, None)
+
+    def __len__(self):
+        return self.row_count
+
+    def _get_row_group(self, row_group_index: int) -> list:
+        decoded_index, decoded_columns = self._decoded_row_group
+        if decoded_index == row_group_index:
+            return decoded_columns
+        row_group = self.row_groups[row_group_index]
+        content = zlib.decompress(
+            bytes(
+                self._payload[
+                    row_group["offset"] : row_group["offset"]
+                    + row_group["length"]
+                ]
+            )
+        )
+        decoded_columns = []
+        for segment in row_group["columns"]:
+            nulls_offset, nulls_length = segment["nulls"]
+            values_offset, values_length = segment["values"]
+            decoded_columns.append(
+                _decode_column(
+                    segment=segment,
+                    nulls=content[nulls_offset : nulls_offset + nulls_length],
+                    encoded=content[
+                        values_offset : values_offset + values_length
+                    ],
+                    row_count=row_group["row_count"],
+                )
+            )
+        self._decoded_row_group = (row_group_index, decoded_columns)
+        return decoded_columns
+
+    def column(self, name: str) -> list:
+        """
+        To get the decoded values of a column
+        Params:
+            name: name of the column
+        Returns:
+            values: list of values of the column with None for nulls
+        """
+        column_index = self.column_names.index(name)
+        values = []
+        for row_group_index in range(len(self.row_groups)):
+            values.extend(self._get_row_group(row_group_index)[column_index])
+        return values
+
+    def __getitem__(self, index: int) -> dict:
+        if not -self.row_count <= index < self.row_count:
+            raise IndexError("manifest row index out of range")
+        if index < 0:
+            index += self.row_count
+        row_group_index = (
+            bisect.bisect_right(self._row_group_starts, index) - 1
+        )
+        decoded_columns = self._get_row_group(row_group_index)
+        row_index = index - self._row_group_starts[row_group_index]
+        return {
+            name: values[row_index]
+            for name, values in zip(self.column_names, decoded_columns)
+        }
+
+    def __iter__(self):
+        for row_group_index, row_group in enumerate(self.row_groups):
+            decoded_columns = self._get_row_group(row_group_index)
+            for row_index in range(row_group["row_count"]):
+                yield {
+                    name: values[row_index]
+                    for name, values in zip(self.column_names, decoded_columns)
+                }
+
+
+def store_manifest_file(
+    version_history: models.SiteManifestVersionHistory,
+    content: loaders.ManifestContent,
+) -> models.ManifestColumnarFile:
+    """
+    To store the columnar representation of a manifest file for its version history entry,
+    skipping files whose stored blob SHA and format version are unchanged
+    Params:
+        version_history: version history entry of the manifest file
+        content: raw content of the csv file, as bytes or a binary file
+    Returns:
+        columnar_file: stored columnar manifest file
+    """
+    columnar_file = models.ManifestColumnarFile.objects.filter(
+        version_history=version_history
+    ).first()
+    if (
+        columnar_file is not None
+        and columnar_file.blob_sha == version_history.blob_sha
+        and columnar_file.format_version == FORMAT_VERSION
+    ):
+        return columnar_file
+    columns, row_groups, row_count, payload = encode_manifest(content)
+    columnar_file, _ = models.ManifestColumnarFile.objects.update_or_create(
+        version_history=version_history,
+        defaults={
+            "format_version": FORMAT_VERSION,
+            "columns": columns,
+            "row_groups": row_groups,
+            "row_count": row_count,
+            "blob_sha": version_history.blob_sha,
+            "payload": payload,
+        },
+    )
+    return columnar_file
+
+
+def get_manifest_reader(
+    version_history: models.SiteManifestVersionHistory,
+) -> ColumnarManifestReader:
+    """
+    To get a lazy reader over the columnar manifest file of a version history entry
+    Params:
+        version_history: version history entry of the manifest file
+    Returns:
+        reader: ColumnarManifestReader or None if no columnar file of the current blob and
+                format version is stored
+    """
+    columnar_file = models.ManifestColumnarFile.objects.filter(
+        version_history=version_history,
+        blob_sha=version_history.blob_sha,
+        format_version=FORMAT_VERSION,
+    ).first()
+    if columnar_file is None:
+        return None
+    return ColumnarManifestReader(columnar_file)
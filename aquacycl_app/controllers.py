@@ -1,35 +1,41 @@
+import contextlib
 import datetime
-import io
 import json
 
 import github
-import numpy as np
-import pandas as pd
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q, QuerySet, Sum
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_framework import exceptions, serializers
 
-from aquacycl_app import models
+from aquacycl_app import (
+    columnar,
+    diffs,
+    github_client,
+    history_cache,
+    loaders,
+    locks,
+    lookup,
+    models,
+    pipeline,
+)
+from aquacycl_app import serializers as app_serializers
+from aquacycl_app import validator
 from aquacycl_project import constants, settings
+from tj_packages import custom_pagination
 from users import models as users_models
 
 
 class ManifestController:
-    def fetch_from_github_repo_link(self, owner: str, repo: str) -> tuple:
+    @contextlib.contextmanager
+    def handle_github_errors(self):
         """
-        To fetch a repository based on the owner and repo name
-        Params:
-            owner: owner or organization of the repository
-            repo: name of the repository
-        Returns:
-            config_data: configuration metadata for the site from the repository
-            csv_file_names: list of names of csv files
-            csv_files: dictionary of csv files with name as key and content dataframe as value
+        To convert the GitHub errors raised by the block into API errors
         """
-        auth = github.Auth.Token(settings.GITHUB_TOKEN)
-        github_object = github.Github(auth=auth)
         try:
-            repo_object = github_object.get_repo(f"{owner}/{repo}")
-            config = repo_object.get_contents("config.json")
-            contents = repo_object.get_contents("")
+            yield
         except github.UnknownObjectException:
             raise exceptions.NotFound(
                 {
@@ -63,52 +69,293 @@ class ManifestController:
                 },
                 code="validation_error",
             )
-        config_data = json.loads(config.decoded_content)
-        config_name = config.name
-        config_latest_commit_hash = config.repository.get_commits(
-            path=config.path
-        )[0].sha
-        csv_files = {}
-        csv_file_hashes = {}
-        csv_file_names = []
-        for content in contents:
-            if content.path.endswith(".csv"):
-                csv_file_names.append(content.name)
-                try:
-                    csv_df = pd.read_csv(
-                        io.StringIO(content.decoded_content.decode("utf-8"))
-                    )
-                except pd.errors.EmptyDataError:
-                    raise serializers.ValidationError(
-                        {
-                            "result": False,
-                            "msg": "Please check the file and try again.",
-                        },
-                        code="validation_error",
-                    )
-                if len(csv_df) == 0:
-                    raise serializers.ValidationError(
-                        {
-                            "result": False,
-                            "msg": "Plase check the file and try again.",
-                            "validation_error_field": "",
-                        },
-                        code="validation_error",
-                    )
-                csv_files[content.name] = csv_df
-                latest_commit = content.repository.get_commits(
-                    path=content.path
-                )[0]
-                csv_file_hashes[content.name] = latest_commit.sha
+
+    def fetch_from_github_repo_link(self, owner: str, repo: str) -> tuple:
+        """
+        To fetch a repository based on the owner and repo name. Only the commit, tree and config
+        are requested here, csv files are downloaded when their content is first accessed.
+        Params:
+            owner: owner or organization of the repository
+            repo: name of the repository
+        Returns:
+            config_data: configuration metadata for the site from the repository
+            config_name: name of the config file
+            config_blob_sha: blob SHA of the config file
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+            csv_file_names: list of names of csv files
+            csv_files: lazy mapping of csv file names to downloaded blob files, to be
+                       accessed within handle_github_errors
+            snapshot: dictionary with the head commit_sha and root tree_sha of the repository
+        """
+        with self.handle_github_errors():
+            repo_client = github_client.GithubRepoClient(
+                owner=owner, repo=repo
+            )
+            snapshot = repo_client.get_snapshot()
+            blob_shas = repo_client.get_root_blob_shas(
+                tree_sha=snapshot["tree_sha"]
+            )
+            if constants.Manifest.CONFIG_FILE_NAME not in blob_shas:
+                raise exceptions.NotFound(
+                    {
+                        "result": False,
+                        "msg": "Please provide a valid link.",
+                        "validation_error_msg": "Repository or content not found.",
+                    },
+                    code="not_found",
+                )
+            config_name = constants.Manifest.CONFIG_FILE_NAME
+            config_blob_sha = blob_shas[config_name]
+            config_content = repo_client.get_blob_content(
+                blob_sha=config_blob_sha, cache=True
+            )
+            repo_client.flush_cache_hits()
+        config_data = json.loads(config_content)
+        csv_file_hashes = {
+            name: blob_sha
+            for name, blob_sha in blob_shas.items()
+            if name.endswith(".csv")
+        }
+        csv_files = github_client.LazyBlobContents(
+            repo_client=repo_client, blob_shas=csv_file_hashes
+        )
 
         return (
             config_data,
             config_name,
-            config_latest_commit_hash,
+            config_blob_sha,
+            csv_file_hashes,
+            list(csv_file_hashes.keys()),
+            csv_files,
+            snapshot,
+        )
+
+    def validate_manifest(
+        self,
+        user: users_models.User,
+        site: users_models.Site,
+        site_repo_url: str,
+        owner: str,
+        repo: str,
+        progress_callback=None,
+    ):
+        """
+        To fetch the manifest repository of a site, validate its config and store its manifest files
+        Params:
+            user: Admin user who posted the repository URL
+            site: Site for the given repository URL
+            site_repo_url: Repository URL
+            owner: Github user or organization that owns the repository
+            repo: Repository name
+            progress_callback: optional callable receiving the current stage name and percentage
+        Returns:
+            result: dictionary with the duration in seconds of each write stage, the errors
+                    of optional stages that were rolled back and the number of downloaded and
+                    unchanged csv files
+        """
+        progress_callback = progress_callback or (lambda stage, progress: None)
+        progress_callback("fetching", 10)
+        (
+            config_data,
+            config_name,
+            config_blob_sha,
             csv_file_hashes,
             csv_file_names,
             csv_files,
+            snapshot,
+        ) = self.fetch_from_github_repo_link(owner=owner, repo=repo)
+        with contextlib.closing(csv_files):
+            latest_commit_hash = snapshot["commit_sha"]
+
+            progress_callback("validating", 40)
+            production = config_data.get("production", {})
+            customer = production.get("customer", None)
+            site_name = production.get("siteName", None)
+            primary_manifest_file_name = production.get(
+                "manifestCSVFilename", None
+            )
+
+            if not (
+                customer == site.company.manifest_config_name
+                and site_name == site.manifest_config_name
+                and primary_manifest_file_name in csv_file_names
+            ):
+                raise serializers.ValidationError(
+                    {
+                        "result": False,
+                        "msg": "Please provide a valid link.",
+                        "validation_error_field": "site_repo_url",
+                        "validation_error_msg": "Invalid company or site name.",
+                    },
+                    code="validation_error",
+                )
+            changed_file_names = self.get_changed_manifest_file_names(
+                site_manifest=self.get_site_manifest(site=site),
+                site_repo_url=site_repo_url,
+                csv_file_hashes=csv_file_hashes,
+            )
+            with self.handle_github_errors():
+                changed_csv_files = {
+                    name: csv_files[name] for name in changed_file_names
+                }
+            self.validate_manifest_files(csv_files=changed_csv_files)
+
+            progress_callback("writing", 60)
+            commit_pipeline = pipeline.ManifestCommitPipeline()
+            with locks.site_manifest_lock(
+                site_id=site.id, wait=True
+            ), commit_pipeline.transaction():
+                with commit_pipeline.stage("site_manifest"):
+                    site_manifest = self.get_site_manifest(site=site)
+                    is_new_site_manifest = site_manifest is None
+                    is_repo_changed = (
+                        not is_new_site_manifest
+                        and site_manifest.site_repo_url != site_repo_url
+                    )
+                    if is_new_site_manifest:
+                        site_manifest = self.create_site_manifest(
+                            user=user,
+                            site=site,
+                            site_repo_url=site_repo_url,
+                            owner=owner,
+                            repo=repo,
+                        )
+                    elif is_repo_changed:
+                        site_manifest = self.update_site_manifest(
+                            user=user,
+                            site_manifest=site_manifest,
+                            site_repo_url=site_repo_url,
+                            owner=owner,
+                            repo=repo,
+                        )
+
+                with commit_pipeline.stage("version_history"):
+                    if is_repo_changed:
+                        self.delete_site_manifest_version_history(
+                            site_manifest=site_manifest
+                        )
+                    if is_new_site_manifest or is_repo_changed:
+                        self.create_site_manifest_version_history_objects(
+                            csv_file_names=csv_file_names,
+                            user=user,
+                            site_manifest=site_manifest,
+                            primary_manifest_file_name=primary_manifest_file_name,
+                            csv_file_hashes=csv_file_hashes,
+                            latest_commit_hash=latest_commit_hash,
+                        )
+                    else:
+                        self.update_site_manifest_version_history(
+                            user=user,
+                            csv_file_names=csv_file_names,
+                            site_manifest=site_manifest,
+                            primary_manifest_file_name=primary_manifest_file_name,
+                            csv_file_hashes=csv_file_hashes,
+                            latest_commit_hash=latest_commit_hash,
+                        )
+
+                with commit_pipeline.stage("manifest_log"):
+                    if is_new_site_manifest:
+                        self.create_manifest_log_objects(
+                            csv_files=changed_csv_files,
+                            site=site,
+                        )
+                    else:
+                        self.update_site_manifest_log(
+                            csv_files=changed_csv_files,
+                            site=site,
+                            manifest_file_names=csv_file_names,
+                        )
+
+                with commit_pipeline.stage("config"):
+                    if is_repo_changed:
+                        self.delete_config(site_manifest=site_manifest)
+                    if is_new_site_manifest or is_repo_changed:
+                        self.create_config(
+                            site_manifest=site_manifest,
+                            config_name=config_name,
+                            config_latest_commit_hash=latest_commit_hash,
+                            config_blob_sha=config_blob_sha,
+                        )
+                    else:
+                        self.update_config(
+                            site_manifest=site_manifest,
+                            config_latest_commit_hash=latest_commit_hash,
+                            config_blob_sha=config_blob_sha,
+                        )
+                    self.update_site_manifest_tree_sha(
+                        site_manifest=site_manifest,
+                        tree_sha=snapshot["tree_sha"],
+                    )
+
+                if settings.MANIFEST_COLUMNAR_STORAGE:
+                    with commit_pipeline.stage("columnar", optional=True):
+                        self.store_columnar_manifest_files(
+                            site_manifest=site_manifest,
+                            csv_files=changed_csv_files,
+                        )
+
+        lookup.invalidate_site_lookup_table(site_id=site.id)
+        history_cache.invalidate_site_manifest_history(site_id=site.id)
+        progress_callback("done", 100)
+        return {
+            "timings": commit_pipeline.timings,
+            "errors": commit_pipeline.errors,
+            "downloaded_files": len(changed_csv_files),
+            "unchanged_files": len(csv_file_names) - len(changed_csv_files),
+        }
+
+    def validate_manifest_files(self, csv_files: dict):
+        """
+        To validate the rows of manifest csv files before any of them are written, raising a
+        validation error with the per-row error report if any row is invalid
+        Params:
+            csv_files: dictionary with csv file names as keys and raw content as values
+        Returns:
+            None
+        """
+        report = validator.validate_manifest_files(csv_files=csv_files)
+        if report["error_count"]:
+            raise serializers.ValidationError(
+                {
+                    "result": False,
+                    "msg": "Please check the file and try again.",
+                    "validation_error_field": "",
+                    **report,
+                },
+                code="validation_error",
+            )
+
+    def get_changed_manifest_file_names(
+        self,
+        site_manifest: models.SiteManifest,
+        site_repo_url: str,
+        csv_file_hashes: dict,
+    ) -> list:
+        """
+        To get the csv files of a repository whose content differs from the stored version
+        Params:
+            site_manifest: site manifest entry of the site or None if it has none yet
+            site_repo_url: Repository URL being validated
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+        Returns:
+            changed_file_names: names of the new or changed csv files, all of them if the site
+                                has no manifest yet or it is linked to another repository
+        """
+        if (
+            site_manifest is None
+            or site_manifest.site_repo_url != site_repo_url
+        ):
+            return list(csv_file_hashes.keys())
+        stored_blob_shas = dict(
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest=site_manifest
+            ).values_list("manifest_file_name", "blob_sha")
         )
+        return [
+            name
+            for name, blob_sha in csv_file_hashes.items()
+            if stored_blob_shas.get(name) != blob_sha
+        ]
 
     def check_if_site_repo_entry_exists(
         self,
@@ -157,6 +404,7 @@ class ManifestController:
         site_manifest: models.SiteManifest,
         primary_manifest_file_name: str,
         csv_file_hashes: dict,
+        latest_commit_hash: str,
     ):
         """
         To create manifest version history entries for the files in the repository
@@ -165,7 +413,8 @@ class ManifestController:
             user: admin user who initiated the request
             site_manifest: Site manifest entry associated with the repository
             primary_manifest_file_name: Name of the primary manifest file under use
-            csv_file_hashes: dictionary of latest commit hashes of each csv file with csv file name as key
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+            latest_commit_hash: head commit hash of the repository
 
         Returns:
             None
@@ -176,12 +425,13 @@ class ManifestController:
                     added_by=user,
                     site_manifest=site_manifest,
                     validated_date=datetime.datetime.utcnow(),
-                    file_version=name.split("_")[2][:-4],
+                    file_version=loaders.get_file_version(name),
                     manifest_file_name=name,
                     is_primary=True
                     if name == primary_manifest_file_name
                     else False,
-                    latest_commit_hash=csv_file_hashes[name],
+                    latest_commit_hash=latest_commit_hash,
+                    blob_sha=csv_file_hashes[name],
                 ),
                 csv_file_names,
             )
@@ -198,34 +448,14 @@ class ManifestController:
         """
         To create manifest log entries from the fetched csv files
         Params:
-            csv_file_names: dictionary with csv file names as keys and csv files byte content as values
+            csv_files: dictionary with csv file names as keys and csv files byte content as values
             site: Site for the given repository URL
         Returns:
             None
         """
-        manifest_log_objects = []
-        for name, content_df in csv_files.items():
-            content_df = content_df.replace(np.nan, None)
-            df_dict_list = content_df.to_dict(orient="records")
-            for df_dict in df_dict_list:
-                manifest_log_objects.append(
-                    models.ManifestLog(
-                        subtopic_bit_no=df_dict[
-                            constants.Manifest.SUBTOPIC_BIT_NUMBER
-                        ],
-                        subtopic_reported_on=df_dict[
-                            constants.Manifest.SUBTOPIC_REPORTED_ON
-                        ],
-                        site=site,
-                        file_version=name.split("_")[2][:-4],
-                        manifest_file_name=name,
-                        data=df_dict,
-                    )
-                )
-
-        models.ManifestLog.objects.bulk_create(
-            manifest_log_objects, batch_size=1000
-        )
+        manifest_log_loader = loaders.ManifestLogLoader(site=site)
+        for name, content in csv_files.items():
+            manifest_log_loader.load(manifest_file_name=name, content=content)
 
     def get_site_manifest(
         self, site: users_models.Site
@@ -239,6 +469,36 @@ class ManifestController:
         """
         return models.SiteManifest.objects.filter(site=site).first()
 
+    def get_site_manifest_by_repo(
+        self, owner: str, repo: str
+    ) -> models.SiteManifest:
+        """
+        To retrieve the site manifest entry linked to a repository
+        Params:
+            owner: owner or organization of the repository
+            repo: name of the repository
+        Returns:
+            site_manifest: site manifest entry or None if the repository is not linked to a site
+        """
+        return (
+            models.SiteManifest.objects.select_related("site")
+            .filter(owner__iexact=owner, repo__iexact=repo)
+            .first()
+        )
+
+    def is_manifest_path(self, path: str) -> bool:
+        """
+        To check if a repository path is one of the files synchronised for a site manifest
+        Params:
+            path: path of the file relative to the repository root
+        Returns:
+            bool: True if the path is the config file or a csv file in the repository root
+        """
+        return "/" not in path and (
+            path == constants.Manifest.CONFIG_FILE_NAME
+            or path.endswith(".csv")
+        )
+
     def update_site_manifest_version_history(
         self,
         user: users_models.User,
@@ -246,6 +506,7 @@ class ManifestController:
         site_manifest: models.SiteManifest,
         primary_manifest_file_name: str,
         csv_file_hashes: dict,
+        latest_commit_hash: str,
     ):
         """
         To update the site manifest version history entries for a given site manifest and csv files fetched from repo
@@ -254,89 +515,166 @@ class ManifestController:
             csv_file_names: list of names of csv files fetched from repository
             site_manifest: models.SiteManifest object for the given site
             primary_manifest_file_name: Name of the primary manifest file under use
-            csv_file_hashes: dictionary of latest commit hashes of each csv file with csv file name as key
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+            latest_commit_hash: head commit hash of the repository
 
         Returns:
             None
         """
+        self.reconcile_site_manifest_version_history(
+            site_manifest=site_manifest,
+            csv_file_hashes=csv_file_hashes,
+            primary_manifest_file_name=primary_manifest_file_name,
+            latest_commit_hash=latest_commit_hash,
+            user=user,
+        )
 
-        site_manifest_version_history_objects = (
+    def reconcile_site_manifest_version_history(
+        self,
+        site_manifest: models.SiteManifest,
+        csv_file_hashes: dict,
+        primary_manifest_file_name: str,
+        latest_commit_hash: str,
+        user: users_models.User = None,
+    ) -> dict:
+        """
+        To bring the version history entries of a site manifest in line with the csv files of its
+        repository. The stored and repository file sets are compared in a single pass and the
+        differences are written with at most one delete, one bulk update and one bulk insert.
+        Params:
+            site_manifest: models.SiteManifest object for the given site
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+            primary_manifest_file_name: Name of the primary manifest file under use
+            latest_commit_hash: head commit hash of the repository
+            user: user recorded as adding new entries, defaults to the admin user of the site manifest
+        Returns:
+            changes: dictionary with the names of the created, updated and deleted entries
+        """
+        create_names = set(csv_file_hashes.keys())
+        update_objects = []
+        delete_ids = []
+        delete_names = []
+        site_manifest_version_histories = (
             models.SiteManifestVersionHistory.objects.filter(
-                site_manifest=site_manifest,
+                site_manifest=site_manifest
             )
         )
-        existing_site_manifest_version_history_names = []
-        existing_site_manifest_version_history_objects = []
-        delete_site_manifest_version_history_objects = (
-            site_manifest_version_history_objects
-        )
-
-        for (
-            site_manifest_version_history
-        ) in site_manifest_version_history_objects:
+        for site_manifest_version_history in site_manifest_version_histories:
+            name = site_manifest_version_history.manifest_file_name
+            if name not in create_names:
+                delete_ids.append(site_manifest_version_history.id)
+                delete_names.append(name)
+                continue
+            create_names.discard(name)
+            is_primary = name == primary_manifest_file_name
+            blob_sha = csv_file_hashes[name]
             if (
-                site_manifest_version_history.manifest_file_name
-                in csv_file_names
+                site_manifest_version_history.is_primary == is_primary
+                and site_manifest_version_history.blob_sha == blob_sha
             ):
-                delete_site_manifest_version_history_objects = (
-                    delete_site_manifest_version_history_objects.exclude(
-                        id=site_manifest_version_history.id
-                    )
-                )
-                existing_site_manifest_version_history_names.append(
-                    site_manifest_version_history.manifest_file_name
-                )
-                site_manifest_version_history.is_primary = (
-                    True
-                    if site_manifest_version_history.manifest_file_name
-                    == primary_manifest_file_name
-                    else False
-                )
+                continue
+            site_manifest_version_history.is_primary = is_primary
+            if site_manifest_version_history.blob_sha != blob_sha:
                 site_manifest_version_history.latest_commit_hash = (
-                    csv_file_hashes[
-                        site_manifest_version_history.manifest_file_name
-                    ]
-                )
-                existing_site_manifest_version_history_objects.append(
-                    site_manifest_version_history
+                    latest_commit_hash
                 )
-        difference_list = list(
-            set(csv_file_names)
-            - set(existing_site_manifest_version_history_names)
-        )
+                site_manifest_version_history.blob_sha = blob_sha
+            site_manifest_version_history.updated_on = timezone.now()
+            update_objects.append(site_manifest_version_history)
 
-        delete_site_manifest_version_history_objects.delete()
-        models.SiteManifestVersionHistory.objects.bulk_update(
-            existing_site_manifest_version_history_objects,
-            ["is_primary", "latest_commit_hash"],
-        )
-        self.create_site_manifest_version_history_objects(
-            csv_file_names=difference_list,
-            user=user,
-            site_manifest=site_manifest,
-            primary_manifest_file_name=primary_manifest_file_name,
-            csv_file_hashes=csv_file_hashes,
-        )
+        if delete_ids:
+            models.SiteManifestVersionHistory.objects.filter(
+                id__in=delete_ids
+            ).delete()
+        if update_objects:
+            models.SiteManifestVersionHistory.objects.bulk_update(
+                update_objects,
+                ["is_primary", "latest_commit_hash", "blob_sha", "updated_on"],
+            )
+        if create_names:
+            self.create_site_manifest_version_history_objects(
+                csv_file_names=sorted(create_names),
+                user=user or site_manifest.admin_user,
+                site_manifest=site_manifest,
+                primary_manifest_file_name=primary_manifest_file_name,
+                csv_file_hashes=csv_file_hashes,
+                latest_commit_hash=latest_commit_hash,
+            )
+        return {
+            "created": sorted(create_names),
+            "updated": [
+                site_manifest_version_history.manifest_file_name
+                for site_manifest_version_history in update_objects
+            ],
+            "deleted": delete_names,
+        }
 
     def update_site_manifest_log(
         self,
         csv_files: dict,
         site: users_models.Site,
-    ):
+        manifest_file_names: list = None,
+    ) -> dict:
         """
-        To update site manifest log with the data from csv files
+        To update site manifest log with the data from csv files, touching only the rows that changed
         Params:
             csv_files: dictionary with csv file names as key and content as value
             site: site for the given repository URL
+            manifest_file_names: names of all the csv files of the repository whose rows are kept,
+                                 defaults to the names of the given csv files
+        Returns:
+            counts: dictionary with the number of inserted, updated and deleted rows
+        """
+        if manifest_file_names is None:
+            manifest_file_names = list(csv_files.keys())
+        manifest_log_loader = loaders.ManifestLogLoader(site=site)
+        counts = {
+            "inserted": 0,
+            "updated": 0,
+            "deleted": manifest_log_loader.delete_other_files(
+                manifest_file_names=manifest_file_names
+            ),
+        }
+        for name, content in csv_files.items():
+            file_counts = manifest_log_loader.sync(
+                manifest_file_name=name, content=content
+            )
+            for key, value in file_counts.items():
+                counts[key] += value
+        return counts
+
+    def store_columnar_manifest_files(
+        self,
+        site_manifest: models.SiteManifest,
+        csv_files: dict,
+    ):
+        """
+        To store the columnar representation of the primary manifest file of a site manifest
+        when it is among the given csv files, dropping the columnar files of other versions.
+        The manifest log stays the storage of record, the columnar file is only a cache the
+        lookup table is compiled from, so one file per site is kept.
+        Params:
+            site_manifest: Site manifest object for the given site
+            csv_files: dictionary with csv file names as key and content as value
         Returns:
             None
         """
-        manifest_log_objects = models.ManifestLog.objects.filter(site=site)
-        manifest_log_objects.delete()
-        self.create_manifest_log_objects(
-            csv_files=csv_files,
-            site=site,
+        models.ManifestColumnarFile.objects.filter(
+            version_history__site_manifest=site_manifest,
+            version_history__is_primary=False,
+        ).delete()
+        primary_version_history = (
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest=site_manifest,
+                is_primary=True,
+                manifest_file_name__in=list(csv_files.keys()),
+            ).first()
         )
+        if primary_version_history is not None:
+            columnar.store_manifest_file(
+                version_history=primary_version_history,
+                content=csv_files[primary_version_history.manifest_file_name],
+            )
 
     def update_site_manifest(
         self,
@@ -402,11 +740,222 @@ class ManifestController:
             .order_by("-file_version")
         )
 
+    def get_manifest_history_page(
+        self,
+        site: users_models.Site,
+        site_manifest: models.SiteManifest,
+        offset,
+        limit,
+    ) -> dict:
+        """
+        To get a page of the manifest history of a site through the manifest history cache.
+        Pages are keyed by the number of version history rows and their latest updated_on,
+        so a page is only rebuilt after the version history of the site changed.
+        Params:
+            site: site of the manifest history, None if the user has no site preference
+            site_manifest: site manifest object for the given site
+            offset: offset of the page
+            limit: size of the page
+        Returns:
+            page: dictionary with the version_history_count, next_link and serialized data
+        """
+        site_manifest_version_history_objects = (
+            self.get_site_manifest_version_history(
+                site_manifest=site_manifest,
+            )
+        )
+        version_summary = site_manifest_version_history_objects.aggregate(
+            version_history_count=Count("id"),
+            latest_updated_on=Max("updated_on"),
+        )
+        cache_key = history_cache.get_cache_key(
+            site_id=site.id if site else None,
+            version_key=(
+                version_summary["version_history_count"],
+                version_summary["latest_updated_on"],
+            ),
+            offset=offset,
+            limit=limit,
+        )
+        page = history_cache.get_page(cache_key=cache_key)
+        if page is not None:
+            return page
+
+        pagination = custom_pagination.Pagination()
+        serialized_data, next_link = pagination.get_paginated_response(
+            site_manifest_version_history_objects,
+            offset,
+            limit,
+            app_serializers.ManifestHistorySerializer,
+        )
+        page = {
+            "version_history_count": version_summary["version_history_count"],
+            "next_link": next_link,
+            "data": list(serialized_data),
+        }
+        history_cache.set_page(cache_key=cache_key, page=page)
+        return page
+
+    def get_primary_file_version(self, site: users_models.Site) -> str:
+        """
+        To get the file version of the primary manifest file of a site
+        Params:
+            site: site for the given repository URL
+        Returns:
+            file_version: file version of the primary manifest or None
+        """
+        return (
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest__site=site, is_primary=True
+            )
+            .values_list("file_version", flat=True)
+            .first()
+        )
+
+    def get_manifest_version_diff(
+        self,
+        site: users_models.Site,
+        from_version: str,
+        to_version: str,
+    ) -> dict:
+        """
+        To compare two manifest versions of a site through the manifest diff cache
+        Params:
+            site: site of the manifest
+            from_version: file version compared from
+            to_version: file version compared to
+        Returns:
+            diff: dictionary with the added, removed and changed subtopics
+        """
+        version_keys = {
+            file_version: (file_version, blob_sha)
+            for file_version, blob_sha in (
+                models.SiteManifestVersionHistory.objects.filter(
+                    site_manifest__site=site,
+                    file_version__in=[from_version, to_version],
+                ).values_list("file_version", "blob_sha")
+            )
+        }
+        missing_versions = [
+            file_version
+            for file_version in (from_version, to_version)
+            if file_version not in version_keys
+        ]
+        if missing_versions:
+            raise exceptions.NotFound(
+                {
+                    "result": False,
+                    "msg": f"Manifest version not found: "
+                    f"{', '.join(missing_versions)}.",
+                },
+                code="not_found",
+            )
+        return diffs.get_cached_diff(
+            site_id=site.id,
+            from_version_key=version_keys[from_version],
+            to_version_key=version_keys[to_version],
+        )
+
+    def decode_manifest_bitfields(
+        self, site: users_models.Site, values: list
+    ) -> tuple:
+        """
+        To decode telemetry bitfields of a site into the subtopics of its primary manifest,
+        using the compiled lookup table of the site instead of a query per bit
+        Params:
+            site: site of the telemetry
+            values: list of non-negative integer bitfields
+        Returns:
+            file_version: file version of the primary manifest, None if the site has none
+            decoded_values: list of dictionaries with each value and the subtopics of its set bits
+        """
+        lookup_table = lookup.get_site_lookup_table(site_id=site.id)
+        file_version = (
+            lookup_table.version_key[0] if lookup_table.version_key else None
+        )
+        decoded_values = [
+            {"value": value, "subtopics": lookup_table.decode(value)}
+            for value in values
+        ]
+        return file_version, decoded_values
+
+    def get_manifest_logs(
+        self,
+        site: users_models.Site,
+        file_version: str,
+        bit_from: int = None,
+        bit_to: int = None,
+        reported_on: str = None,
+        data_contains: dict = None,
+        data_keys: list = None,
+    ) -> QuerySet:
+        """
+        To get the manifest log rows of a site as dictionaries, optionally projecting selected keys of the data
+        Rows without a subtopic bit number are not returned.
+        Params:
+            site: site of the manifest
+            file_version: file version of the manifest
+            bit_from: lowest subtopic bit number to include
+            bit_to: highest subtopic bit number to include
+            reported_on: subtopicReportedOn value to match
+            data_contains: dictionary the data of each row must contain
+            data_keys: keys of the data to return instead of the whole data, returned as data_<index>
+        Returns:
+            manifest_logs: queryset of manifest log dictionaries
+        """
+        manifest_logs = models.ManifestLog.objects.filter(
+            site=site,
+            file_version=file_version,
+            subtopic_bit_no__isnull=False,
+        )
+        if bit_from is not None:
+            manifest_logs = manifest_logs.filter(subtopic_bit_no__gte=bit_from)
+        if bit_to is not None:
+            manifest_logs = manifest_logs.filter(subtopic_bit_no__lte=bit_to)
+        if reported_on:
+            manifest_logs = manifest_logs.filter(
+                subtopic_reported_on=reported_on
+            )
+        if data_contains:
+            manifest_logs = manifest_logs.filter(data__contains=data_contains)
+
+        fields = [
+            "id",
+            "subtopic_bit_no",
+            "subtopic_reported_on",
+            "file_version",
+        ]
+        if not data_keys:
+            return manifest_logs.values(*fields, "data")
+        return manifest_logs.values(
+            *fields,
+            **{
+                f"data_{index}": KeyTransform(key, "data")
+                for index, key in enumerate(data_keys)
+            },
+        )
+
+    def get_github_response_cache_stats(self) -> dict:
+        """
+        To get the aggregated hit and miss counts of the GitHub response cache
+        Returns:
+            stats: dictionary with the number of cached responses, hits, misses and hit ratio
+        """
+        stats = models.GithubResponseCache.objects.aggregate(
+            cached_responses=Count("id"),
+            hits=Coalesce(Sum("hit_count"), 0),
+            misses=Coalesce(Sum("miss_count"), 0),
+        )
+        total = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / total, 4) if total else None
+        return stats
+
     def create_config(
         self,
         site_manifest: models.SiteManifest,
         config_name: str,
         config_latest_commit_hash: str,
+        config_blob_sha: str,
     ):
         """
         To create an entry for the config file for a given site repository
@@ -414,6 +963,7 @@ class ManifestController:
             site_manifest: The site manifest for the given site repository
             config_name: The name of the config file
             config_latest_commit_hash: The latest commit hash for the config file
+            config_blob_sha: The blob SHA of the config file
         Returns:
             None
         """
@@ -421,6 +971,7 @@ class ManifestController:
             site_manifest=site_manifest,
             config_name=config_name,
             latest_commit_hash=config_latest_commit_hash,
+            blob_sha=config_blob_sha,
         )
         site_config.save()
 
@@ -441,17 +992,623 @@ class ManifestController:
         self,
         site_manifest: models.SiteManifest,
         config_latest_commit_hash: str,
+        config_blob_sha: str,
     ):
         """
         To update the config file entry for the given site manifest of a site
         Params:
             site_manifest: The site manifest for the given site repository
             config_latest_commit_hash: The latest commit hash for the config file
+            config_blob_sha: The blob SHA of the config file
         Returns:
             None
         """
-        site_config = models.SiteConfig.objects.get(
+        models.SiteConfig.objects.filter(site_manifest=site_manifest).exclude(
+            blob_sha=config_blob_sha
+        ).update(
+            latest_commit_hash=config_latest_commit_hash,
+            blob_sha=config_blob_sha,
+            updated_on=timezone.now(),
+        )
+
+    def update_site_manifest_tree_sha(
+        self,
+        site_manifest: models.SiteManifest,
+        tree_sha: str,
+    ):
+        """
+        To record the root tree SHA the site manifest was last synchronised with
+        Params:
+            site_manifest: The site manifest for the given site repository
+            tree_sha: The root tree SHA of the repository
+        Returns:
+            None
+        """
+        site_manifest.tree_sha = tree_sha
+        site_manifest.save(update_fields=["tree_sha", "updated_on"])
+
+    def get_sync_result(self, status: str) -> dict:
+        """
+        To get an empty result of a site manifest synchronisation
+        Params:
+            status: status of the synchronisation
+        Returns:
+            result: dictionary with the status and zeroed file and row counts
+        """
+        return {
+            "status": status,
+            "files_fetched": 0,
+            "files_skipped": 0,
+            "inserted": 0,
+            "updated": 0,
+            "deleted": 0,
+        }
+
+    def sync_site_manifest(
+        self,
+        site_manifest: models.SiteManifest,
+        repo_client: github_client.GithubRepoClient,
+        paths: list = None,
+    ) -> dict:
+        """
+        To synchronise the manifest files of a single site with its repository. When paths are
+        given only those files are compared with the repository, the other files keep their
+        stored version and the tree SHA is not recorded, so that the next full sync still
+        compares every file.
+        Params:
+            site_manifest: site manifest entry of the site to synchronise
+            repo_client: GitHub client for the repository of the site
+            paths: repository paths to synchronise, None to synchronise every file
+        Returns:
+            result: dictionary with the status ("skipped" if the repository tree is unchanged,
+                    "synced" otherwise), fetched and skipped csv file counts and inserted,
+                    updated and deleted row counts
+        """
+        snapshot = repo_client.get_snapshot()
+
+        if site_manifest.tree_sha == snapshot["tree_sha"]:
+            return self.get_sync_result(
+                status=constants.ManifestSyncStatus.SKIPPED
+            )
+
+        blob_shas = repo_client.get_root_blob_shas(
+            tree_sha=snapshot["tree_sha"]
+        )
+        if constants.Manifest.CONFIG_FILE_NAME not in blob_shas:
+            raise exceptions.NotFound(
+                {
+                    "result": False,
+                    "msg": "Please provide a valid link.",
+                    "validation_error_msg": "Repository or content not found.",
+                },
+                code="not_found",
+            )
+        config_entry = models.SiteConfig.objects.get(
             site_manifest=site_manifest
         )
-        site_config.latest_commit_hash = config_latest_commit_hash
-        site_config.save()
+        config_blob_sha = blob_shas[constants.Manifest.CONFIG_FILE_NAME]
+
+        stored_blob_shas = dict(
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest=site_manifest
+            ).values_list("manifest_file_name", "blob_sha")
+        )
+        csv_file_hashes = {
+            name: blob_sha
+            for name, blob_sha in blob_shas.items()
+            if name.endswith(".csv") and (paths is None or name in paths)
+        }
+        if paths is not None:
+            csv_file_hashes.update(
+                {
+                    name: blob_sha
+                    for name, blob_sha in stored_blob_shas.items()
+                    if name not in paths
+                }
+            )
+
+        if config_entry.blob_sha != config_blob_sha and (
+            paths is None or constants.Manifest.CONFIG_FILE_NAME in paths
+        ):
+            config = repo_client.get_blob_content(blob_sha=config_blob_sha)
+            config_data = json.loads(config)
+            production = config_data.get("production", {})
+            primary_manifest_file_name = production.get(
+                "manifestCSVFilename", None
+            )
+            config_entry.latest_commit_hash = snapshot["commit_sha"]
+            config_entry.blob_sha = config_blob_sha
+        else:
+            primary_manifest_file_name = (
+                models.SiteManifestVersionHistory.objects.filter(
+                    site_manifest=site_manifest, is_primary=True
+                )
+                .values_list("manifest_file_name", flat=True)
+                .first()
+            )
+
+        changed_csv_files = github_client.LazyBlobContents(
+            repo_client=repo_client,
+            blob_shas={
+                name: blob_sha
+                for name, blob_sha in csv_file_hashes.items()
+                if stored_blob_shas.get(name) != blob_sha
+            },
+        )
+        with contextlib.closing(changed_csv_files):
+            return self.write_synced_site_manifest(
+                site_manifest=site_manifest,
+                snapshot=snapshot,
+                config_entry=config_entry,
+                csv_file_hashes=csv_file_hashes,
+                changed_csv_files=changed_csv_files,
+                primary_manifest_file_name=primary_manifest_file_name,
+                record_tree_sha=paths is None,
+            )
+
+    def write_synced_site_manifest(
+        self,
+        site_manifest: models.SiteManifest,
+        snapshot: dict,
+        config_entry: models.SiteConfig,
+        csv_file_hashes: dict,
+        changed_csv_files: github_client.LazyBlobContents,
+        primary_manifest_file_name: str,
+        record_tree_sha: bool = True,
+    ) -> dict:
+        """
+        To validate the changed csv files of a site manifest and write them along with the
+        version history, config and tree SHA of the synchronised snapshot
+        Params:
+            site_manifest: site manifest entry of the site to synchronise
+            snapshot: dictionary with the head commit_sha and root tree_sha of the repository
+            config_entry: config entry of the site manifest, updated for the snapshot
+            csv_file_hashes: dictionary of blob SHAs of each csv file with csv file name as key
+            changed_csv_files: lazy mapping of the csv files whose blob SHA changed
+            primary_manifest_file_name: name of the primary manifest csv file
+            record_tree_sha: False if only some files were synchronised, which leaves the
+                             tree SHA of the site manifest unchanged
+        Returns:
+            result: sync result with the "synced" status
+        """
+        self.validate_manifest_files(csv_files=changed_csv_files)
+
+        result = self.get_sync_result(
+            status=constants.ManifestSyncStatus.SYNCED
+        )
+        result["files_fetched"] = len(changed_csv_files)
+        result["files_skipped"] = len(csv_file_hashes) - len(changed_csv_files)
+        with transaction.atomic():
+            changes = self.reconcile_site_manifest_version_history(
+                site_manifest=site_manifest,
+                csv_file_hashes=csv_file_hashes,
+                primary_manifest_file_name=primary_manifest_file_name,
+                latest_commit_hash=snapshot["commit_sha"],
+            )
+            if changes["deleted"]:
+                result["deleted"], _ = models.ManifestLog.objects.filter(
+                    site=site_manifest.site,
+                    manifest_file_name__in=changes["deleted"],
+                ).delete()
+            manifest_log_loader = loaders.ManifestLogLoader(
+                site=site_manifest.site
+            )
+            for name, content in changed_csv_files.items():
+                file_counts = manifest_log_loader.sync(
+                    manifest_file_name=name, content=content
+                )
+                for key, value in file_counts.items():
+                    result[key] += value
+
+            if settings.MANIFEST_COLUMNAR_STORAGE:
+                self.store_columnar_manifest_files(
+                    site_manifest=site_manifest, csv_files=changed_csv_files
+                )
+            config_entry.save()
+            if record_tree_sha:
+                site_manifest.tree_sha = snapshot["tree_sha"]
+                site_manifest.save(update_fields=["tree_sha", "updated_on"])
+        lookup.invalidate_site_lookup_table(site_id=site_manifest.site_id)
+        history_cache.invalidate_site_manifest_history(
+            site_id=site_manifest.site_id
+        )
+        return result
+
+
+class ManifestJobController:
+    def create_manifest_job(
+        self,
+        user: users_models.User,
+        site: users_models.Site,
+        site_repo_url: str,
+        owner: str,
+        repo: str,
+    ) -> models.ManifestJob:
+        """
+        To queue a manifest validation job for the given site and manifest repository
+        Params:
+            user: Admin user who posted the repository URL
+            site: Site for the given repository URL
+            site_repo_url: Repository URL
+            owner: Github user or organization that owns the repository
+            repo: Repository name
+        Returns:
+            manifest_job: queued manifest job
+        """
+        return models.ManifestJob.objects.create(
+            job_type=constants.ManifestJobTypes.VALIDATE,
+            status=constants.ManifestJobStatus.QUEUED,
+            site=site,
+            requested_by=user,
+            payload={
+                "site_repo_url": site_repo_url,
+                "owner": owner,
+                "repo": repo,
+            },
+        )
+
+    def create_resync_job(
+        self,
+        site_manifest: models.SiteManifest,
+        paths: list,
+        commit_sha: str,
+    ) -> models.ManifestJob:
+        """
+        To queue a resync of a site manifest after a push to its repository. The paths are merged
+        into the queued resync job of the site if there is one, so a burst of pushes is
+        synchronised once.
+        Params:
+            site_manifest: site manifest entry of the pushed repository
+            paths: changed manifest paths listed in the push event
+            commit_sha: head commit SHA after the push
+        Returns:
+            manifest_job: queued manifest job
+        """
+        with transaction.atomic():
+            manifest_job = (
+                models.ManifestJob.objects.select_for_update()
+                .filter(
+                    job_type=constants.ManifestJobTypes.RESYNC,
+                    status=constants.ManifestJobStatus.QUEUED,
+                    site=site_manifest.site,
+                )
+                .first()
+            )
+            if manifest_job is not None:
+                manifest_job.payload = {
+                    "paths": sorted(
+                        set(manifest_job.payload.get("paths", [])) | set(paths)
+                    ),
+                    "commit_sha": commit_sha,
+                }
+                manifest_job.save(update_fields=["payload", "updated_on"])
+                return manifest_job
+            return models.ManifestJob.objects.create(
+                job_type=constants.ManifestJobTypes.RESYNC,
+                status=constants.ManifestJobStatus.QUEUED,
+                site=site_manifest.site,
+                payload={"paths": sorted(paths), "commit_sha": commit_sha},
+            )
+
+    def get_manifest_job_by_id(self, job_id: int) -> models.ManifestJob:
+        """
+        To retrieve a manifest job based on its id
+        Params:
+            job_id: id of the manifest job
+        Returns:
+            manifest_job: manifest job object
+        """
+        try:
+            return models.ManifestJob.objects.select_related("site").get(
+                id=job_id
+            )
+        except models.ManifestJob.DoesNotExist:
+            raise exceptions.NotFound(
+                {
+                    "result": False,
+                    "msg": "Job does not exist for the given job id.",
+                },
+                code="not_found",
+            )
+
+    def claim_next_manifest_job(self, worker_id: str) -> models.ManifestJob:
+        """
+        To lock and mark as running the oldest queued manifest job. Running jobs whose worker
+        has not reported progress within settings.MANIFEST_JOB_TIMEOUT seconds are reclaimed,
+        unless they were already claimed settings.MANIFEST_JOB_MAX_ATTEMPTS times, in which
+        case they are marked as failed so that a job which keeps killing its worker is not
+        retried forever.
+        Params:
+            worker_id: identifier of the worker claiming the job
+        Returns:
+            manifest_job: claimed manifest job or None if the queue is empty
+        """
+        now = timezone.now()
+        stale_jobs = Q(
+            status=constants.ManifestJobStatus.RUNNING,
+            updated_on__lt=now
+            - datetime.timedelta(seconds=settings.MANIFEST_JOB_TIMEOUT),
+        )
+        with transaction.atomic():
+            models.ManifestJob.objects.filter(
+                stale_jobs,
+                attempts__gte=settings.MANIFEST_JOB_MAX_ATTEMPTS,
+            ).update(
+                status=constants.ManifestJobStatus.FAILED,
+                error={
+                    "detail": "Job timed out after "
+                    f"{settings.MANIFEST_JOB_MAX_ATTEMPTS} attempts."
+                },
+                finished_on=now,
+                updated_on=now,
+            )
+            manifest_job = (
+                models.ManifestJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=constants.ManifestJobStatus.QUEUED)
+                    | (
+                        stale_jobs
+                        & Q(attempts__lt=settings.MANIFEST_JOB_MAX_ATTEMPTS)
+                    )
+                )
+                .order_by("created_on")
+                .first()
+            )
+            if manifest_job is None:
+                return None
+            manifest_job.status = constants.ManifestJobStatus.RUNNING
+            manifest_job.locked_by = worker_id
+            manifest_job.attempts += 1
+            manifest_job.started_on = timezone.now()
+            manifest_job.save()
+        return manifest_job
+
+    def update_manifest_job_progress(
+        self, manifest_job: models.ManifestJob, stage: str, progress: int
+    ):
+        """
+        To record the current stage and progress of a running manifest job
+        Params:
+            manifest_job: running manifest job
+            stage: name of the current stage
+            progress: percentage of completion
+        Returns:
+            None
+        """
+        manifest_job.stage = stage
+        manifest_job.progress = progress
+        manifest_job.save(update_fields=["stage", "progress", "updated_on"])
+
+    def finish_manifest_job(
+        self,
+        manifest_job: models.ManifestJob,
+        result: dict = None,
+        error: dict = None,
+    ):
+        """
+        To mark a manifest job as succeeded with the given result, or failed with the given error
+        Params:
+            manifest_job: running manifest job
+            result: result of the job if it succeeded
+            error: error details if the job failed
+        Returns:
+            None
+        """
+        manifest_job.status = (
+            constants.ManifestJobStatus.FAILED
+            if error
+            else constants.ManifestJobStatus.SUCCEEDED
+        )
+        manifest_job.result = result
+        manifest_job.error = error
+        manifest_job.finished_on = timezone.now()
+        manifest_job.save()
+
+    def run_resync_job(self, manifest_job: models.ManifestJob) -> dict:
+        """
+        To synchronise the files pushed to the repository of a resync job, or every file of the
+        site manifest if the job lists no paths
+        Params:
+            manifest_job: claimed resync job
+        Returns:
+            result: synchronisation result with the pushed paths and GitHub request count
+        """
+        manifest_controller = ManifestController()
+        site_manifest = manifest_controller.get_site_manifest(
+            site=manifest_job.site
+        )
+        if site_manifest is None:
+            raise exceptions.NotFound(
+                {
+                    "result": False,
+                    "msg": "Repository is not linked to any site.",
+                },
+                code="not_found",
+            )
+        self.update_manifest_job_progress(
+            manifest_job=manifest_job, stage="syncing", progress=10
+        )
+        repo_client = github_client.GithubRepoClient(
+            owner=site_manifest.owner, repo=site_manifest.repo
+        )
+        with locks.site_manifest_lock(
+            site_id=site_manifest.site_id, wait=True
+        ):
+            site_manifest.refresh_from_db(fields=["tree_sha"])
+            result = manifest_controller.sync_site_manifest(
+                site_manifest=site_manifest,
+                repo_client=repo_client,
+                paths=manifest_job.payload.get("paths"),
+            )
+        repo_client.flush_cache_hits()
+        self.update_manifest_job_progress(
+            manifest_job=manifest_job, stage="done", progress=100
+        )
+        return {
+            **result,
+            "paths": manifest_job.payload.get("paths", []),
+            "github_requests": repo_client.stats["requests"],
+        }
+
+    def run_manifest_job(self, manifest_job: models.ManifestJob):
+        """
+        To execute a claimed manifest job and record its outcome
+        Params:
+            manifest_job: claimed manifest job
+        Returns:
+            None
+        """
+        try:
+            if manifest_job.job_type == constants.ManifestJobTypes.VALIDATE:
+                result = ManifestController().validate_manifest(
+                    user=manifest_job.requested_by,
+                    site=manifest_job.site,
+                    site_repo_url=manifest_job.payload["site_repo_url"],
+                    owner=manifest_job.payload["owner"],
+                    repo=manifest_job.payload["repo"],
+                    progress_callback=lambda stage, progress: (
+                        self.update_manifest_job_progress(
+                            manifest_job=manifest_job,
+                            stage=stage,
+                            progress=progress,
+                        )
+                    ),
+                )
+            elif manifest_job.job_type == constants.ManifestJobTypes.RESYNC:
+                result = self.run_resync_job(manifest_job=manifest_job)
+            else:
+                raise ValueError(f"Unknown job type {manifest_job.job_type}")
+        except exceptions.APIException as exception:
+            self.finish_manifest_job(
+                manifest_job=manifest_job,
+                error={
+                    "status_code": exception.status_code,
+                    "detail": exception.detail,
+                },
+            )
+        except Exception as exception:
+            self.finish_manifest_job(
+                manifest_job=manifest_job,
+                error={"detail": repr(exception)},
+            )
+        else:
+            self.finish_manifest_job(manifest_job=manifest_job, result=result)
+
+
+class ManifestSyncRunController:
+    def start_manifest_sync_run(
+        self, workers: int, site_count: int
+    ) -> models.ManifestSyncRun:
+        """
+        To record the start of a manifest sync cron run
+        Params:
+            workers: number of sites synchronised concurrently
+            site_count: number of sites to synchronise
+        Returns:
+            sync_run: created manifest sync run
+        """
+        return models.ManifestSyncRun.objects.create(
+            status=constants.ManifestSyncStatus.RUNNING,
+            workers=workers,
+            site_count=site_count,
+            started_on=timezone.now(),
+        )
+
+    def finish_manifest_sync_run(
+        self,
+        sync_run: models.ManifestSyncRun,
+        summaries: list,
+        error: str = None,
+    ):
+        """
+        To record the end of a manifest sync cron run
+        Params:
+            sync_run: running manifest sync run
+            summaries: list of per-site summaries of the run
+            error: error that aborted the run, if any
+        Returns:
+            None
+        """
+        sync_run.failed_site_count = sum(
+            1
+            for summary in summaries
+            if summary["status"] == constants.ManifestSyncStatus.FAILED
+        )
+        sync_run.status = (
+            constants.ManifestSyncStatus.FAILED
+            if error or sync_run.failed_site_count
+            else constants.ManifestSyncStatus.SUCCEEDED
+        )
+        sync_run.error = error
+        sync_run.finished_on = timezone.now()
+        sync_run.duration = round(
+            (sync_run.finished_on - sync_run.started_on).total_seconds(), 3
+        )
+        sync_run.save()
+
+    def start_manifest_sync_run_site(
+        self, sync_run: models.ManifestSyncRun, site_id: int
+    ) -> models.ManifestSyncRunSite:
+        """
+        To record the start of the synchronisation of a site during a manifest sync run
+        Params:
+            sync_run: running manifest sync run
+            site_id: id of the site
+        Returns:
+            sync_run_site: created manifest sync run site entry
+        """
+        return models.ManifestSyncRunSite.objects.create(
+            sync_run=sync_run,
+            site_id=site_id,
+            status=constants.ManifestSyncStatus.RUNNING,
+            started_on=timezone.now(),
+        )
+
+    def finish_manifest_sync_run_site(
+        self, sync_run_site: models.ManifestSyncRunSite, summary: dict
+    ):
+        """
+        To record the outcome of the synchronisation of a site during a manifest sync run
+        Params:
+            sync_run_site: running manifest sync run site entry
+            summary: summary of the synchronisation of the site
+        Returns:
+            None
+        """
+        sync_run_site.status = summary["status"]
+        sync_run_site.files_fetched = summary["files_fetched"]
+        sync_run_site.files_skipped = summary["files_skipped"]
+        sync_run_site.rows_inserted = summary["inserted"]
+        sync_run_site.rows_updated = summary["updated"]
+        sync_run_site.rows_deleted = summary["deleted"]
+        sync_run_site.github_calls = summary["github_requests"]
+        sync_run_site.github_cache_hits = summary["github_cache_hits"]
+        sync_run_site.rate_limit_remaining = summary["rate_limit_remaining"]
+        sync_run_site.error = summary["error"]
+        sync_run_site.duration = summary["duration"]
+        sync_run_site.finished_on = timezone.now()
+        sync_run_site.save()
+
+    def get_manifest_sync_runs(
+        self, site_id: int = None, status: str = None
+    ) -> QuerySet:
+        """
+        To get the manifest sync runs, latest first, along with their per-site entries
+        Params:
+            site_id: optional id of a site to restrict the runs and their entries to
+            status: optional status of the runs
+        Returns:
+            sync_runs: queryset of manifest sync runs
+        """
+        sync_runs = models.ManifestSyncRun.objects.all()
+        sync_run_sites = models.ManifestSyncRunSite.objects.select_related(
+            "site"
+        ).order_by("-duration", "id")
+        if site_id:
+            sync_runs = sync_runs.filter(sites__site_id=site_id)
+            sync_run_sites = sync_run_sites.filter(site_id=site_id)
+        if status:
+            sync_runs = sync_runs.filter(status=status)
+        return sync_runs.prefetch_related(
+            Prefetch("sites", queryset=sync_run_sites)
+        ).order_by("-started_on", "-id")
@@ -1,155 +1,188 @@
 import datetime
-import io
-import json
+import random
+import time
+from concurrent import futures
 
-import github
-import numpy as np
-import pandas as pd
+from django import db
 
-from aquacycl_app import models
+from aquacycl_app import controllers, github_client, locks, models
 from aquacycl_project import constants, settings
-from users import models as user_models
-
-
-def update_site_manifest_log(
-    site: user_models.Site, content_file_name: str, content_file: str
-):
-    content_df = pd.read_csv(io.StringIO(content_file.decode("utf-8")))
-    content_df = content_df.replace(np.nan, None)
-    content_dict_list = content_df.to_dict(orient="records")
-    manifestlog = models.ManifestLog.objects.filter(
-        site=site, manifest_file_name=content_file_name
-    )
-    manifestlog.delete()
-    manifest_log_objects = []
-    for df_dict in content_dict_list:
-        manifest_log_objects.append(
-            models.ManifestLog(
-                subtopic_bit_no=df_dict[
-                    constants.Manifest.SUBTOPIC_BIT_NUMBER
-                ],
-                subtopic_reported_on=df_dict[
-                    constants.Manifest.SUBTOPIC_REPORTED_ON
-                ],
-                site=site,
-                file_version=content_file_name.split("_")[2][:-4],
-                manifest_file_name=content_file_name,
-                data=df_dict,
-            )
-        )
-    models.ManifestLog.objects.bulk_create(
-        manifest_log_objects, batch_size=1000
+from tj_packages import log
+
+logger = log.get_logger(__name__)
+
+
+def _sync_site_manifest_worker(
+    site_manifest: models.SiteManifest,
+    rate_limit_gate: github_client.RateLimitGate,
+    sync_run: models.ManifestSyncRun,
+) -> dict:
+    """
+    To run ManifestController.sync_site_manifest inside a worker thread and record its outcome in the run ledger.
+    Sites whose advisory lock is held by another run or node are skipped.
+    Params:
+        site_manifest: site manifest entry of the site to synchronise
+        rate_limit_gate: backoff state shared with the other sync workers
+        sync_run: manifest sync run the site is synchronised in
+    Returns:
+        summary: dictionary with the site, status, file and row counts, duration, GitHub request counts and error if any
+    """
+    started_at = time.monotonic()
+    error = None
+    manifest_controller = controllers.ManifestController()
+    sync_run_controller = controllers.ManifestSyncRunController()
+    repo_client = github_client.GithubRepoClient(
+        owner=site_manifest.owner,
+        repo=site_manifest.repo,
+        rate_limit_gate=rate_limit_gate,
     )
-
-
-def update_site_manifest_details():
-    auth = github.Auth.Token(settings.GITHUB_TOKEN)
-    github_object = github.Github(auth=auth)
-
-    site_manifest_objects = models.SiteManifest.objects.all()
-    for site_manifest in site_manifest_objects:
-
-        repo_object = github_object.get_repo(
-            f"{site_manifest.owner}/{site_manifest.repo}"
-        )
-
-        contents = repo_object.get_contents("")
-        csv_files = {}
-        csv_file_names = []
-        csv_file_hashes = {}
-        for content in contents:
-            if content.path.endswith(".csv"):
-                csv_file_names.append(content.name)
-                csv_files[content.name] = content.decoded_content
-                latest_commit = content.repository.get_commits(
-                    path=content.path
-                )[0]
-                csv_file_hashes[content.name] = latest_commit.sha
-
-        config = repo_object.get_contents("config.json")
-        config_data = json.loads(config.decoded_content)
-        production = config_data.get("production", {})
-        primary_manifest_file_name = production.get(
-            "manifestCSVFilename", None
-        )
-
-        site_manifest_version_history_objects = (
-            models.SiteManifestVersionHistory.objects.filter(
-                site_manifest=site_manifest
+    sync_run_site = None
+    try:
+        try:
+            sync_run_site = sync_run_controller.start_manifest_sync_run_site(
+                sync_run=sync_run, site_id=site_manifest.site_id
             )
-        )
-        delete_site_manifest_version_history_objects = (
-            site_manifest_version_history_objects
-        )
-        update_site_manifest_version_history_objects = []
-
-        for (
-            site_manifest_version_history
-        ) in site_manifest_version_history_objects:
-
-            if (
-                site_manifest_version_history.manifest_file_name
-                in csv_file_names
-            ):
-                delete_site_manifest_version_history_objects = (
-                    delete_site_manifest_version_history_objects.exclude(
-                        id=site_manifest_version_history.id
-                    )
-                )
-
-                if (
-                    site_manifest_version_history.latest_commit_hash
-                    != csv_file_hashes[
-                        site_manifest_version_history.manifest_file_name
-                    ]
-                ):
-                    update_site_manifest_log(
-                        site=site_manifest.site,
-                        content_file_name=site_manifest_version_history.manifest_file_name,
-                        content_file=csv_files[
-                            site_manifest_version_history.manifest_file_name
-                        ],
+            with locks.site_manifest_lock(
+                site_id=site_manifest.site_id
+            ) as acquired:
+                if acquired:
+                    site_manifest.refresh_from_db(fields=["tree_sha"])
+                    result = manifest_controller.sync_site_manifest(
+                        site_manifest=site_manifest, repo_client=repo_client
                     )
-                    site_manifest_version_history.latest_commit_hash = (
-                        csv_file_hashes[
-                            site_manifest_version_history.manifest_file_name
-                        ]
+                else:
+                    result = manifest_controller.get_sync_result(
+                        status=constants.ManifestSyncStatus.LOCKED
                     )
-                site_manifest_version_history.is_primary = (
-                    True
-                    if site_manifest_version_history.manifest_file_name
-                    == primary_manifest_file_name
-                    else False
+        except Exception as exception:
+            result = manifest_controller.get_sync_result(
+                status=constants.ManifestSyncStatus.FAILED
+            )
+            error = repr(exception)
+        summary = {
+            "site_id": site_manifest.site_id,
+            "site_name": site_manifest.site.name,
+            "duration": round(time.monotonic() - started_at, 3),
+            "error": error,
+            "github_requests": repo_client.stats["requests"],
+            "github_cache_hits": repo_client.stats["cache_hits"],
+            "rate_limit_remaining": repo_client.rate_limit_remaining,
+            **result,
+        }
+        if sync_run_site is not None:
+            try:
+                sync_run_controller.finish_manifest_sync_run_site(
+                    sync_run_site=sync_run_site, summary=summary
                 )
-                update_site_manifest_version_history_objects.append(
-                    site_manifest_version_history
+            except Exception as exception:
+                # a ledger error fails this site, not the whole run
+                summary.update(
+                    status=constants.ManifestSyncStatus.FAILED,
+                    error=repr(exception),
                 )
-            else:
-                models.ManifestLog.objects.filter(
-                    site=site_manifest_version_history.site,
-                    manifest_file_name=site_manifest_version_history.manifest_file_name,
-                ).delete()
+    finally:
+        try:
+            repo_client.flush_cache_hits()
+        except Exception:
+            # hit counts are statistics only, losing them must not fail the site
+            logger.exception(
+                "could not record github cache hits site=%s",
+                site_manifest.site_id,
+            )
+        db.connection.close()
+    return summary
+
+
+def update_site_manifest_details(max_workers: int = None) -> list:
+    """
+    To synchronise the manifests of every site, fanning out across sites with a
+    bounded pool of worker threads. Runs on several nodes, or overlapping runs,
+    split the sites between them through the per-site advisory locks; the sites
+    are shuffled so that concurrent runs do not contend for them in the same
+    order.
+    Params:
+        max_workers: number of sites synchronised concurrently, defaults to
+            settings.MANIFEST_SYNC_WORKERS
+    Returns:
+        summaries: list of per-site summaries
+    """
+    max_workers = max_workers or settings.MANIFEST_SYNC_WORKERS
+    rate_limit_gate = github_client.RateLimitGate()
+    sync_run_controller = controllers.ManifestSyncRunController()
+    started_at = time.monotonic()
+
+    site_manifest_objects = list(
+        models.SiteManifest.objects.select_related("site").all()
+    )
+    random.shuffle(site_manifest_objects)
+    sync_run = sync_run_controller.start_manifest_sync_run(
+        workers=max_workers, site_count=len(site_manifest_objects)
+    )
+    try:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            summaries = list(
+                executor.map(
+                    lambda site_manifest: _sync_site_manifest_worker(
+                        site_manifest=site_manifest,
+                        rate_limit_gate=rate_limit_gate,
+                        sync_run=sync_run,
+                    ),
+                    site_manifest_objects,
+                )
+            )
+    except Exception as exception:
+        sync_run_controller.finish_manifest_sync_run(
+            sync_run=sync_run, summaries=[], error=repr(exception)
+        )
+        raise
+    sync_run_controller.finish_manifest_sync_run(
+        sync_run=sync_run, summaries=summaries
+    )
 
-        models.SiteManifestVersionHistory.objects.bulk_update(
-            update_site_manifest_version_history_objects,
-            ["latest_commit_hash", "is_primary"],
+    for summary in summaries:
+        log_summary = (
+            logger.error
+            if summary["status"] == constants.ManifestSyncStatus.FAILED
+            else logger.info
         )
-        delete_site_manifest_version_history_objects.delete()
-        config_entry = models.SiteConfig.objects.get(
-            site_manifest=site_manifest
+        log_summary(
+            "manifest sync run=%s site=%s status=%s duration=%ss "
+            "files_fetched=%s files_skipped=%s inserted=%s updated=%s "
+            "deleted=%s github_requests=%s github_cache_hits=%s error=%s",
+            sync_run.id,
+            summary["site_id"],
+            summary["status"],
+            summary["duration"],
+            summary["files_fetched"],
+            summary["files_skipped"],
+            summary["inserted"],
+            summary["updated"],
+            summary["deleted"],
+            summary["github_requests"],
+            summary["github_cache_hits"],
+            summary["error"],
         )
-        config_latest_commit_hash = config.repository.get_commits(
-            path=config.path
-        )[0].sha
-        config_entry.latest_commit_hash = config_latest_commit_hash
-        config_entry.save()
+    logger.info(
+        "manifest sync run=%s finished status=%s sites=%s workers=%s "
+        "duration=%ss",
+        sync_run.id,
+        sync_run.status,
+        len(summaries),
+        max_workers,
+        round(time.monotonic() - started_at, 3),
+    )
+    logger.info(
+        "github response cache pruned deleted=%s",
+        github_client.prune_response_cache(),
+    )
 
-        cron_config = models.CronConfig.objects.filter(
-            name="cron last run datetime"
-        ).first()
+    cron_config = models.CronConfig.objects.filter(
+        name="cron last run datetime"
+    ).first()
 
-        if not cron_config:
-            cron_config = models.CronConfig(name="cron last run datetime")
-        else:
-            cron_config.updated_on = datetime.datetime.utcnow()
-        cron_config.save()
+    if not cron_config:
+        cron_config = models.CronConfig(name="cron last run datetime")
+    else:
+        cron_config.updated_on = datetime.datetime.utcnow()
+    cron_config.save()
+    return summaries
@@ -0,0 +1,193 @@
+import json
+
+from django.core import cache as django_cache
+from django.db import connection
+
+from aquacycl_app import models
+from aquacycl_project import settings
+
+CACHE_KEY_PREFIX = "manifest_diff"
+
+DIFF_VERSIONS_SQL = f"""
+    SELECT
+        COALESCE(f.subtopic_bit_no, t.subtopic_bit_no),
+        COALESCE(f.subtopic_reported_on, t.subtopic_reported_on),
+        f.data,
+        t.data
+    FROM (
+        SELECT subtopic_bit_no, subtopic_reported_on, data
+        FROM {models.ManifestLog._meta.db_table}
+        WHERE site_id = %s AND file_version = %s
+        AND subtopic_bit_no IS NOT NULL
+    ) f
+    FULL OUTER JOIN (
+        SELECT subtopic_bit_no, subtopic_reported_on, data
+        FROM {models.ManifestLog._meta.db_table}
+        WHERE site_id = %s AND file_version = %s
+        AND subtopic_bit_no IS NOT NULL
+    ) t
+    ON f.subtopic_bit_no = t.subtopic_bit_no
+    AND COALESCE(f.subtopic_reported_on, '')
+        = COALESCE(t.subtopic_reported_on, '')
+    WHERE f.data IS NULL
+    OR t.data IS NULL
+    OR f.data IS DISTINCT FROM t.data
+    ORDER BY 1, 2
+"""
+
+
+def _get_changed_fields(from_data: dict, to_data: dict) -> list:
+    return sorted(
+        key
+        for key in from_data.keys() | to_data.keys()
+        if from_data.get(key) != to_data.get(key)
+    )
+
+
+def _iter_differences_with_join(
+    site_id: int, from_version: str, to_version: str
+):
+    def load(data):
+        # Django registers a no-op jsonb loader, so raw queries return text
+        return json.loads(data) if isinstance(data, str) else data
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            DIFF_VERSIONS_SQL,
+            [site_id, from_version, site_id, to_version],
+        )
+        for bit_number, reported_on, from_data, to_data in cursor:
+            yield bit_number, reported_on, load(from_data), load(to_data)
+
+
+def _iter_differences_with_orm(
+    site_id: int, from_version: str, to_version: str
+):
+    def get_rows(file_version):
+        return {
+            (subtopic_bit_no, subtopic_reported_on): data
+            for (
+                subtopic_bit_no,
+                subtopic_reported_on,
+                data,
+            ) in models.ManifestLog.objects.filter(
+                site_id=site_id,
+                file_version=file_version,
+                subtopic_bit_no__isnull=False,
+            ).values_list(
+                "subtopic_bit_no", "subtopic_reported_on", "data"
+            )
+        }
+
+    from_rows = get_rows(from_version)
+    to_rows = get_rows(to_version)
+    for key in sorted(
+        from_rows.keys() | to_rows.keys(),
+        key=lambda key: (key[0], key[1] or ""),
+    ):
+        from_data = from_rows.get(key)
+        to_data = to_rows.get(key)
+        if from_data != to_data:
+            yield key[0], key[1], from_data, to_data
+
+
+def diff_manifest_versions(
+    site_id: int, from_version: str, to_version: str
+) -> dict:
+    """
+    To compare the manifest log rows of two file versions of a site, matched by subtopic bit
+    number and reported on. PostgreSQL computes the difference with a single full outer join
+    so that unchanged rows never leave the database, other databases compare the rows of
+    both versions in memory.
+    Params:
+        site_id: id of the site
+        from_version: file version compared from
+        to_version: file version compared to
+    Returns:
+        diff: dictionary with the added, removed and changed subtopics, changed subtopics
+              list the data keys whose value differs along with both rows
+    """
+    if connection.vendor == "postgresql":
+        differences = _iter_differences_with_join(
+            site_id=site_id, from_version=from_version, to_version=to_version
+        )
+    else:
+        differences = _iter_differences_with_orm(
+            site_id=site_id, from_version=from_version, to_version=to_version
+        )
+
+    diff = {"added": [], "removed": [], "changed": []}
+    for bit_number, reported_on, from_data, to_data in differences:
+        subtopic = {
+            "subtopic_bit_no": bit_number,
+            "subtopic_reported_on": reported_on,
+        }
+        if from_data is None:
+            diff["added"].append({**subtopic, "data": to_data})
+        elif to_data is None:
+            diff["removed"].append({**subtopic, "data": from_data})
+        else:
+            diff["changed"].append(
+                {
+                    **subtopic,
+                    "changed_fields": _get_changed_fields(
+                        from_data=from_data, to_data=to_data
+                    ),
+                    "from_data": from_data,
+                    "to_data": to_data,
+                }
+            )
+    return diff
+
+
+def get_cache_key(
+    site_id: int, from_version_key: tuple, to_version_key: tuple
+) -> str:
+    """
+    To build the cache key of the diff between two manifest versions
+    Params:
+        site_id: id of the site
+        from_version_key: tuple of file version and blob SHA of the version compared from
+        to_version_key: tuple of file version and blob SHA of the version compared to
+    Returns:
+        cache_key: key of the diff in the cache
+    """
+    from_version, from_blob_sha = from_version_key
+    to_version, to_blob_sha = to_version_key
+    return (
+        f"{CACHE_KEY_PREFIX}:{site_id}:{from_version}:{from_blob_sha}:"
+        f"{to_version}:{to_blob_sha}"
+    )
+
+
+def get_cached_diff(
+    site_id: int, from_version_key: tuple, to_version_key: tuple
+) -> dict:
+    """
+    To get the diff between two manifest versions from the cache, computing it on a miss.
+    Keys hold the blob SHA of both versions, so a version whose file changed in the
+    repository is compared again instead of being served from the cache.
+    Params:
+        site_id: id of the site
+        from_version_key: tuple of file version and blob SHA of the version compared from
+        to_version_key: tuple of file version and blob SHA of the version compared to
+    Returns:
+        diff: dictionary with the added, removed and changed subtopics
+    """
+    cache = django_cache.caches[settings.MANIFEST_HISTORY_CACHE]
+    cache_key = get_cache_key(
+        site_id=site_id,
+        from_version_key=from_version_key,
+        to_version_key=to_version_key,
+    )
+    diff = cache.get(cache_key)
+    if diff is None:
+        diff = diff_manifest_versions(
+            site_id=site_id,
+            from_version=from_version_key[0],
+            to_version=to_version_key[0],
+        )
+        cache.set(
+            cache_key, diff, timeout=settings.MANIFEST_DIFF_CACHE_TIMEOUT
+        )
+    return diff
@@ -0,0 +1,484 @@
+import base64
+import collections
+import collections.abc
+import datetime
+import hashlib
+import hmac
+import tempfile
+import threading
+import time
+
+import github
+import requests
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from aquacycl_app import models
+from aquacycl_project import settings
+
+# Media type asking the git blobs API for the raw blob bytes instead of a
+# base64 encoded JSON document
+RAW_MEDIA_TYPE = "application/vnd.github.raw"
+
+
+def get_webhook_signature(body: bytes, secret: str) -> str:
+    """
+    To compute the X-Hub-Signature-256 header GitHub sends with a webhook delivery
+    Params:
+        body: raw request body
+        secret: webhook secret configured on the repository
+    Returns:
+        signature: HMAC SHA-256 hex digest of the body prefixed with "sha256="
+    """
+    return "sha256=" + (
+        hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    )
+
+
+def verify_webhook_signature(body: bytes, signature: str, secret: str) -> bool:
+    """
+    To verify the X-Hub-Signature-256 header of a GitHub webhook delivery
+    Params:
+        body: raw request body
+        signature: value of the X-Hub-Signature-256 header
+        secret: webhook secret configured on the repository
+    Returns:
+        bool: True if the signature matches the body, False otherwise
+    """
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(
+        get_webhook_signature(body=body, secret=secret), signature
+    )
+
+
+def get_push_changed_paths(payload: dict) -> list:
+    """
+    To collect the paths added, modified or removed by the commits of a push event
+    Params:
+        payload: push event payload
+    Returns:
+        paths: sorted list of changed paths
+    """
+    paths = set()
+    for commit in payload.get("commits") or []:
+        for key in ("added", "modified", "removed"):
+            paths.update(commit.get(key) or [])
+    return sorted(paths)
+
+
+def prune_response_cache(ttl: int = None) -> int:
+    """
+    To delete the cached GitHub responses which were not used within the TTL
+    Params:
+        ttl: seconds an unused response is kept, defaults to
+             settings.GITHUB_RESPONSE_CACHE_TTL
+    Returns:
+        deleted_count: number of deleted cache entries
+    """
+    if ttl is None:
+        ttl = settings.GITHUB_RESPONSE_CACHE_TTL
+    expired_on = timezone.now() - datetime.timedelta(seconds=ttl)
+    deleted_count, _ = models.GithubResponseCache.objects.filter(
+        updated_on__lt=expired_on
+    ).delete()
+    return deleted_count
+
+
+class RateLimitGate:
+    """
+    Backoff state shared between concurrent sync workers. When any worker hits
+    the GitHub rate limit every worker pauses until the limit resets or the
+    configured maximum backoff elapses.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = None,
+        max_backoff: int = None,
+    ):
+        self.max_retries = (
+            settings.MANIFEST_SYNC_MAX_RETRIES
+            if max_retries is None
+            else max_retries
+        )
+        self.max_backoff = (
+            settings.MANIFEST_SYNC_MAX_BACKOFF
+            if max_backoff is None
+            else max_backoff
+        )
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        """
+        To block the calling worker while a shared backoff is in progress
+        Returns:
+            None
+        """
+        with self._lock:
+            delay = self._resume_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(
+        self,
+        exception: github.RateLimitExceededException,
+        reset_time: float,
+        attempt: int,
+    ):
+        """
+        To pause all workers after a rate limit error
+        Params:
+            exception: rate limit exception raised by the GitHub client
+            reset_time: epoch time at which the rate limit resets, if known
+            attempt: number of the failed attempt starting from zero
+        Returns:
+            None
+        """
+        now = time.time()
+        headers = exception.headers or {}
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            delay = int(retry_after)
+        elif reset_time and reset_time > now:
+            delay = reset_time - now
+        else:
+            delay = 2**attempt
+        delay = min(delay, self.max_backoff)
+        with self._lock:
+            self._resume_at = max(self._resume_at, now + delay)
+
+
+class GithubRepoClient:
+    """
+    Client for a site deployment repository which exposes the git tree and
+    blob lookups used to synchronise manifests by SHA instead of by per-file
+    commit history.
+
+    JSON responses are kept in the github_response_cache table. Responses for
+    SHA addressed objects (git trees) never change and are served from the
+    cache without a request, other responses are revalidated with
+    If-None-Match / If-Modified-Since so that unchanged resources come back as
+    304 responses, which do not count against the rate limit.
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        rate_limit_gate: RateLimitGate = None,
+        session: requests.Session = None,
+        use_cache: bool = True,
+    ):
+        self.owner = owner
+        self.repo = repo
+        self.rate_limit_gate = rate_limit_gate
+        self.use_cache = use_cache
+        self.session = session or requests.Session()
+        self.session.headers.update(
+            {
+                "Accept": "application/vnd.github+json",
+                "Authorization": f"Bearer {settings.GITHUB_TOKEN}",
+                "User-Agent": settings.GITHUB_USERNAME or "aquacycl",
+            }
+        )
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+        self.stats = {"requests": 0, "cache_hits": 0, "cache_misses": 0}
+        self._pending_cache_hits = collections.Counter()
+
+    def _raise_for_status(self, github_response: requests.Response):
+        status_code = github_response.status_code
+        try:
+            data = github_response.json()
+        except ValueError:
+            data = {"message": github_response.text}
+        headers = {
+            key.lower(): value
+            for key, value in github_response.headers.items()
+        }
+        message = str(data.get("message", "")).lower()
+        if status_code == 401:
+            raise github.BadCredentialsException(status_code, data, headers)
+        if status_code in (403, 429) and (
+            "rate limit" in message
+            or headers.get("x-ratelimit-remaining") == "0"
+        ):
+            raise github.RateLimitExceededException(status_code, data, headers)
+        if status_code == 403 and "user agent" in message:
+            raise github.BadUserAgentException(status_code, data, headers)
+        if status_code == 404:
+            raise github.UnknownObjectException(status_code, data, headers)
+        raise github.GithubException(status_code, data, headers)
+
+    def _send(self, url: str, headers: dict = None, **kwargs):
+        self.stats["requests"] += 1
+        github_response = self.session.get(
+            url,
+            headers=headers,
+            timeout=settings.GITHUB_REQUEST_TIMEOUT,
+            **kwargs,
+        )
+        if "X-RateLimit-Remaining" in github_response.headers:
+            self.rate_limit_remaining = int(
+                github_response.headers["X-RateLimit-Remaining"]
+            )
+            self.rate_limit_reset = int(
+                github_response.headers.get("X-RateLimit-Reset", 0)
+            )
+        if github_response.status_code >= 400:
+            # a streamed response holds its connection until it is closed
+            try:
+                self._raise_for_status(github_response)
+            finally:
+                github_response.close()
+        return github_response
+
+    def _call(self, func, *args, **kwargs):
+        """
+        To run a GitHub API call, retrying with the shared backoff on rate limit
+        errors when a rate limit gate is configured
+        """
+        if self.rate_limit_gate is None:
+            return func(*args, **kwargs)
+        attempt = 0
+        while True:
+            self.rate_limit_gate.wait()
+            try:
+                return func(*args, **kwargs)
+            except github.RateLimitExceededException as exception:
+                if attempt >= self.rate_limit_gate.max_retries:
+                    raise
+                self.rate_limit_gate.backoff(
+                    exception=exception,
+                    reset_time=self.rate_limit_reset,
+                    attempt=attempt,
+                )
+                attempt += 1
+
+    def _record_cache_hit(self, cache_entry: models.GithubResponseCache):
+        # hits are only counted here and written by flush_cache_hits so that
+        # serving a response from the cache does not issue an UPDATE
+        self.stats["cache_hits"] += 1
+        self._pending_cache_hits[cache_entry.id] += 1
+
+    def flush_cache_hits(self):
+        """
+        To write the cache hits recorded since the last flush. Entries hit the
+        same number of times are updated together, and every written entry is
+        marked as used so that it is kept by prune_response_cache
+        """
+        if not self._pending_cache_hits:
+            return
+        entry_ids_by_hits = collections.defaultdict(list)
+        for entry_id, hits in self._pending_cache_hits.items():
+            entry_ids_by_hits[hits].append(entry_id)
+        used_on = timezone.now()
+        for hits, entry_ids in entry_ids_by_hits.items():
+            models.GithubResponseCache.objects.filter(id__in=entry_ids).update(
+                hit_count=F("hit_count") + hits, updated_on=used_on
+            )
+        self._pending_cache_hits.clear()
+
+    def _store_cache_entry(
+        self,
+        url: str,
+        github_response: requests.Response,
+        data,
+        cache_entry: models.GithubResponseCache,
+    ):
+        self.stats["cache_misses"] += 1
+        values = {
+            "etag": github_response.headers.get("ETag"),
+            "last_modified": github_response.headers.get("Last-Modified"),
+            "data": data,
+        }
+        if cache_entry is not None:
+            values["miss_count"] = F("miss_count") + 1
+            values["updated_on"] = timezone.now()
+            models.GithubResponseCache.objects.filter(
+                id=cache_entry.id
+            ).update(**values)
+            return
+        try:
+            models.GithubResponseCache.objects.create(
+                url=url, miss_count=1, **values
+            )
+        except IntegrityError:
+            pass
+
+    def _get_json(self, path: str, extract, immutable: bool = False):
+        """
+        To get a JSON resource of the repository through the response cache
+        Params:
+            path: path of the resource relative to the repository API URL
+            extract: callable reducing the response JSON to the data kept in the cache
+            immutable: True if the resource is addressed by SHA and can never change
+        Returns:
+            data: extracted data of the resource
+        """
+        url = (
+            f"{settings.GITHUB_API_URL}/repos/{self.owner}/{self.repo}/{path}"
+        )
+        cache_entry = None
+        if self.use_cache:
+            cache_entry = models.GithubResponseCache.objects.filter(
+                url=url
+            ).first()
+        if cache_entry is not None and immutable:
+            self._record_cache_hit(cache_entry)
+            return cache_entry.data
+
+        headers = {}
+        if cache_entry is not None and cache_entry.etag:
+            headers["If-None-Match"] = cache_entry.etag
+        if cache_entry is not None and cache_entry.last_modified:
+            headers["If-Modified-Since"] = cache_entry.last_modified
+        github_response = self._call(self._send, url, headers=headers)
+        if github_response.status_code == 304 and cache_entry is not None:
+            self._record_cache_hit(cache_entry)
+            return cache_entry.data
+
+        data = extract(github_response.json())
+        if self.use_cache:
+            self._store_cache_entry(url, github_response, data, cache_entry)
+        return data
+
+    def get_snapshot(self) -> dict:
+        """
+        To get the head commit of the default branch along with its root tree
+        Returns:
+            snapshot: dictionary with commit_sha and tree_sha of the head commit
+        """
+        return self._get_json(
+            "commits/HEAD",
+            extract=lambda data: {
+                "commit_sha": data["sha"],
+                "tree_sha": data["commit"]["tree"]["sha"],
+            },
+        )
+
+    def get_root_blob_shas(self, tree_sha: str) -> dict:
+        """
+        To list the blobs present in the root of the given tree
+        Params:
+            tree_sha: SHA of the root tree of the repository
+        Returns:
+            blob_shas: dictionary with file name as key and blob SHA as value
+        """
+        return self._get_json(
+            f"git/trees/{tree_sha}",
+            extract=lambda data: {
+                element["path"]: element["sha"]
+                for element in data["tree"]
+                if element["type"] == "blob"
+            },
+            immutable=True,
+        )
+
+    def _download_blob(self, url: str) -> tempfile.SpooledTemporaryFile:
+        github_response = self._send(
+            url, headers={"Accept": RAW_MEDIA_TYPE}, stream=True
+        )
+        blob_file = tempfile.SpooledTemporaryFile(
+            max_size=settings.MANIFEST_BLOB_MEMORY_LIMIT
+        )
+        try:
+            for chunk in github_response.iter_content(
+                chunk_size=settings.MANIFEST_DOWNLOAD_CHUNK_SIZE
+            ):
+                blob_file.write(chunk)
+        except BaseException:
+            blob_file.close()
+            raise
+        finally:
+            github_response.close()
+        blob_file.seek(0)
+        return blob_file
+
+    def open_blob(self, blob_sha: str) -> tempfile.SpooledTemporaryFile:
+        """
+        To download the raw content of a blob without holding all of it in memory. The
+        response is streamed into a file that stays in memory up to
+        settings.MANIFEST_BLOB_MEMORY_LIMIT bytes and is spooled to disk beyond that, so
+        blobs larger than the 1 MB limit of the contents API are supported.
+        Params:
+            blob_sha: SHA of the blob
+        Returns:
+            blob_file: binary file positioned at the start of the blob content
+        """
+        url = (
+            f"{settings.GITHUB_API_URL}/repos/{self.owner}/{self.repo}"
+            f"/git/blobs/{blob_sha}"
+        )
+        return self._call(self._download_blob, url)
+
+    def get_blob_content(self, blob_sha: str, cache: bool = False) -> bytes:
+        """
+        To download the content of a blob. Blob contents are only kept in the
+        response cache when asked for, which is meant for small files such as
+        config.json, since manifest blobs are only downloaded when their SHA
+        changed.
+        Params:
+            blob_sha: SHA of the blob
+            cache: True to keep the blob in the response cache
+        Returns:
+            content: decoded content of the blob
+        """
+        if not cache:
+            with self.open_blob(blob_sha=blob_sha) as blob_file:
+                return blob_file.read()
+        blob = self._get_json(
+            f"git/blobs/{blob_sha}",
+            extract=lambda data: {
+                "encoding": data["encoding"],
+                "content": data["content"],
+            },
+            immutable=True,
+        )
+        if blob["encoding"] == "base64":
+            return base64.b64decode(blob["content"])
+        return blob["content"].encode("utf-8")
+
+
+class LazyBlobContents(collections.abc.Mapping):
+    """
+    Read-only mapping of file names to blob files. A blob is streamed with
+    GithubRepoClient.open_blob the first time its file is accessed and kept for
+    later accesses, so files that are never read cost no request. Readers
+    rewind the files themselves, see loaders.open_manifest_content.
+    """
+
+    def __init__(self, repo_client: GithubRepoClient, blob_shas: dict):
+        self.repo_client = repo_client
+        self.blob_shas = blob_shas
+        self._contents = {}
+
+    def __getitem__(self, name: str) -> tempfile.SpooledTemporaryFile:
+        if name not in self._contents:
+            self._contents[name] = self.repo_client.open_blob(
+                blob_sha=self.blob_shas[name]
+            )
+        return self._contents[name]
+
+    def __iter__(self):
+        return iter(self.blob_shas)
+
+    def __len__(self):
+        return len(self.blob_shas)
+
+    @property
+    def downloaded_names(self) -> list:
+        return list(self._contents.keys())
+
+    def close(self):
+        """
+        To release the downloaded blob files
+        Returns:
+            None
+        """
+        for blob_file in self._contents.values():
+            blob_file.close()
+        self._contents = {}
@@ -0,0 +1,89 @@
+from django.core import cache as django_cache
+
+from aquacycl_project import settings
+
+CACHE_KEY_PREFIX = "manifest_history"
+
+
+def _get_cache():
+    return django_cache.caches[settings.MANIFEST_HISTORY_CACHE]
+
+
+def _get_generation_key(site_id: int) -> str:
+    return f"{CACHE_KEY_PREFIX}:{site_id}:generation"
+
+
+def get_generation(site_id: int) -> int:
+    """
+    To get the cache generation of the manifest history of a site, which is bumped on every
+    write so that pages cached before the write are no longer looked up
+    Params:
+        site_id: id of the site
+    Returns:
+        generation: current generation number
+    """
+    return _get_cache().get(_get_generation_key(site_id=site_id), 0)
+
+
+def get_cache_key(site_id: int, version_key: tuple, offset, limit) -> str:
+    """
+    To build the cache key of a manifest history page
+    Params:
+        site_id: id of the site
+        version_key: tuple of the version history row count and latest updated_on of the site
+        offset: offset of the page
+        limit: size of the page
+    Returns:
+        cache_key: key of the page in the cache
+    """
+    version_count, latest_updated_on = version_key
+    latest_updated_on = (
+        latest_updated_on.isoformat() if latest_updated_on else None
+    )
+    return (
+        f"{CACHE_KEY_PREFIX}:{site_id}:{get_generation(site_id=site_id)}:"
+        f"{version_count}:{latest_updated_on}:{offset}:{limit}"
+    )
+
+
+def get_page(cache_key: str):
+    """
+    To get a cached manifest history page
+    Params:
+        cache_key: key of the page
+    Returns:
+        page: cached page or None if it is not cached
+    """
+    return _get_cache().get(cache_key)
+
+
+def set_page(cache_key: str, page: dict):
+    """
+    To cache a manifest history page for settings.MANIFEST_HISTORY_CACHE_TIMEOUT seconds
+    Params:
+        cache_key: key of the page
+        page: dictionary with the version history count, next link and serialized rows
+    Returns:
+        None
+    """
+    _get_cache().set(
+        cache_key, page, timeout=settings.MANIFEST_HISTORY_CACHE_TIMEOUT
+    )
+
+
+def invalidate_site_manifest_history(site_id: int):
+    """
+    To drop the cached manifest history pages of a site by moving it to a new generation
+    Params:
+        site_id: id of the site
+    Returns:
+        None
+    """
+    cache = _get_cache()
+    generation_key = _get_generation_key(site_id=site_id)
+    cache.add(generation_key, 0, timeout=None)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        # the key was evicted between add and incr
+        cache.set(generation_key, 1, timeout=None)
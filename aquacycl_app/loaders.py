@@ -0,0 +1,542 @@
+import contextlib
+import csv
+import io
+import itertools
+import json
+import re
+import typing
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from aquacycl_app import models
+from aquacycl_project import constants, settings
+from users import models as user_models
+
+# the default missing value markers of pandas.read_csv
+NULL_VALUES = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+TRUE_VALUES = {"True", "TRUE", "true"}
+FALSE_VALUES = {"False", "FALSE", "false"}
+INTEGER_PATTERN = re.compile(r"\s*[+-]?\d+\s*")
+FLOAT_PATTERN = re.compile(
+    r"\s*[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?|inf|infinity)\s*",
+    re.IGNORECASE,
+)
+INFINITE_PATTERN = re.compile(r"\s*[+-]?inf(?:inity)?\s*", re.IGNORECASE)
+
+COPY_COLUMNS = (
+    "subtopic_bit_no",
+    "subtopic_reported_on",
+    "site_id",
+    "file_version",
+    "manifest_file_name",
+    "data",
+    "created_on",
+    "updated_on",
+)
+
+# Raw content of a manifest csv file, either in memory or as a binary file
+ManifestContent = typing.Union[bytes, typing.BinaryIO]
+
+STAGING_TABLE = "manifest_log_staging"
+
+CREATE_STAGING_TABLE_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+        subtopic_bit_no integer,
+        subtopic_reported_on varchar(500),
+        site_id bigint,
+        file_version varchar(100),
+        manifest_file_name varchar(500),
+        data jsonb,
+        created_on timestamp with time zone,
+        updated_on timestamp with time zone
+    ) ON COMMIT DROP
+"""
+
+DELETE_MISSING_ROWS_SQL = f"""
+    DELETE FROM manifest_log m
+    WHERE m.site_id = %s
+    AND m.manifest_file_name = %s
+    AND (
+        m.subtopic_bit_no IS NULL
+        OR m.subtopic_reported_on IS NULL
+        OR NOT EXISTS (
+            SELECT 1 FROM {STAGING_TABLE} s
+            WHERE s.subtopic_bit_no = m.subtopic_bit_no
+            AND s.subtopic_reported_on = m.subtopic_reported_on
+            AND s.file_version = m.file_version
+        )
+    )
+"""
+
+UPSERT_ROWS_SQL = f"""
+    WITH upserted AS (
+        INSERT INTO manifest_log ({", ".join(COPY_COLUMNS)})
+        SELECT {", ".join(COPY_COLUMNS)} FROM {STAGING_TABLE}
+        ON CONFLICT (
+            subtopic_bit_no, subtopic_reported_on, site_id, file_version
+        )
+        DO UPDATE SET
+            data = EXCLUDED.data,
+            manifest_file_name = EXCLUDED.manifest_file_name,
+            updated_on = EXCLUDED.updated_on
+        WHERE manifest_log.data IS DISTINCT FROM EXCLUDED.data
+        OR manifest_log.manifest_file_name
+            IS DISTINCT FROM EXCLUDED.manifest_file_name
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted),
+        COUNT(*) FILTER (WHERE NOT inserted)
+    FROM upserted
+"""
+
+
+def get_file_version(manifest_file_name: str) -> str:
+    """
+    To extract the file version from a manifest file name
+    Params:
+        manifest_file_name: name of the manifest file (eg: manifest_site_v1.csv)
+    Returns:
+        file_version: version part of the file name
+    """
+    return manifest_file_name.split("_")[2][:-4]
+
+
+def get_value_type(value: str) -> typing.Optional[type]:
+    """
+    To get the type pandas would infer for a single raw csv cell
+    Params:
+        value: raw cell value
+    Returns:
+        value_type: None for missing values, otherwise bool, int, float or str
+    """
+    if value in NULL_VALUES:
+        return None
+    if value in TRUE_VALUES or value in FALSE_VALUES:
+        return bool
+    if INTEGER_PATTERN.fullmatch(value):
+        return int
+    if FLOAT_PATTERN.fullmatch(value):
+        return float
+    return str
+
+
+def merge_column_type(
+    column_type: typing.Optional[type], value_type: typing.Optional[type]
+) -> typing.Optional[type]:
+    """
+    To widen the type inferred for a column with the type of one more of its cells, the
+    way pandas settles on a single dtype per column
+    Params:
+        column_type: type inferred from the previous cells, None if they were all missing
+        value_type: type of the cell
+    Returns:
+        column_type: type of the column including the cell
+    """
+    if value_type is None or value_type is column_type:
+        return column_type
+    if column_type is None:
+        return value_type
+    if {column_type, value_type} == {int, float}:
+        return float
+    return str
+
+
+def parse_value(value: str, column_type: typing.Optional[type]):
+    """
+    To convert a raw csv cell into the python value pandas would give for its column
+    Params:
+        value: raw cell value
+        column_type: type inferred for the column by infer_column_types
+    Returns:
+        value: None, bool, int, float or the original string
+    """
+    if value in NULL_VALUES:
+        return None
+    if column_type is bool:
+        return value in TRUE_VALUES
+    if column_type is int:
+        return int(value)
+    if column_type is float:
+        # integers are cast like pandas does, so that "-0" gives 0.0
+        if INTEGER_PATTERN.fullmatch(value):
+            return float(int(value))
+        return float(value)
+    return value
+
+
+def parse_bit_number(value):
+    """
+    To convert a parsed subtopic bit number into an integer column value
+    Params:
+        value: parsed value of the subtopic bit number cell
+    Returns:
+        bit_number: integer bit number or None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+@contextlib.contextmanager
+def open_manifest_content(content: ManifestContent):
+    """
+    To read a manifest csv file from the start, whether it is held in memory or in a file
+    Params:
+        content: raw content of the csv file, as bytes or a binary file such as a
+                 downloaded blob file
+    Yields:
+        stream: binary stream positioned at the start of the content, a given file is
+                rewound but left open so that it can be read again
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(content)
+        return
+    content.seek(0)
+    yield content
+
+
+def _iter_raw_rows(content: ManifestContent):
+    with open_manifest_content(content) as stream:
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        try:
+            reader = csv.reader(text_stream)
+            header = next(reader, None)
+            if header is None:
+                return
+            yield header
+            for values in reader:
+                if not values:
+                    continue
+                yield [
+                    value
+                    for _, value in itertools.zip_longest(
+                        header, values[: len(header)], fillvalue=""
+                    )
+                ]
+        finally:
+            # detaching keeps the wrapper from closing the underlying file
+            text_stream.detach()
+
+
+def infer_column_types(content: ManifestContent) -> list:
+    """
+    To infer the type of every column of a manifest csv file like pandas.read_csv does,
+    reading the file once without keeping its rows
+    Params:
+        content: raw content of the csv file, as bytes or a binary file
+    Returns:
+        column_types: type of each column in header order, None for columns without values.
+                      Integer columns with missing values are floats, as in pandas.
+    """
+    raw_rows = _iter_raw_rows(content)
+    header = next(raw_rows, None)
+    if header is None:
+        return []
+    column_types = [None] * len(header)
+    has_null = [False] * len(header)
+    for values in raw_rows:
+        for index, value in enumerate(values):
+            value_type = get_value_type(value)
+            has_null[index] = has_null[index] or value_type is None
+            column_types[index] = merge_column_type(
+                column_types[index], value_type
+            )
+    return [
+        float if column_type is int and column_has_null else column_type
+        for column_type, column_has_null in zip(column_types, has_null)
+    ]
+
+
+def iter_manifest_rows(content: ManifestContent):
+    """
+    To lazily parse the rows of a manifest csv file. The file is read twice, first to
+    infer the type of each column and then to convert its cells, so that values come out
+    as pandas.read_csv would give them.
+    Params:
+        content: raw content of the csv file, as bytes or a binary file
+    Yields:
+        row: dictionary of parsed values with csv header as keys
+    """
+    column_types = infer_column_types(content)
+    raw_rows = _iter_raw_rows(content)
+    header = next(raw_rows, None)
+    if header is None:
+        return
+    for values in raw_rows:
+        yield {
+            key: parse_value(value, column_type)
+            for key, value, column_type in zip(header, values, column_types)
+        }
+
+
+def get_reported_on(row: dict) -> typing.Optional[str]:
+    """
+    To get the subtopic reported on of a parsed row as it is stored in the manifest log
+    Params:
+        row: dictionary of parsed values with csv header as keys
+    Returns:
+        reported_on: text of the parsed value, None if it is missing
+    """
+    value = row.get(constants.Manifest.SUBTOPIC_REPORTED_ON)
+    return None if value is None else str(value)
+
+
+def dump_row(row: dict, manifest_file_name: str) -> str:
+    """
+    To serialize a parsed row as the JSON data of its manifest log entry
+    Params:
+        row: dictionary of parsed values with csv header as keys
+        manifest_file_name: name of the manifest csv file of the row
+    Returns:
+        data: JSON text of the row, a validation error is raised for non-finite numbers
+              which are not valid JSON
+    """
+    try:
+        return json.dumps(row, allow_nan=False)
+    except ValueError:
+        raise serializers.ValidationError(
+            {
+                "result": False,
+                "msg": "Please check the file and try again.",
+                "validation_error_field": "",
+                "error_count": 1,
+                "errors": [
+                    {
+                        "file": manifest_file_name,
+                        "row": None,
+                        "column": None,
+                        "value": None,
+                        "error": "Values must be finite numbers.",
+                    }
+                ],
+            },
+            code="validation_error",
+        )
+
+
+class ManifestLogLoader:
+    """
+    Streams manifest csv rows into the manifest_log table in fixed size chunks,
+    using PostgreSQL COPY when the database supports it and bulk_create otherwise.
+    """
+
+    def __init__(self, site: user_models.Site, chunk_size: int = None):
+        self.site = site
+        self.chunk_size = chunk_size or settings.MANIFEST_LOAD_CHUNK_SIZE
+        self.use_copy = connection.vendor == "postgresql"
+
+    def _iter_chunks(self, content: ManifestContent):
+        chunk = []
+        for row in iter_manifest_rows(content):
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _copy_chunk(
+        self,
+        chunk: list,
+        manifest_file_name: str,
+        table: str = models.ManifestLog._meta.db_table,
+    ):
+        now = timezone.now()
+        file_version = get_file_version(manifest_file_name)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            writer.writerow(
+                (
+                    parse_bit_number(
+                        row.get(constants.Manifest.SUBTOPIC_BIT_NUMBER)
+                    ),
+                    get_reported_on(row),
+                    self.site.id,
+                    file_version,
+                    manifest_file_name,
+                    dump_row(row, manifest_file_name),
+                    now,
+                    now,
+                )
+            )
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} "
+                f"({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+    def _bulk_create_chunk(self, chunk: list, manifest_file_name: str):
+        file_version = get_file_version(manifest_file_name)
+        models.ManifestLog.objects.bulk_create(
+            [
+                models.ManifestLog(
+                    subtopic_bit_no=parse_bit_number(
+                        row.get(constants.Manifest.SUBTOPIC_BIT_NUMBER)
+                    ),
+                    subtopic_reported_on=get_reported_on(row),
+                    site=self.site,
+                    file_version=file_version,
+                    manifest_file_name=manifest_file_name,
+                    data=row,
+                )
+                for row in chunk
+            ]
+        )
+
+    def load(self, manifest_file_name: str, content: ManifestContent) -> int:
+        """
+        To insert the rows of a manifest csv file into the manifest log
+        Params:
+            manifest_file_name: name of the manifest csv file
+            content: raw content of the csv file, as bytes or a binary file
+        Returns:
+            row_count: number of rows inserted
+        """
+        row_count = 0
+        for chunk in self._iter_chunks(content):
+            if self.use_copy:
+                self._copy_chunk(chunk, manifest_file_name)
+            else:
+                self._bulk_create_chunk(chunk, manifest_file_name)
+            row_count += len(chunk)
+        return row_count
+
+    def _sync_with_copy(
+        self, manifest_file_name: str, content: ManifestContent
+    ) -> dict:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(CREATE_STAGING_TABLE_SQL)
+                cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+            for chunk in self._iter_chunks(content):
+                self._copy_chunk(
+                    chunk, manifest_file_name, table=STAGING_TABLE
+                )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    DELETE_MISSING_ROWS_SQL,
+                    [self.site.id, manifest_file_name],
+                )
+                deleted = cursor.rowcount
+                cursor.execute(UPSERT_ROWS_SQL)
+                inserted, updated = cursor.fetchone()
+        return {"inserted": inserted, "updated": updated, "deleted": deleted}
+
+    def _sync_with_orm(
+        self, manifest_file_name: str, content: ManifestContent
+    ) -> dict:
+        file_version = get_file_version(manifest_file_name)
+        existing_manifest_logs = {
+            (
+                manifest_log.subtopic_bit_no,
+                manifest_log.subtopic_reported_on,
+                manifest_log.file_version,
+            ): manifest_log
+            for manifest_log in models.ManifestLog.objects.filter(
+                site=self.site, manifest_file_name=manifest_file_name
+            )
+        }
+        seen_keys = set()
+        counts = {"inserted": 0, "updated": 0, "deleted": 0}
+        with transaction.atomic():
+            for chunk in self._iter_chunks(content):
+                create_manifest_logs = []
+                update_manifest_logs = []
+                for row in chunk:
+                    key = (
+                        parse_bit_number(
+                            row.get(constants.Manifest.SUBTOPIC_BIT_NUMBER)
+                        ),
+                        get_reported_on(row),
+                        file_version,
+                    )
+                    seen_keys.add(key)
+                    manifest_log = existing_manifest_logs.get(key)
+                    if manifest_log is None:
+                        create_manifest_logs.append(
+                            models.ManifestLog(
+                                subtopic_bit_no=key[0],
+                                subtopic_reported_on=key[1],
+                                site=self.site,
+                                file_version=file_version,
+                                manifest_file_name=manifest_file_name,
+                                data=row,
+                            )
+                        )
+                    elif manifest_log.data != row:
+                        manifest_log.data = row
+                        manifest_log.updated_on = timezone.now()
+                        update_manifest_logs.append(manifest_log)
+                models.ManifestLog.objects.bulk_create(create_manifest_logs)
+                models.ManifestLog.objects.bulk_update(
+                    update_manifest_logs, ["data", "updated_on"]
+                )
+                counts["inserted"] += len(create_manifest_logs)
+                counts["updated"] += len(update_manifest_logs)
+            delete_ids = [
+                manifest_log.id
+                for key, manifest_log in existing_manifest_logs.items()
+                if key not in seen_keys
+            ]
+            counts["deleted"], _ = models.ManifestLog.objects.filter(
+                id__in=delete_ids
+            ).delete()
+        return counts
+
+    def sync(self, manifest_file_name: str, content: ManifestContent) -> dict:
+        """
+        To bring the manifest log rows of a manifest csv file in line with its
+        content, inserting, updating and deleting only the rows that changed
+        Params:
+            manifest_file_name: name of the manifest csv file
+            content: raw content of the csv file, as bytes or a binary file
+        Returns:
+            counts: dictionary with the number of inserted, updated and deleted rows
+        """
+        if self.use_copy:
+            return self._sync_with_copy(manifest_file_name, content)
+        return self._sync_with_orm(manifest_file_name, content)
+
+    def delete_other_files(self, manifest_file_names: list) -> int:
+        """
+        To delete the manifest log rows of files no longer in the repository
+        Params:
+            manifest_file_names: names of the manifest csv files to keep
+        Returns:
+            deleted: number of deleted rows
+        """
+        deleted, _ = (
+            models.ManifestLog.objects.filter(site=self.site)
+            .exclude(manifest_file_name__in=manifest_file_names)
+            .delete()
+        )
+        return deleted
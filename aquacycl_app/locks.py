@@ -0,0 +1,48 @@
+import contextlib
+import zlib
+
+from django.db import connection
+
+# First key of the two-key advisory lock space reserved for site manifest
+# locks, the second key is the site id
+SITE_MANIFEST_LOCK_NAMESPACE = zlib.crc32(b"aquacycl.site_manifest") >> 1
+
+
+@contextlib.contextmanager
+def site_manifest_lock(site_id: int, wait: bool = False):
+    """
+    To hold the PostgreSQL advisory lock of a site while its manifest is written. The lock
+    belongs to the database session, so it is released when the block exits or, acting as a
+    lease, when the connection of a crashed worker is closed. Other databases get no locking.
+    Params:
+        site_id: id of the site
+        wait: True to block until the lock is free, False to give up if it is held elsewhere
+    Yields:
+        acquired: True if the lock is held, False if another session holds it
+    """
+    if connection.vendor != "postgresql":
+        yield True
+        return
+
+    with connection.cursor() as cursor:
+        if wait:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, %s)",
+                [SITE_MANIFEST_LOCK_NAMESPACE, site_id],
+            )
+            acquired = True
+        else:
+            cursor.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)",
+                [SITE_MANIFEST_LOCK_NAMESPACE, site_id],
+            )
+            acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)",
+                    [SITE_MANIFEST_LOCK_NAMESPACE, site_id],
+                )
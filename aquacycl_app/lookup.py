@@ -0,0 +1,188 @@
+import threading
+import time
+
+from aquacycl_app import columnar, loaders, models
+from aquacycl_project import constants, settings
+
+_lookup_tables = {}
+_lookup_tables_lock = threading.Lock()
+
+
+class ManifestLookupTable:
+    """
+    Compiled form of the primary manifest of a site. Subtopics are stored in a
+    list indexed by subtopic bit number (offset by the lowest bit number) so
+    that decoding a bit is a single index operation. Sparse bit ranges fall
+    back to a dictionary keyed by bit number.
+    """
+
+    __slots__ = ("version_key", "offset", "entries", "checked_at")
+
+    def __init__(self, version_key: tuple, rows: list):
+        self.version_key = version_key
+        self.checked_at = time.monotonic()
+        grouped_rows = {}
+        for subtopic_bit_no, data in rows:
+            grouped_rows.setdefault(subtopic_bit_no, []).append(data)
+        if not grouped_rows:
+            self.offset = 0
+            self.entries = []
+            return
+        lowest_bit_no = min(grouped_rows)
+        highest_bit_no = max(grouped_rows)
+        if highest_bit_no - lowest_bit_no < 4 * len(grouped_rows) + 64:
+            self.offset = lowest_bit_no
+            self.entries = [()] * (highest_bit_no - lowest_bit_no + 1)
+            for subtopic_bit_no, subtopics in grouped_rows.items():
+                self.entries[subtopic_bit_no - lowest_bit_no] = tuple(
+                    subtopics
+                )
+        else:
+            self.offset = None
+            self.entries = {
+                subtopic_bit_no: tuple(subtopics)
+                for subtopic_bit_no, subtopics in grouped_rows.items()
+            }
+
+    def get(self, subtopic_bit_no: int) -> tuple:
+        """
+        To get the subtopics mapped to a bit number
+        Params:
+            subtopic_bit_no: subtopic bit number
+        Returns:
+            subtopics: tuple of manifest rows mapped to the bit number
+        """
+        if self.offset is None:
+            return self.entries.get(subtopic_bit_no, ())
+        index = subtopic_bit_no - self.offset
+        if 0 <= index < len(self.entries):
+            return self.entries[index]
+        return ()
+
+    def decode(self, value: int) -> dict:
+        """
+        To decode a telemetry bitfield into the subtopics of its set bits
+        Params:
+            value: non-negative integer bitfield
+        Returns:
+            subtopics: dictionary with set bit numbers as keys and their subtopics as values
+        """
+        if value < 0:
+            # a negative int has infinitely many set bits in two's complement
+            raise ValueError("Bitfield must not be negative.")
+        subtopics = {}
+        while value:
+            lowest_set_bit = value & -value
+            subtopic_bit_no = lowest_set_bit.bit_length() - 1
+            subtopics[subtopic_bit_no] = self.get(subtopic_bit_no)
+            value ^= lowest_set_bit
+        return subtopics
+
+
+def get_version_key(site_id: int) -> tuple:
+    """
+    To get the version of the primary manifest of a site used to invalidate its lookup table
+    Params:
+        site_id: id of the site
+    Returns:
+        version_key: tuple of file version, latest commit hash and blob SHA of the primary manifest
+    """
+    return (
+        models.SiteManifestVersionHistory.objects.filter(
+            site_manifest__site_id=site_id, is_primary=True
+        )
+        .values_list("file_version", "latest_commit_hash", "blob_sha")
+        .first()
+    )
+
+
+def _get_columnar_reader(
+    site_id: int, version_key: tuple
+) -> columnar.ColumnarManifestReader:
+    version_history = models.SiteManifestVersionHistory.objects.filter(
+        site_manifest__site_id=site_id,
+        is_primary=True,
+        file_version=version_key[0],
+        blob_sha=version_key[2],
+    ).first()
+    if version_history is None:
+        return None
+    return columnar.get_manifest_reader(version_history=version_history)
+
+
+def _iter_columnar_rows(reader: columnar.ColumnarManifestReader):
+    for row in reader:
+        subtopic_bit_no = loaders.parse_bit_number(
+            row.get(constants.Manifest.SUBTOPIC_BIT_NUMBER)
+        )
+        if subtopic_bit_no is not None:
+            yield subtopic_bit_no, row
+
+
+def compile_lookup_table(
+    site_id: int, version_key: tuple
+) -> ManifestLookupTable:
+    """
+    To compile the lookup table of the primary manifest of a site, from its columnar
+    manifest file when one is stored for the current blob, otherwise from the manifest log
+    Params:
+        site_id: id of the site
+        version_key: version of the primary manifest
+    Returns:
+        lookup_table: compiled lookup table
+    """
+    rows = []
+    if version_key is not None:
+        reader = _get_columnar_reader(site_id=site_id, version_key=version_key)
+        if reader is not None:
+            rows = _iter_columnar_rows(reader)
+        else:
+            rows = models.ManifestLog.objects.filter(
+                site_id=site_id,
+                file_version=version_key[0],
+                subtopic_bit_no__isnull=False,
+            ).values_list("subtopic_bit_no", "data")
+    return ManifestLookupTable(version_key=version_key, rows=list(rows))
+
+
+def get_site_lookup_table(site_id: int) -> ManifestLookupTable:
+    """
+    To get the compiled lookup table of a site from the per-process cache. The manifest version
+    is rechecked at most once every settings.MANIFEST_LOOKUP_TTL seconds and the table is
+    recompiled when it changed.
+    Params:
+        site_id: id of the site
+    Returns:
+        lookup_table: compiled lookup table
+    """
+    lookup_table = _lookup_tables.get(site_id)
+    now = time.monotonic()
+    if (
+        lookup_table is not None
+        and now - lookup_table.checked_at < settings.MANIFEST_LOOKUP_TTL
+    ):
+        return lookup_table
+
+    version_key = get_version_key(site_id=site_id)
+    if lookup_table is not None and lookup_table.version_key == version_key:
+        lookup_table.checked_at = now
+        return lookup_table
+
+    lookup_table = compile_lookup_table(
+        site_id=site_id, version_key=version_key
+    )
+    with _lookup_tables_lock:
+        _lookup_tables[site_id] = lookup_table
+    return lookup_table
+
+
+def invalidate_site_lookup_table(site_id: int):
+    """
+    To drop the cached lookup table of a site in the current process
+    Params:
+        site_id: id of the site
+    Returns:
+        None
+    """
+    with _lookup_tables_lock:
+        _lookup_tables.pop(site_id, None)
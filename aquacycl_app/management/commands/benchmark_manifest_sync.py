@@ -0,0 +1,182 @@
+import json
+
+from django.contrib import auth
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from aquacycl_app import benchmarks, controllers, cronjobs, models
+from aquacycl_project import constants
+from users import models as user_models
+
+User = auth.get_user_model()
+
+SITE_NAME = "benchsite"
+COMPANY_NAME = "benchcompany"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark manifest fetching, loading and the manifest sync cron "
+        "against a local fake GitHub server in a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1x1000,5x1000,5x10000",
+            help="Comma separated repository sizes as <files>x<rows per file>",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test database between runs",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the results as JSON instead of a table",
+        )
+
+    def _parse_sizes(self, sizes: str) -> list:
+        parsed_sizes = []
+        for size in sizes.split(","):
+            try:
+                file_count, row_count = size.lower().split("x")
+                parsed_sizes.append((int(file_count), int(row_count)))
+            except ValueError:
+                raise CommandError(f"Invalid size {size!r}")
+        return parsed_sizes
+
+    def _create_fixtures(self) -> tuple:
+        user, _ = User.objects.get_or_create(
+            username="manifest-benchmark", email="manifest-benchmark@local"
+        )
+        company, _ = user_models.Company.objects.get_or_create(
+            name=COMPANY_NAME, manifest_config_name=COMPANY_NAME
+        )
+        site, _ = user_models.Site.objects.get_or_create(
+            company=company, name=SITE_NAME, manifest_config_name=SITE_NAME
+        )
+        return user, site
+
+    def _reset_site(self, site: user_models.Site):
+        models.SiteManifest.objects.filter(site=site).delete()
+        models.ManifestLog.objects.filter(site=site).delete()
+        models.GithubResponseCache.objects.all().delete()
+
+    def _run_size(
+        self,
+        user: User,
+        site: user_models.Site,
+        file_count: int,
+        row_count: int,
+    ) -> list:
+        repo = benchmarks.FakeGithubRepo(
+            owner=constants.Manifest.OWNER,
+            repo=f"{constants.Manifest.REPO_NAME_HEADER}_{SITE_NAME}",
+            customer=COMPANY_NAME,
+            site_name=SITE_NAME,
+            file_count=file_count,
+            row_count=row_count,
+        )
+        site_repo_url = (
+            f"https://{constants.Manifest.GITHUB_DOMAIN}/{repo.owner}/"
+            f"{repo.repo}"
+        )
+        manifest_controller = controllers.ManifestController()
+        fetched = {}
+
+        def fetch():
+            fetched["csv_files"] = dict(
+                manifest_controller.fetch_from_github_repo_link(
+                    owner=repo.owner, repo=repo.repo
+                )[5]
+            )
+
+        def load():
+            manifest_controller.create_manifest_log_objects(
+                csv_files=fetched["csv_files"], site=site
+            )
+
+        self._reset_site(site)
+
+        with benchmarks.FakeGithubServer(repo) as server:
+            with benchmarks.github_api_url(server.url):
+                results = [
+                    benchmarks.measure("fetch", server, fetch),
+                    benchmarks.measure("load", server, load),
+                ]
+                self._reset_site(site)
+                results.append(
+                    benchmarks.measure(
+                        "validate",
+                        server,
+                        manifest_controller.validate_manifest,
+                        user=user,
+                        site=site,
+                        site_repo_url=site_repo_url,
+                        owner=repo.owner,
+                        repo=repo.repo,
+                    )
+                )
+                results.append(
+                    benchmarks.measure(
+                        "cron_unchanged",
+                        server,
+                        cronjobs.update_site_manifest_details,
+                    )
+                )
+                repo.update_files(
+                    changed_file_count=max(1, file_count // 5), seed=1
+                )
+                results.append(
+                    benchmarks.measure(
+                        "cron_changed",
+                        server,
+                        cronjobs.update_site_manifest_details,
+                    )
+                )
+        self._reset_site(site)
+        for result in results:
+            result.update(files=file_count, rows=row_count)
+        return results
+
+    def handle(self, *args, **options):
+        sizes = self._parse_sizes(options["sizes"])
+        old_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"]
+        )
+        try:
+            user, site = self._create_fixtures()
+            results = []
+            for file_count, row_count in sizes:
+                results.extend(
+                    self._run_size(
+                        user=user,
+                        site=site,
+                        file_count=file_count,
+                        row_count=row_count,
+                    )
+                )
+        finally:
+            connection.creation.destroy_test_db(
+                old_database_name, verbosity=0, keepdb=options["keepdb"]
+            )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'files':>6} {'rows':>8} {'step':<15} {'wall_time':>10} "
+            f"{'queries':>8} {'copies':>7} {'peak_memory_mb':>15} "
+            f"{'github_calls':>13}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['files']:>6} {result['rows']:>8} "
+                f"{result['step']:<15} {result['wall_time']:>10} "
+                f"{result['queries']:>8} {result['copies']:>7} "
+                f"{result['peak_memory_mb']:>15} "
+                f"{result['github_calls']:>13}"
+            )
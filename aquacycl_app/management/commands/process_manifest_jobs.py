@@ -0,0 +1,48 @@
+import os
+import socket
+import time
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from aquacycl_app import controllers
+from aquacycl_project import settings
+
+
+class Command(BaseCommand):
+    help = "Process queued manifest jobs from the manifest_job table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the jobs currently queued and exit",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=settings.MANIFEST_JOB_POLL_INTERVAL,
+            help="Seconds to wait between polls when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        manifest_job_controller = controllers.ManifestJobController()
+        while True:
+            manifest_job = manifest_job_controller.claim_next_manifest_job(
+                worker_id=worker_id
+            )
+            if manifest_job is None:
+                if options["once"]:
+                    return
+                db.close_old_connections()
+                time.sleep(options["poll_interval"])
+                continue
+            self.stdout.write(
+                f"{worker_id} running manifest job {manifest_job.id}"
+            )
+            manifest_job_controller.run_manifest_job(manifest_job=manifest_job)
+            self.stdout.write(
+                f"{worker_id} finished manifest job {manifest_job.id} "
+                f"with status {manifest_job.status}"
+            )
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from aquacycl_app import github_client
+from aquacycl_project import constants, settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a recorded GitHub webhook payload against the github-webhook "
+        "endpoint, signed with settings.GITHUB_WEBHOOK_SECRET"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "payload_file",
+            help="Path of a JSON file holding the recorded webhook payload",
+        )
+        parser.add_argument(
+            "--event",
+            default=constants.GithubWebhookEvents.PUSH,
+            help="Value of the X-GitHub-Event header",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["payload_file"], "rb") as payload_file:
+                body = payload_file.read()
+        except OSError as exception:
+            raise CommandError(str(exception))
+
+        # the endpoint rejects every delivery when no secret is configured
+        if not settings.GITHUB_WEBHOOK_SECRET:
+            raise CommandError("GITHUB_WEBHOOK_SECRET is not configured")
+        signature = github_client.get_webhook_signature(
+            body=body, secret=settings.GITHUB_WEBHOOK_SECRET
+        )
+
+        webhook_response = Client().post(
+            reverse("github_webhook"),
+            data=body,
+            content_type="application/json",
+            HTTP_X_GITHUB_EVENT=options["event"],
+            HTTP_X_HUB_SIGNATURE_256=signature,
+        )
+        self.stdout.write(f"{webhook_response.status_code}")
+        self.stdout.write(
+            json.dumps(json.loads(webhook_response.content), indent=2)
+        )
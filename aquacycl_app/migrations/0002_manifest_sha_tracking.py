@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aquacycl_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitemanifest',
+            name='tree_sha',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='sitemanifestversionhistory',
+            name='blob_sha',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='siteconfig',
+            name='blob_sha',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-17 10:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('aquacycl_app', '0002_manifest_sha_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManifestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(max_length=32)),
+                ('status', models.CharField(db_index=True, max_length=32)),
+                ('stage', models.CharField(blank=True, max_length=32, null=True)),
+                ('progress', models.IntegerField(default=0)),
+                ('payload', models.JSONField(default=dict)),
+                ('error', models.JSONField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('locked_by', models.CharField(blank=True, max_length=255, null=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.site')),
+            ],
+            options={
+                'db_table': 'manifest_job',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='manifestjob',
+            index=models.Index(fields=['status', 'created_on'], name='manifest_job_status_created'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-17 11:20
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('aquacycl_app', '0003_manifestjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='manifestlog',
+            index=models.Index(fields=['site', 'file_version', 'subtopic_bit_no', 'id'], name='manifest_log_site_ver_bit'),
+        ),
+        migrations.AddIndex(
+            model_name='manifestlog',
+            index=models.Index(fields=['site', 'subtopic_reported_on'], name='manifest_log_site_reported'),
+        ),
+        migrations.AddIndex(
+            model_name='manifestlog',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['data'], name='manifest_log_data_gin'),
+        ),
+    ]
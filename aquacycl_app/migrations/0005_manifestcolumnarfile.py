@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-17 12:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aquacycl_app', '0004_manifest_log_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManifestColumnarFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format_version', models.IntegerField(default=1)),
+                ('columns', models.JSONField(default=list)),
+                ('row_count', models.IntegerField(default=0)),
+                ('blob_sha', models.CharField(blank=True, max_length=100, null=True)),
+                ('payload', models.BinaryField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('version_history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='columnar_file', to='aquacycl_app.sitemanifestversionhistory')),
+            ],
+            options={
+                'db_table': 'manifest_columnar_file',
+            },
+        ),
+    ]
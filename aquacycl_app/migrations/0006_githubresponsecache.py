@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aquacycl_app', '0005_manifestcolumnarfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GithubResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=2048, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=255, null=True)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('miss_count', models.IntegerField(default=0)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'github_response_cache',
+            },
+        ),
+    ]
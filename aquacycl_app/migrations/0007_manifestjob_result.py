@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aquacycl_app', '0006_githubresponsecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manifestjob',
+            name='result',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
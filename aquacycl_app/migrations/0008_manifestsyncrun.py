@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-17 13:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('aquacycl_app', '0007_manifestjob_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManifestSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(db_index=True, max_length=32)),
+                ('workers', models.IntegerField(default=0)),
+                ('site_count', models.IntegerField(default=0)),
+                ('failed_site_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_on', models.DateTimeField()),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'manifest_sync_run',
+            },
+        ),
+        migrations.CreateModel(
+            name='ManifestSyncRunSite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=32)),
+                ('files_fetched', models.IntegerField(default=0)),
+                ('files_skipped', models.IntegerField(default=0)),
+                ('rows_inserted', models.IntegerField(default=0)),
+                ('rows_updated', models.IntegerField(default=0)),
+                ('rows_deleted', models.IntegerField(default=0)),
+                ('github_calls', models.IntegerField(default=0)),
+                ('github_cache_hits', models.IntegerField(default=0)),
+                ('rate_limit_remaining', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_on', models.DateTimeField()),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.site')),
+                ('sync_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sites', to='aquacycl_app.manifestsyncrun')),
+            ],
+            options={
+                'db_table': 'manifest_sync_run_site',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='manifestsyncrunsite',
+            index=models.Index(fields=['site', 'started_on'], name='manifest_sync_site_started'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aquacycl_app', '0008_manifestsyncrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manifestcolumnarfile',
+            name='row_groups',
+            field=models.JSONField(default=list),
+        ),
+    ]
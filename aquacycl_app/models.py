@@ -1,4 +1,5 @@
 from django.contrib import auth
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 from users import models as user_models
@@ -12,6 +13,7 @@ class SiteManifest(models.Model):
     site_repo_url = models.CharField(max_length=2048, blank=True, null=True)
     owner = models.CharField(max_length=2048, blank=True, null=True)
     repo = models.CharField(max_length=2048, blank=True, null=True)
+    tree_sha = models.CharField(max_length=100, blank=True, null=True)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
 
@@ -38,6 +40,7 @@ class SiteManifestVersionHistory(models.Model):
     latest_commit_hash = models.CharField(
         max_length=100, blank=True, null=True
     )
+    blob_sha = models.CharField(max_length=100, blank=True, null=True)
     is_primary = models.BooleanField(default=False)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
@@ -80,6 +83,49 @@ class ManifestLog(models.Model):
             "site",
             "file_version",
         )
+        indexes = [
+            models.Index(
+                fields=["site", "file_version", "subtopic_bit_no", "id"],
+                name="manifest_log_site_ver_bit",
+            ),
+            models.Index(
+                fields=["site", "subtopic_reported_on"],
+                name="manifest_log_site_reported",
+            ),
+            GinIndex(fields=["data"], name="manifest_log_data_gin"),
+        ]
+
+
+class ManifestColumnarFile(models.Model):
+    """
+    Used to cache the primary manifest file of a site in columnar form: the column
+    schema is kept once per file and the rows as row groups of compressed column
+    segments, each tagged with the encoding that gives its values back unchanged.
+    Manifest log rows remain the storage of record.
+    """
+
+    version_history = models.OneToOneField(
+        SiteManifestVersionHistory,
+        on_delete=models.CASCADE,
+        related_name="columnar_file",
+    )
+    format_version = models.IntegerField(default=1)
+    columns = models.JSONField(default=list)
+    row_groups = models.JSONField(default=list)
+    row_count = models.IntegerField(default=0)
+    blob_sha = models.CharField(max_length=100, blank=True, null=True)
+    payload = models.BinaryField()
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.version_history.manifest_file_name}"
+
+    class Meta:
+        db_table = "manifest_columnar_file"
 
 
 class SiteConfig(models.Model):
@@ -91,6 +137,7 @@ class SiteConfig(models.Model):
     latest_commit_hash = models.CharField(
         max_length=100, blank=True, null=True
     )
+    blob_sha = models.CharField(max_length=100, blank=True, null=True)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
 
@@ -117,3 +164,134 @@ class CronConfig(models.Model):
 
     class Meta:
         db_table = "cron_config"
+
+
+class ManifestJob(models.Model):
+    """
+    Used as a database backed queue of manifest jobs processed by the manifest job worker
+    """
+
+    job_type = models.CharField(max_length=32)
+    status = models.CharField(max_length=32, db_index=True)
+    stage = models.CharField(max_length=32, blank=True, null=True)
+    progress = models.IntegerField(default=0)
+    site = models.ForeignKey(user_models.Site, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(
+        User, on_delete=models.CASCADE, blank=True, null=True
+    )
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(blank=True, null=True)
+    error = models.JSONField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    locked_by = models.CharField(max_length=255, blank=True, null=True)
+    started_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.job_type} {self.status} {self.site_id}"
+
+    class Meta:
+        db_table = "manifest_job"
+        indexes = [
+            models.Index(
+                fields=["status", "created_on"],
+                name="manifest_job_status_created",
+            ),
+        ]
+
+
+class GithubResponseCache(models.Model):
+    """
+    Used to store GitHub API responses with their validators so that repeated requests can be
+    made conditionally and answered from the cache
+    """
+
+    url = models.CharField(max_length=2048, unique=True)
+    etag = models.CharField(max_length=255, blank=True, null=True)
+    last_modified = models.CharField(max_length=255, blank=True, null=True)
+    data = models.JSONField(blank=True, null=True)
+    hit_count = models.IntegerField(default=0)
+    miss_count = models.IntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.url}"
+
+    class Meta:
+        db_table = "github_response_cache"
+
+
+class ManifestSyncRun(models.Model):
+    """
+    Used to record each run of the manifest sync cron job
+    """
+
+    status = models.CharField(max_length=32, db_index=True)
+    workers = models.IntegerField(default=0)
+    site_count = models.IntegerField(default=0)
+    failed_site_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    started_on = models.DateTimeField()
+    finished_on = models.DateTimeField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.status} {self.started_on}"
+
+    class Meta:
+        db_table = "manifest_sync_run"
+
+
+class ManifestSyncRunSite(models.Model):
+    """
+    Used to record the outcome of synchronising a single site during a manifest sync run
+    """
+
+    sync_run = models.ForeignKey(
+        ManifestSyncRun, on_delete=models.CASCADE, related_name="sites"
+    )
+    site = models.ForeignKey(user_models.Site, on_delete=models.CASCADE)
+    status = models.CharField(max_length=32)
+    files_fetched = models.IntegerField(default=0)
+    files_skipped = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_deleted = models.IntegerField(default=0)
+    github_calls = models.IntegerField(default=0)
+    github_cache_hits = models.IntegerField(default=0)
+    rate_limit_remaining = models.IntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    started_on = models.DateTimeField()
+    finished_on = models.DateTimeField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.site_id} {self.status} {self.started_on}"
+
+    class Meta:
+        db_table = "manifest_sync_run_site"
+        indexes = [
+            models.Index(
+                fields=["site", "started_on"],
+                name="manifest_sync_site_started",
+            ),
+        ]
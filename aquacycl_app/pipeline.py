@@ -0,0 +1,47 @@
+import contextlib
+import time
+
+from django.db import transaction
+
+
+class ManifestCommitPipeline:
+    """
+    Applies the writes of a manifest validation as named stages of a single
+    database transaction. Every stage runs in its own savepoint and is timed,
+    so a failing stage rolls back its own statements before the whole
+    transaction is rolled back, and optional stages can fail without
+    discarding the writes of the other stages.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        To open the transaction the stages of the pipeline are applied in
+        """
+        started = time.monotonic()
+        with transaction.atomic():
+            yield self
+        self.timings["total"] = round(time.monotonic() - started, 4)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, optional: bool = False):
+        """
+        To run a block of writes as a named and timed stage of the pipeline
+        Params:
+            name: name of the stage reported in the timings
+            optional: True if a failure of the stage should only roll back its own savepoint
+        """
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                yield
+        except Exception as exception:
+            if not optional:
+                raise
+            self.errors[name] = repr(exception)
+        finally:
+            self.timings[name] = round(time.monotonic() - started, 4)
@@ -45,3 +45,71 @@ class ManifestHistorySerializer(serializers.ModelSerializer):
             "site_name",
             "manifest_name",
         ]
+
+
+class ManifestJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.ReadOnlyField(source="id")
+    site_id = serializers.ReadOnlyField(source="site.id")
+    site_name = serializers.ReadOnlyField(source="site.name")
+
+    class Meta:
+        model = models.ManifestJob
+        fields = [
+            "job_id",
+            "job_type",
+            "status",
+            "stage",
+            "progress",
+            "site_id",
+            "site_name",
+            "result",
+            "error",
+            "attempts",
+            "started_on",
+            "finished_on",
+            "created_on",
+        ]
+
+
+class ManifestSyncRunSiteSerializer(serializers.ModelSerializer):
+    site_name = serializers.ReadOnlyField(source="site.name")
+
+    class Meta:
+        model = models.ManifestSyncRunSite
+        fields = [
+            "site_id",
+            "site_name",
+            "status",
+            "files_fetched",
+            "files_skipped",
+            "rows_inserted",
+            "rows_updated",
+            "rows_deleted",
+            "github_calls",
+            "github_cache_hits",
+            "rate_limit_remaining",
+            "error",
+            "started_on",
+            "finished_on",
+            "duration",
+        ]
+
+
+class ManifestSyncRunSerializer(serializers.ModelSerializer):
+    run_id = serializers.ReadOnlyField(source="id")
+    sites = ManifestSyncRunSiteSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = models.ManifestSyncRun
+        fields = [
+            "run_id",
+            "status",
+            "workers",
+            "site_count",
+            "failed_site_count",
+            "error",
+            "started_on",
+            "finished_on",
+            "duration",
+            "sites",
+        ]
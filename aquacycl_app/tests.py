@@ -1,3 +1,1786 @@
-# from django.test import TestCase
+import datetime
+import io
+import json
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import github
+import requests
+from django import db, test, urls
+from django.contrib import auth
+from django.core import cache as django_cache
+from django.core import management
+from django.db import connection
+from django.test import utils as test_utils
+from django.utils import timezone
+from rest_framework import exceptions, serializers
+from rest_framework import test as rest_test
+
+from aquacycl_app import (
+    benchmarks,
+    columnar,
+    controllers,
+    cronjobs,
+    diffs,
+    github_client,
+    history_cache,
+    loaders,
+    locks,
+    lookup,
+    models,
+    validator,
+)
+from aquacycl_project import constants, settings
+from users import models as user_models
+
+MANIFEST_FILE_NAME = "manifest_plant_v1.csv"
+
+# subtopicReportedOn only holds numbers, so the loader parses it as an integer
+# column and stores its text in subtopic_reported_on
+MANIFEST_CSV = (
+    b"subtopicBitNumber,subtopicReportedOn,subtopicName,threshold\n"
+    b"0,1001,pump,1.5\n"
+    b"1,1001,valve,2\n"
+    b"0,1002,flow,\n"
+)
+
+CHANGED_MANIFEST_CSV = (
+    b"subtopicBitNumber,subtopicReportedOn,subtopicName,threshold\n"
+    b"0,1001,pump,2.5\n"
+    b"0,1002,flow,\n"
+    b"2,1002,level,4\n"
+)
+
+
+def create_user(
+    username: str, user_type_id: int = constants.UserTypeNames.ADMIN
+) -> auth.models.User:
+    user = auth.get_user_model().objects.create_user(
+        username=username, email=f"{username}@example.com"
+    )
+    user_type, _ = user_models.UserType.objects.get_or_create(
+        id=user_type_id, defaults={"name": f"type{user_type_id}"}
+    )
+    user_models.UserProfileDetails.objects.create(
+        user=user, user_type=user_type
+    )
+    return user
+
+
+def create_site_manifest(
+    site: user_models.Site, user: auth.models.User, blob_shas: dict
+) -> models.SiteManifest:
+    # the first file of blob_shas is the primary manifest
+    site_manifest = models.SiteManifest.objects.create(
+        admin_user=user, site=site, owner="aquacycl", repo="plant"
+    )
+    for index, (manifest_file_name, blob_sha) in enumerate(blob_shas.items()):
+        models.SiteManifestVersionHistory.objects.create(
+            added_by=user,
+            site_manifest=site_manifest,
+            validated_date=timezone.now().date(),
+            file_version=loaders.get_file_version(manifest_file_name),
+            manifest_file_name=manifest_file_name,
+            latest_commit_hash="commit",
+            blob_sha=blob_sha,
+            is_primary=index == 0,
+        )
+    return site_manifest
+
+
+class ManifestRowParsingTestCase(test.SimpleTestCase):
+    def test_column_types_follow_pandas(self):
+        column_types = loaders.infer_column_types(
+            b"count,level,name,enabled,note\n1,1.5,pump,True,\n2,,valve,False,\n"
+        )
+
+        self.assertEqual(column_types, [int, float, str, bool, None])
+
+    def test_rows_are_parsed_from_a_file(self):
+        with tempfile.SpooledTemporaryFile(max_size=16) as manifest_file:
+            manifest_file.write(MANIFEST_CSV)
+
+            rows = list(loaders.iter_manifest_rows(manifest_file))
+
+            self.assertFalse(manifest_file.closed)
+            self.assertEqual(
+                list(loaders.iter_manifest_rows(manifest_file)), rows
+            )
+        self.assertEqual(rows, list(loaders.iter_manifest_rows(MANIFEST_CSV)))
+        self.assertEqual(
+            rows[1],
+            {
+                "subtopicBitNumber": 1,
+                "subtopicReportedOn": 1001,
+                "subtopicName": "valve",
+                "threshold": 2.0,
+            },
+        )
+
+
+class ManifestLogLoaderTestCase(test.TestCase):
+    use_copy = True
+
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+
+    def get_loader(self) -> loaders.ManifestLogLoader:
+        loader = loaders.ManifestLogLoader(site=self.site, chunk_size=2)
+        loader.use_copy = self.use_copy
+        return loader
+
+    def get_manifest_logs(self) -> dict:
+        return {
+            (
+                manifest_log.subtopic_bit_no,
+                manifest_log.subtopic_reported_on,
+            ): manifest_log.data
+            for manifest_log in models.ManifestLog.objects.filter(
+                site=self.site, manifest_file_name=MANIFEST_FILE_NAME
+            )
+        }
+
+    def test_first_sync_inserts_every_row(self):
+        counts = self.get_loader().sync(MANIFEST_FILE_NAME, MANIFEST_CSV)
+
+        self.assertEqual(counts, {"inserted": 3, "updated": 0, "deleted": 0})
+        manifest_logs = self.get_manifest_logs()
+        self.assertEqual(
+            sorted(manifest_logs), [(0, "1001"), (0, "1002"), (1, "1001")]
+        )
+        self.assertEqual(
+            manifest_logs[(0, "1001")],
+            {
+                "subtopicBitNumber": 0,
+                "subtopicReportedOn": 1001,
+                "subtopicName": "pump",
+                "threshold": 1.5,
+            },
+        )
+        self.assertIsNone(manifest_logs[(0, "1002")]["threshold"])
+
+    def test_resync_of_unchanged_content_writes_nothing(self):
+        self.get_loader().sync(MANIFEST_FILE_NAME, MANIFEST_CSV)
+        manifest_logs = self.get_manifest_logs()
+
+        counts = self.get_loader().sync(MANIFEST_FILE_NAME, MANIFEST_CSV)
+
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "deleted": 0})
+        self.assertEqual(self.get_manifest_logs(), manifest_logs)
+
+    def test_sync_of_changed_content_writes_only_the_changes(self):
+        self.get_loader().sync(MANIFEST_FILE_NAME, MANIFEST_CSV)
+
+        counts = self.get_loader().sync(
+            MANIFEST_FILE_NAME, CHANGED_MANIFEST_CSV
+        )
+
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "deleted": 1})
+        manifest_logs = self.get_manifest_logs()
+        self.assertEqual(
+            sorted(manifest_logs), [(0, "1001"), (0, "1002"), (2, "1002")]
+        )
+        self.assertEqual(manifest_logs[(0, "1001")]["threshold"], 2.5)
+
+    def test_load_inserts_every_row(self):
+        row_count = self.get_loader().load(MANIFEST_FILE_NAME, MANIFEST_CSV)
+
+        self.assertEqual(row_count, 3)
+        self.assertEqual(len(self.get_manifest_logs()), 3)
+
+
+class ManifestLogLoaderOrmTestCase(ManifestLogLoaderTestCase):
+    """
+    Runs the loader tests through the bulk_create fallback used by databases
+    without COPY
+    """
+
+    use_copy = False
+
+
+class ManifestJobQueueTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+
+    def setUp(self):
+        self.manifest_job_controller = controllers.ManifestJobController()
+
+    def create_manifest_job(self, **kwargs) -> models.ManifestJob:
+        return models.ManifestJob.objects.create(
+            job_type=constants.ManifestJobTypes.RESYNC,
+            status=kwargs.pop("status", constants.ManifestJobStatus.QUEUED),
+            site=self.site,
+            **kwargs,
+        )
+
+    def make_stale(self, manifest_job: models.ManifestJob):
+        # update() skips auto_now, so the job looks abandoned by its worker
+        models.ManifestJob.objects.filter(id=manifest_job.id).update(
+            updated_on=timezone.now()
+            - datetime.timedelta(seconds=settings.MANIFEST_JOB_TIMEOUT + 1)
+        )
+
+    def test_jobs_are_claimed_oldest_first(self):
+        first_job = self.create_manifest_job()
+        second_job = self.create_manifest_job()
+
+        claimed_jobs = [
+            self.manifest_job_controller.claim_next_manifest_job(
+                worker_id="worker"
+            )
+            for _ in range(3)
+        ]
+
+        self.assertEqual(claimed_jobs, [first_job, second_job, None])
+        first_job.refresh_from_db()
+        self.assertEqual(first_job.status, constants.ManifestJobStatus.RUNNING)
+        self.assertEqual(first_job.locked_by, "worker")
+        self.assertEqual(first_job.attempts, 1)
+
+    def test_running_job_is_only_reclaimed_once_stale(self):
+        manifest_job = self.create_manifest_job(
+            status=constants.ManifestJobStatus.RUNNING,
+            locked_by="lost-worker",
+            attempts=1,
+        )
+
+        self.assertIsNone(
+            self.manifest_job_controller.claim_next_manifest_job(
+                worker_id="worker"
+            )
+        )
+        self.make_stale(manifest_job)
+        claimed_job = self.manifest_job_controller.claim_next_manifest_job(
+            worker_id="worker"
+        )
+
+        self.assertEqual(claimed_job, manifest_job)
+        self.assertEqual(claimed_job.locked_by, "worker")
+        self.assertEqual(claimed_job.attempts, 2)
+
+    def test_stale_job_fails_after_the_maximum_attempts(self):
+        manifest_job = self.create_manifest_job(
+            status=constants.ManifestJobStatus.RUNNING,
+            locked_by="lost-worker",
+            attempts=2,
+        )
+        self.make_stale(manifest_job)
+
+        with mock.patch.object(settings, "MANIFEST_JOB_MAX_ATTEMPTS", 2):
+            claimed_job = self.manifest_job_controller.claim_next_manifest_job(
+                worker_id="worker"
+            )
+
+        self.assertIsNone(claimed_job)
+        manifest_job.refresh_from_db()
+        self.assertEqual(
+            manifest_job.status, constants.ManifestJobStatus.FAILED
+        )
+        self.assertEqual(manifest_job.attempts, 2)
+        self.assertIsNotNone(manifest_job.finished_on)
+        self.assertIn("2 attempts", manifest_job.error["detail"])
+
+    def test_failing_job_records_its_error(self):
+        self.create_manifest_job()
+        manifest_job = self.manifest_job_controller.claim_next_manifest_job(
+            worker_id="worker"
+        )
+
+        # the site has no linked repository, so the resync raises NotFound
+        self.manifest_job_controller.run_manifest_job(
+            manifest_job=manifest_job
+        )
+
+        manifest_job.refresh_from_db()
+        self.assertEqual(
+            manifest_job.status, constants.ManifestJobStatus.FAILED
+        )
+        self.assertEqual(manifest_job.error["status_code"], 404)
+        self.assertIsNotNone(manifest_job.finished_on)
+
+
+class ManifestLogsTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.user = create_user(username="admin")
+        content = b"subtopicBitNumber,subtopicReportedOn,subtopicName\n" + (
+            b"".join(
+                b"%d,%d,name%d\n" % (index // 2, 1001 + index % 2, index)
+                for index in range(7)
+            )
+        )
+        loaders.ManifestLogLoader(site=cls.site).load(
+            MANIFEST_FILE_NAME, content
+        )
+
+    def setUp(self):
+        self.client = rest_test.APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_manifest_logs(self, **params):
+        return self.client.get(
+            urls.reverse("manifest_logs"),
+            {"site_id": self.site.id, "file_version": "v1", **params},
+        )
+
+    def test_cursor_walk_returns_every_row_once(self):
+        rows = []
+        cursor = ""
+        while True:
+            manifest_logs_response = self.get_manifest_logs(
+                limit=3, cursor=cursor
+            )
+            self.assertEqual(manifest_logs_response.status_code, 200)
+            page = manifest_logs_response.json()
+            self.assertLessEqual(len(page["data"]), 3)
+            rows.extend(page["data"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(
+            [row["id"] for row in rows],
+            list(
+                models.ManifestLog.objects.filter(site=self.site)
+                .order_by("subtopic_bit_no", "id")
+                .values_list("id", flat=True)
+            ),
+        )
+
+    def test_filters_and_selected_fields(self):
+        manifest_logs_response = self.get_manifest_logs(
+            limit=10,
+            bit_from=1,
+            bit_to=2,
+            subtopicReportedOn="1002",
+            fields="subtopicName",
+        )
+
+        self.assertEqual(manifest_logs_response.status_code, 200)
+        self.assertEqual(
+            [
+                (row["subtopic_bit_no"], row["data"])
+                for row in manifest_logs_response.json()["data"]
+            ],
+            [(1, {"subtopicName": "name3"}), (2, {"subtopicName": "name5"})],
+        )
+
+    def test_contains_filter(self):
+        manifest_logs_response = self.get_manifest_logs(
+            limit=10, contains='{"subtopicName": "name4"}'
+        )
+
+        self.assertEqual(manifest_logs_response.status_code, 200)
+        self.assertEqual(
+            [row["data"] for row in manifest_logs_response.json()["data"]],
+            [
+                {
+                    "subtopicBitNumber": 2,
+                    "subtopicReportedOn": 1001,
+                    "subtopicName": "name4",
+                }
+            ],
+        )
+
+    def test_limit_below_one_is_rejected(self):
+        for limit in (0, -1, "x"):
+            with self.subTest(limit=limit):
+                manifest_logs_response = self.get_manifest_logs(limit=limit)
+
+                self.assertEqual(manifest_logs_response.status_code, 400)
+                self.assertFalse(manifest_logs_response.json()["result"])
+
+
+class ManifestLookupTableTestCase(test.SimpleTestCase):
+    def test_dense_table_decodes_set_bits(self):
+        lookup_table = lookup.ManifestLookupTable(
+            version_key=("v1", "commit", "blob"),
+            rows=[(2, {"name": "pump"}), (2, {"name": "flow"}), (4, {})],
+        )
+
+        self.assertEqual(lookup_table.offset, 2)
+        self.assertEqual(
+            lookup_table.decode(0b10110),
+            {
+                1: (),
+                2: ({"name": "pump"}, {"name": "flow"}),
+                4: ({},),
+            },
+        )
+        self.assertEqual(lookup_table.decode(0), {})
+        self.assertEqual(lookup_table.get(100), ())
+
+    def test_sparse_table_decodes_set_bits(self):
+        lookup_table = lookup.ManifestLookupTable(
+            version_key=("v1", "commit", "blob"),
+            rows=[(0, {"name": "pump"}), (1000, {"name": "flow"})],
+        )
+
+        self.assertIsNone(lookup_table.offset)
+        self.assertEqual(
+            lookup_table.decode((1 << 1000) | 3),
+            {0: ({"name": "pump"},), 1: (), 1000: ({"name": "flow"},)},
+        )
+
+    def test_negative_bitfield_is_rejected(self):
+        lookup_table = lookup.ManifestLookupTable(version_key=None, rows=[])
+
+        with self.assertRaises(ValueError):
+            lookup_table.decode(-1)
+
+
+class ManifestDecodeTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.user = create_user(username="admin")
+        create_site_manifest(
+            site=cls.site,
+            user=cls.user,
+            blob_shas={MANIFEST_FILE_NAME: "blob1"},
+        )
+        loaders.ManifestLogLoader(site=cls.site).load(
+            MANIFEST_FILE_NAME, MANIFEST_CSV
+        )
+
+    def setUp(self):
+        self.client = rest_test.APIClient()
+        self.client.force_authenticate(user=self.user)
+        lookup.invalidate_site_lookup_table(site_id=self.site.id)
+        self.addCleanup(
+            lookup.invalidate_site_lookup_table, site_id=self.site.id
+        )
+
+    def decode(self, values: str):
+        return self.client.get(
+            urls.reverse("manifest_decode"),
+            {"site_id": self.site.id, "values": values},
+        )
+
+    def get_subtopic_names(self, subtopics: list) -> list:
+        return sorted(subtopic["subtopicName"] for subtopic in subtopics)
+
+    def test_values_are_decoded_with_the_primary_manifest(self):
+        decode_response = self.decode("3,0,4")
+
+        self.assertEqual(decode_response.status_code, 200)
+        decoded_values = decode_response.json()
+        self.assertEqual(decoded_values["file_version"], "v1")
+        self.assertEqual(
+            [
+                {
+                    bit_number: self.get_subtopic_names(subtopics)
+                    for bit_number, subtopics in decoded_value[
+                        "subtopics"
+                    ].items()
+                }
+                for decoded_value in decoded_values["data"]
+            ],
+            [{"0": ["flow", "pump"], "1": ["valve"]}, {}, {"2": []}],
+        )
+
+    def test_invalid_values_are_rejected(self):
+        for values in ("-1", "1,x", ""):
+            with self.subTest(values=values):
+                decode_response = self.decode(values)
+
+                self.assertEqual(decode_response.status_code, 400)
+                self.assertFalse(decode_response.json()["result"])
+
+    def test_lookup_table_is_recompiled_when_the_manifest_changes(self):
+        lookup_table = lookup.get_site_lookup_table(site_id=self.site.id)
+        models.ManifestLog.objects.filter(
+            site=self.site, subtopic_bit_no=1
+        ).update(data={"subtopicName": "gate"})
+
+        with mock.patch.object(settings, "MANIFEST_LOOKUP_TTL", 0):
+            # the version of the primary manifest did not change yet
+            self.assertIs(
+                lookup.get_site_lookup_table(site_id=self.site.id),
+                lookup_table,
+            )
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest__site=self.site
+            ).update(blob_sha="blob2")
+            recompiled_lookup_table = lookup.get_site_lookup_table(
+                site_id=self.site.id
+            )
+
+        self.assertIsNot(recompiled_lookup_table, lookup_table)
+        self.assertEqual(
+            recompiled_lookup_table.get(1), ({"subtopicName": "gate"},)
+        )
+        lookup.invalidate_site_lookup_table(site_id=self.site.id)
+        self.assertIsNot(
+            lookup.get_site_lookup_table(site_id=self.site.id),
+            recompiled_lookup_table,
+        )
+
+
+class ColumnarManifestTestCase(test.SimpleTestCase):
+    content = (
+        b"subtopicBitNumber,subtopicReportedOn,subtopicName,threshold,"
+        b"enabled,counter\n"
+        b"0,1001,pump,1.5,True,1\n"
+        b"1,1001,valve,2,False,99999999999999999999\n"
+        b"0,x,flow,,True,3\n"
+        b"3,1002,,4,,4\n"
+        b"4,1002,gate,,,5\n"
+    )
+
+    def get_reader(self) -> columnar.ColumnarManifestReader:
+        columns, row_groups, row_count, payload = columnar.encode_manifest(
+            self.content, row_group_size=2
+        )
+        return columnar.ColumnarManifestReader(
+            models.ManifestColumnarFile(
+                columns=columns,
+                row_groups=row_groups,
+                row_count=row_count,
+                payload=payload,
+            )
+        )
+
+    def test_rows_round_trip(self):
+        reader = self.get_reader()
+        rows = list(loaders.iter_manifest_rows(self.content))
+
+        self.assertEqual(len(reader), 5)
+        self.assertEqual(list(reader), rows)
+        self.assertEqual([reader[index] for index in (4, 0, 2)], rows[4::-2])
+        self.assertEqual(reader[-1], rows[-1])
+        with self.assertRaises(IndexError):
+            reader[5]
+
+    def test_columns_are_typed_per_row_group(self):
+        reader = self.get_reader()
+
+        self.assertEqual(
+            [
+                [segment["encoding"] for segment in row_group["columns"]]
+                for row_group in reader.row_groups
+            ],
+            [
+                ["int", "str", "str", "float", "bool", "json"],
+                ["int", "str", "str", "float", "bool", "int"],
+                ["int", "str", "str", "null", "null", "int"],
+            ],
+        )
+        self.assertEqual(
+            reader.column("counter"), [1, 99999999999999999999, 3, 4, 5]
+        )
+        self.assertEqual(
+            reader.column("subtopicName"),
+            ["pump", "valve", "flow", None, "gate"],
+        )
+
+
+class ColumnarManifestStorageTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.site_manifest = create_site_manifest(
+            site=cls.site,
+            user=create_user(username="admin"),
+            blob_shas={
+                MANIFEST_FILE_NAME: "blob1",
+                "manifest_plant_v2.csv": "blob2",
+            },
+        )
+
+    def setUp(self):
+        lookup.invalidate_site_lookup_table(site_id=self.site.id)
+        self.addCleanup(
+            lookup.invalidate_site_lookup_table, site_id=self.site.id
+        )
+
+    def test_only_the_primary_manifest_is_stored(self):
+        controllers.ManifestController().store_columnar_manifest_files(
+            site_manifest=self.site_manifest,
+            csv_files={
+                MANIFEST_FILE_NAME: MANIFEST_CSV,
+                "manifest_plant_v2.csv": CHANGED_MANIFEST_CSV,
+            },
+        )
+
+        self.assertEqual(
+            list(
+                models.ManifestColumnarFile.objects.values_list(
+                    "version_history__manifest_file_name", "blob_sha"
+                )
+            ),
+            [(MANIFEST_FILE_NAME, "blob1")],
+        )
+
+    def test_lookup_table_is_compiled_from_the_columnar_file(self):
+        controllers.ManifestController().store_columnar_manifest_files(
+            site_manifest=self.site_manifest,
+            csv_files={MANIFEST_FILE_NAME: MANIFEST_CSV},
+        )
+
+        # no manifest log rows are stored, so every subtopic comes from the
+        # columnar file
+        lookup_table = lookup.get_site_lookup_table(site_id=self.site.id)
+
+        self.assertEqual(
+            [subtopic["subtopicName"] for subtopic in lookup_table.get(1)],
+            ["valve"],
+        )
+
+    def test_columnar_file_of_a_changed_blob_is_not_read(self):
+        controllers.ManifestController().store_columnar_manifest_files(
+            site_manifest=self.site_manifest,
+            csv_files={MANIFEST_FILE_NAME: MANIFEST_CSV},
+        )
+        version_history = models.SiteManifestVersionHistory.objects.get(
+            site_manifest=self.site_manifest, is_primary=True
+        )
+        version_history.blob_sha = "blob3"
+        version_history.save()
+
+        self.assertIsNone(
+            columnar.get_manifest_reader(version_history=version_history)
+        )
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "COPY is only used on PostgreSQL"
+)
+class QueryCounterTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+
+    def load_counting_queries(self) -> benchmarks.QueryCounter:
+        with benchmarks.QueryCounter() as query_counter:
+            loaders.ManifestLogLoader(site=self.site).load(
+                MANIFEST_FILE_NAME, MANIFEST_CSV
+            )
+        return query_counter
+
+    def test_copy_load_is_counted(self):
+        query_counter = self.load_counting_queries()
+
+        self.assertEqual(query_counter.copy_count, 1)
+        self.assertEqual(query_counter.count, 1)
+
+    def test_copy_load_is_counted_with_the_debug_cursor(self):
+        # the PostgreSQL debug cursor used when DEBUG is on defines its own
+        # copy_expert
+        with test_utils.CaptureQueriesContext(connection) as queries:
+            query_counter = self.load_counting_queries()
+
+        self.assertEqual(query_counter.copy_count, 1)
+        self.assertEqual(query_counter.count, 1)
+        self.assertTrue(queries[0]["sql"].startswith("COPY "))
+
+
+class FakeGithubTestCase(test.TestCase):
+    """
+    Serves a synthetic site deployment repository from a local fake GitHub
+    server for the duration of each test
+    """
+
+    file_count = 3
+    row_count = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(
+            name="Acme", manifest_config_name="acme"
+        )
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant", manifest_config_name="plant"
+        )
+        cls.user = create_user(username="admin")
+
+    def setUp(self):
+        self.repo = benchmarks.FakeGithubRepo(
+            owner=constants.Manifest.OWNER,
+            repo=f"{constants.Manifest.REPO_NAME_HEADER}_plant",
+            customer="acme",
+            site_name="plant",
+            file_count=self.file_count,
+            row_count=self.row_count,
+        )
+        self.server = benchmarks.FakeGithubServer(self.repo)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        patcher = mock.patch.object(
+            settings, "GITHUB_API_URL", self.server.url
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manifest_controller = controllers.ManifestController()
+
+    def validate_manifest(self) -> dict:
+        return self.manifest_controller.validate_manifest(
+            user=self.user,
+            site=self.site,
+            site_repo_url=(
+                f"https://{constants.Manifest.GITHUB_DOMAIN}/"
+                f"{self.repo.owner}/{self.repo.repo}"
+            ),
+            owner=self.repo.owner,
+            repo=self.repo.repo,
+        )
+
+    def get_site_manifest(self) -> models.SiteManifest:
+        return models.SiteManifest.objects.get(site=self.site)
+
+    def get_stored_blob_shas(self) -> dict:
+        return dict(
+            models.SiteManifestVersionHistory.objects.filter(
+                site_manifest__site=self.site
+            ).values_list("manifest_file_name", "blob_sha")
+        )
+
+    def get_revisions(self, manifest_file_name: str) -> set:
+        return {
+            data["subtopicDescription"].rsplit(" ", 1)[-1]
+            for data in models.ManifestLog.objects.filter(
+                site=self.site, manifest_file_name=manifest_file_name
+            ).values_list("data", flat=True)
+        }
+
+    def update_files(self, manifest_file_names: list, seed: int):
+        for manifest_file_name in manifest_file_names:
+            file_index = int(manifest_file_name[:-4].rsplit("_v", 1)[1]) - 1
+            self.repo.files[
+                manifest_file_name
+            ] = benchmarks.build_manifest_csv(
+                file_index=file_index, row_count=self.row_count, seed=seed
+            )
+        self.repo.commit()
+
+    def record_opened_blobs(self) -> list:
+        blob_files = []
+        open_blob = github_client.GithubRepoClient.open_blob
+
+        def record_opened_blob(repo_client, blob_sha):
+            blob_file = open_blob(repo_client, blob_sha=blob_sha)
+            blob_files.append(blob_file)
+            return blob_file
+
+        patcher = mock.patch.object(
+            github_client.GithubRepoClient, "open_blob", record_opened_blob
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return blob_files
+
+
+class ManifestSyncTestCase(FakeGithubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.validate_manifest()
+
+    def sync_site_manifest(self) -> dict:
+        return self.manifest_controller.sync_site_manifest(
+            site_manifest=self.get_site_manifest(),
+            repo_client=github_client.GithubRepoClient(
+                owner=self.repo.owner, repo=self.repo.repo
+            ),
+        )
+
+    def test_unchanged_tree_is_skipped(self):
+        blob_files = self.record_opened_blobs()
+
+        result = self.sync_site_manifest()
+
+        self.assertEqual(
+            result["status"], constants.ManifestSyncStatus.SKIPPED
+        )
+        self.assertEqual(result["files_fetched"], 0)
+        self.assertEqual(blob_files, [])
+
+    def test_only_changed_files_are_synced(self):
+        changed_file_name = self.repo.get_file_name(1)
+        self.update_files([changed_file_name], seed=1)
+
+        result = self.sync_site_manifest()
+
+        self.assertEqual(result["status"], constants.ManifestSyncStatus.SYNCED)
+        self.assertEqual(result["files_fetched"], 1)
+        self.assertEqual(result["files_skipped"], self.file_count - 1)
+        self.assertEqual(self.get_revisions(changed_file_name), {"1"})
+        self.assertEqual(self.get_revisions(self.repo.get_file_name(0)), {"0"})
+        self.assertEqual(self.get_site_manifest().tree_sha, self.repo.tree_sha)
+        self.assertEqual(
+            self.get_stored_blob_shas()[changed_file_name],
+            self.repo.trees[self.repo.tree_sha][changed_file_name],
+        )
+
+    def test_missing_config_is_not_found(self):
+        self.update_files([self.repo.get_file_name(1)], seed=1)
+        del self.repo.trees[self.repo.tree_sha][
+            constants.Manifest.CONFIG_FILE_NAME
+        ]
+
+        with self.assertRaises(exceptions.NotFound):
+            self.sync_site_manifest()
+
+        self.assertEqual(self.get_revisions(self.repo.get_file_name(1)), {"0"})
+
+
+class ManifestSyncRunTestCase(FakeGithubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.validate_manifest()
+        self.sync_run_controller = controllers.ManifestSyncRunController()
+        self.sync_run = self.sync_run_controller.start_manifest_sync_run(
+            workers=1, site_count=1
+        )
+        # the worker closes the connection of its thread, which is the
+        # connection of the test case when it is called directly
+        patcher = mock.patch.object(cronjobs.db.connection, "close")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync_site_manifest(self) -> dict:
+        return cronjobs._sync_site_manifest_worker(
+            site_manifest=models.SiteManifest.objects.select_related(
+                "site"
+            ).get(site=self.site),
+            rate_limit_gate=github_client.RateLimitGate(),
+            sync_run=self.sync_run,
+        )
+
+    def test_synced_site_is_recorded(self):
+        self.update_files([self.repo.get_file_name(1)], seed=1)
+
+        summary = self.sync_site_manifest()
+        self.sync_run_controller.finish_manifest_sync_run(
+            sync_run=self.sync_run, summaries=[summary]
+        )
+
+        sync_run_site = self.sync_run.sites.get()
+        self.assertEqual(
+            sync_run_site.status, constants.ManifestSyncStatus.SYNCED
+        )
+        self.assertEqual(sync_run_site.files_fetched, 1)
+        self.assertEqual(sync_run_site.files_skipped, self.file_count - 1)
+        self.assertEqual(sync_run_site.rows_updated, self.row_count)
+        self.assertEqual(
+            sync_run_site.github_calls, summary["github_requests"]
+        )
+        self.assertIsNotNone(sync_run_site.finished_on)
+        self.sync_run.refresh_from_db()
+        self.assertEqual(
+            self.sync_run.status, constants.ManifestSyncStatus.SUCCEEDED
+        )
+        self.assertEqual(self.sync_run.failed_site_count, 0)
+
+    def test_failed_site_is_recorded(self):
+        self.update_files([self.repo.get_file_name(1)], seed=1)
+        del self.repo.trees[self.repo.tree_sha][
+            constants.Manifest.CONFIG_FILE_NAME
+        ]
+
+        summary = self.sync_site_manifest()
+        self.sync_run_controller.finish_manifest_sync_run(
+            sync_run=self.sync_run, summaries=[summary]
+        )
+
+        sync_run_site = self.sync_run.sites.get()
+        self.assertEqual(
+            sync_run_site.status, constants.ManifestSyncStatus.FAILED
+        )
+        self.assertIn("NotFound", sync_run_site.error)
+        self.sync_run.refresh_from_db()
+        self.assertEqual(
+            self.sync_run.status, constants.ManifestSyncStatus.FAILED
+        )
+        self.assertEqual(self.sync_run.failed_site_count, 1)
+
+    def test_ledger_error_only_fails_the_site(self):
+        with mock.patch.object(
+            controllers.ManifestSyncRunController,
+            "finish_manifest_sync_run_site",
+            side_effect=RuntimeError("ledger"),
+        ):
+            summary = self.sync_site_manifest()
+
+        self.assertEqual(
+            summary["status"], constants.ManifestSyncStatus.FAILED
+        )
+        self.assertEqual(summary["error"], "RuntimeError('ledger')")
+        self.assertEqual(summary["site_id"], self.site.id)
+
+    def hold_site_manifest_lock(self):
+        other_connection = db.connections.create_connection("default")
+        self.addCleanup(other_connection.close)
+        with other_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, %s)",
+                [locks.SITE_MANIFEST_LOCK_NAMESPACE, self.site.id],
+            )
+        return other_connection
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql",
+        "Advisory locks are only taken on PostgreSQL",
+    )
+    def test_site_locked_elsewhere_is_skipped(self):
+        self.update_files([self.repo.get_file_name(1)], seed=1)
+        other_connection = self.hold_site_manifest_lock()
+
+        with locks.site_manifest_lock(site_id=self.site.id) as acquired:
+            self.assertFalse(acquired)
+        summary = self.sync_site_manifest()
+
+        self.assertEqual(
+            summary["status"], constants.ManifestSyncStatus.LOCKED
+        )
+        self.assertEqual(
+            self.sync_run.sites.get().status,
+            constants.ManifestSyncStatus.LOCKED,
+        )
+        self.assertEqual(self.get_revisions(self.repo.get_file_name(1)), {"0"})
+
+        other_connection.close()
+        summary = self.sync_site_manifest()
+
+        self.assertEqual(
+            summary["status"], constants.ManifestSyncStatus.SYNCED
+        )
+        self.assertEqual(self.get_revisions(self.repo.get_file_name(1)), {"1"})
+
+
+class GithubResponseCacheTestCase(FakeGithubTestCase):
+    def get_repo_client(self) -> github_client.GithubRepoClient:
+        return github_client.GithubRepoClient(
+            owner=self.repo.owner, repo=self.repo.repo
+        )
+
+    def get_cache_entry(self, path: str) -> models.GithubResponseCache:
+        return models.GithubResponseCache.objects.get(
+            url=(
+                f"{settings.GITHUB_API_URL}/repos/{self.repo.owner}"
+                f"/{self.repo.repo}/{path}"
+            )
+        )
+
+    def test_unchanged_head_is_revalidated(self):
+        self.get_repo_client().get_snapshot()
+        repo_client = self.get_repo_client()
+
+        snapshot = repo_client.get_snapshot()
+
+        self.assertEqual(snapshot["commit_sha"], self.repo.commit_sha)
+        self.assertEqual(
+            repo_client.stats,
+            {"requests": 1, "cache_hits": 1, "cache_misses": 0},
+        )
+        self.assertEqual(self.get_cache_entry("commits/HEAD").hit_count, 0)
+
+        repo_client.flush_cache_hits()
+
+        self.assertEqual(self.get_cache_entry("commits/HEAD").hit_count, 1)
+
+        self.repo.commit()
+        snapshot = repo_client.get_snapshot()
+
+        self.assertEqual(snapshot["commit_sha"], self.repo.commit_sha)
+        self.assertEqual(repo_client.stats["cache_misses"], 1)
+        self.assertEqual(self.get_cache_entry("commits/HEAD").miss_count, 2)
+
+    def test_trees_are_served_without_a_request(self):
+        blob_shas = self.get_repo_client().get_root_blob_shas(
+            tree_sha=self.repo.tree_sha
+        )
+        repo_client = self.get_repo_client()
+
+        self.assertEqual(
+            repo_client.get_root_blob_shas(tree_sha=self.repo.tree_sha),
+            blob_shas,
+        )
+        self.assertEqual(
+            repo_client.stats,
+            {"requests": 0, "cache_hits": 1, "cache_misses": 0},
+        )
+
+    def test_unused_responses_are_pruned(self):
+        self.get_repo_client().get_snapshot()
+        self.get_repo_client().get_root_blob_shas(tree_sha=self.repo.tree_sha)
+        models.GithubResponseCache.objects.update(
+            updated_on=timezone.now() - datetime.timedelta(hours=2)
+        )
+        repo_client = self.get_repo_client()
+        repo_client.get_root_blob_shas(tree_sha=self.repo.tree_sha)
+        repo_client.flush_cache_hits()
+
+        self.assertEqual(github_client.prune_response_cache(ttl=3600), 1)
+        self.assertEqual(
+            list(
+                models.GithubResponseCache.objects.values_list(
+                    "url", flat=True
+                )
+            ),
+            [self.get_cache_entry(f"git/trees/{self.repo.tree_sha}").url],
+        )
+
+
+class GithubWebhookTestCase(test.TestCase):
+    secret = "webhook-secret"
+
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        create_site_manifest(
+            site=cls.site,
+            user=create_user(username="admin"),
+            blob_shas={MANIFEST_FILE_NAME: "blob1"},
+        )
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            settings, "GITHUB_WEBHOOK_SECRET", self.secret
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_webhook(self, body: bytes, signature: str, event: str):
+        return self.client.post(
+            urls.reverse("github_webhook"),
+            data=body,
+            content_type="application/json",
+            HTTP_X_HUB_SIGNATURE_256=signature,
+            HTTP_X_GITHUB_EVENT=event,
+        )
+
+    def get_push_body(self, full_name: str, paths: list) -> bytes:
+        return json.dumps(
+            {
+                "ref": "refs/heads/main",
+                "after": "commit2",
+                "repository": {
+                    "full_name": full_name,
+                    "default_branch": "main",
+                },
+                "commits": [{"modified": paths}],
+            }
+        ).encode("utf-8")
+
+    def post_push(self, full_name: str, paths: list):
+        body = self.get_push_body(full_name=full_name, paths=paths)
+        return self.post_webhook(
+            body=body,
+            signature=github_client.get_webhook_signature(
+                body=body, secret=self.secret
+            ),
+            event=constants.GithubWebhookEvents.PUSH,
+        )
+
+    def test_verify_webhook_signature(self):
+        body = b'{"zen": "Keep it logically awesome."}'
+        signature = github_client.get_webhook_signature(
+            body=body, secret=self.secret
+        )
+
+        self.assertTrue(
+            github_client.verify_webhook_signature(
+                body=body, signature=signature, secret=self.secret
+            )
+        )
+        for body, signature, secret in (
+            (body + b" ", signature, self.secret),
+            (body, signature, "other-secret"),
+            (body, signature.replace("sha256=", "sha1="), self.secret),
+            (body, "", self.secret),
+            (body, signature, ""),
+        ):
+            with self.subTest(signature=signature, secret=secret):
+                self.assertFalse(
+                    github_client.verify_webhook_signature(
+                        body=body, signature=signature, secret=secret
+                    )
+                )
+
+    def test_invalid_signature_is_rejected(self):
+        body = json.dumps({"zen": "Design for failure."}).encode("utf-8")
+
+        github_response = self.post_webhook(
+            body=body,
+            signature=github_client.get_webhook_signature(
+                body=body, secret="other-secret"
+            ),
+            event=constants.GithubWebhookEvents.PING,
+        )
+
+        self.assertEqual(github_response.status_code, 401)
+        self.assertFalse(github_response.json()["result"])
+
+    def test_signed_ping_is_answered(self):
+        body = json.dumps({"zen": "Design for failure."}).encode("utf-8")
+
+        github_response = self.post_webhook(
+            body=body,
+            signature=github_client.get_webhook_signature(
+                body=body, secret=self.secret
+            ),
+            event=constants.GithubWebhookEvents.PING,
+        )
+
+        self.assertEqual(github_response.status_code, 200)
+        self.assertEqual(github_response.json()["msg"], "pong")
+
+    def test_signed_push_of_unlinked_repository_is_not_found(self):
+        github_response = self.post_push(
+            full_name="aquacycl/unlinked", paths=[MANIFEST_FILE_NAME]
+        )
+
+        self.assertEqual(github_response.status_code, 404)
+        self.assertFalse(models.ManifestJob.objects.exists())
+
+    def test_pushes_queue_one_resync_of_the_manifest_paths(self):
+        github_response = self.post_push(
+            full_name="aquacycl/plant",
+            paths=[MANIFEST_FILE_NAME, "docs/manifest_plant_v9.csv"],
+        )
+        self.assertEqual(github_response.status_code, 202)
+        github_response = self.post_push(
+            full_name="AquaCycl/Plant",
+            paths=[constants.Manifest.CONFIG_FILE_NAME, "README.md"],
+        )
+
+        self.assertEqual(github_response.status_code, 202)
+        manifest_job = models.ManifestJob.objects.get()
+        self.assertEqual(
+            github_response.json()["data"]["job_id"], manifest_job.id
+        )
+        self.assertEqual(
+            manifest_job.job_type, constants.ManifestJobTypes.RESYNC
+        )
+        self.assertEqual(
+            manifest_job.payload,
+            {
+                "paths": [
+                    constants.Manifest.CONFIG_FILE_NAME,
+                    MANIFEST_FILE_NAME,
+                ],
+                "commit_sha": "commit2",
+            },
+        )
+
+    def test_push_without_manifest_changes_is_ignored(self):
+        github_response = self.post_push(
+            full_name="aquacycl/plant", paths=["README.md"]
+        )
+
+        self.assertEqual(github_response.status_code, 200)
+        self.assertFalse(models.ManifestJob.objects.exists())
+
+    def test_replayed_payload_is_signed_with_the_configured_secret(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as payload_file:
+            payload_file.write(
+                self.get_push_body(
+                    full_name="aquacycl/plant", paths=[MANIFEST_FILE_NAME]
+                )
+            )
+            payload_file.flush()
+            stdout = io.StringIO()
+
+            management.call_command(
+                "replay_github_webhook", payload_file.name, stdout=stdout
+            )
+
+            self.assertTrue(stdout.getvalue().startswith("202"))
+            with mock.patch.object(settings, "GITHUB_WEBHOOK_SECRET", ""):
+                with self.assertRaises(management.CommandError):
+                    management.call_command(
+                        "replay_github_webhook", payload_file.name
+                    )
+
+
+class ManifestResyncJobTestCase(FakeGithubTestCase):
+    def run_resync_job(self, paths: list) -> models.ManifestJob:
+        manifest_job_controller = controllers.ManifestJobController()
+        manifest_job_controller.create_resync_job(
+            site_manifest=self.get_site_manifest(),
+            paths=paths,
+            commit_sha=self.repo.commit_sha,
+        )
+        manifest_job = manifest_job_controller.claim_next_manifest_job(
+            worker_id="worker"
+        )
+        manifest_job_controller.run_manifest_job(manifest_job=manifest_job)
+        manifest_job.refresh_from_db()
+        return manifest_job
+
+    def test_resync_only_reads_the_pushed_files(self):
+        self.validate_manifest()
+        tree_sha = self.get_site_manifest().tree_sha
+        stored_blob_shas = self.get_stored_blob_shas()
+        pushed_file_name, other_file_name = (
+            self.repo.get_file_name(1),
+            self.repo.get_file_name(2),
+        )
+        self.update_files([pushed_file_name, other_file_name], seed=1)
+
+        manifest_job = self.run_resync_job(paths=[pushed_file_name])
+
+        self.assertEqual(
+            manifest_job.status, constants.ManifestJobStatus.SUCCEEDED
+        )
+        self.assertEqual(manifest_job.result["files_fetched"], 1)
+        self.assertEqual(manifest_job.result["paths"], [pushed_file_name])
+        self.assertEqual(self.get_revisions(pushed_file_name), {"1"})
+        self.assertEqual(self.get_revisions(other_file_name), {"0"})
+        blob_shas = self.get_stored_blob_shas()
+        self.assertEqual(
+            blob_shas[pushed_file_name],
+            self.repo.trees[self.repo.tree_sha][pushed_file_name],
+        )
+        self.assertEqual(
+            blob_shas[other_file_name], stored_blob_shas[other_file_name]
+        )
+        # the tree SHA is left for the next full sync to compare every file
+        self.assertEqual(self.get_site_manifest().tree_sha, tree_sha)
+
+        result = self.manifest_controller.sync_site_manifest(
+            site_manifest=self.get_site_manifest(),
+            repo_client=github_client.GithubRepoClient(
+                owner=self.repo.owner, repo=self.repo.repo
+            ),
+        )
+
+        self.assertEqual(result["files_fetched"], 1)
+        self.assertEqual(self.get_revisions(other_file_name), {"1"})
+        self.assertEqual(self.get_site_manifest().tree_sha, self.repo.tree_sha)
+
+
+class ManifestBlobDownloadTestCase(FakeGithubTestCase):
+    def test_only_changed_files_are_downloaded(self):
+        blob_files = self.record_opened_blobs()
+        result = self.validate_manifest()
+
+        self.assertEqual(result["downloaded_files"], self.file_count)
+        self.assertEqual(len(blob_files), self.file_count)
+
+        self.update_files([self.repo.get_file_name(1)], seed=1)
+        del blob_files[:]
+        result = self.validate_manifest()
+
+        self.assertEqual(result["downloaded_files"], 1)
+        self.assertEqual(result["unchanged_files"], self.file_count - 1)
+        self.assertEqual(len(blob_files), 1)
+        self.assertEqual(self.get_revisions(self.repo.get_file_name(1)), {"1"})
+
+    def test_error_response_is_closed(self):
+        repo_client = github_client.GithubRepoClient(
+            owner=self.repo.owner, repo=self.repo.repo
+        )
+
+        with mock.patch.object(
+            requests.Response,
+            "close",
+            autospec=True,
+            side_effect=requests.Response.close,
+        ) as close:
+            with self.assertRaises(github.UnknownObjectException):
+                repo_client.open_blob(blob_sha="missing")
+
+        self.assertTrue(close.called)
+
+
+class ValidateManifestFilesTestCase(test.TestCase):
+    def get_errors(self, report: dict) -> list:
+        return [
+            (error["file"], error["row"], error["column"], error["error"])
+            for error in report["errors"]
+        ]
+
+    def test_valid_file_has_no_errors(self):
+        report = validator.validate_manifest_files(
+            {MANIFEST_FILE_NAME: MANIFEST_CSV}
+        )
+
+        self.assertEqual(report, {"error_count": 0, "errors": []})
+
+    def test_file_errors(self):
+        report = validator.validate_manifest_files(
+            {
+                "manifest.csv": MANIFEST_CSV,
+                "manifest_plant_v2.csv": b"subtopicBitNumber,name\n0,pump\n",
+                "manifest_plant_v3.csv": b"",
+            }
+        )
+
+        self.assertEqual(
+            self.get_errors(report),
+            [
+                (
+                    "manifest.csv",
+                    None,
+                    None,
+                    "File name must follow manifest_<site>_<version>.csv.",
+                ),
+                (
+                    "manifest_plant_v2.csv",
+                    None,
+                    None,
+                    "Missing required columns: "
+                    f"{constants.Manifest.SUBTOPIC_REPORTED_ON}.",
+                ),
+                (
+                    "manifest_plant_v3.csv",
+                    None,
+                    None,
+                    "File has no data rows.",
+                ),
+            ],
+        )
+
+    def test_row_errors_across_chunks(self):
+        content = (
+            b"subtopicBitNumber,subtopicReportedOn,threshold\n"
+            b"0,1001,1.5\n"
+            b",1001,2\n"
+            b"x,1001,3\n"
+            b"-1,1001,4\n"
+            b"0,1001,inf\n"
+        )
+
+        with mock.patch.object(settings, "MANIFEST_LOAD_CHUNK_SIZE", 2):
+            report = validator.validate_manifest_files(
+                {MANIFEST_FILE_NAME: content}
+            )
+
+        bit_number = constants.Manifest.SUBTOPIC_BIT_NUMBER
+        reported_on = constants.Manifest.SUBTOPIC_REPORTED_ON
+        self.assertEqual(
+            self.get_errors(report),
+            [
+                (
+                    MANIFEST_FILE_NAME,
+                    2,
+                    bit_number,
+                    "Subtopic bit number is missing.",
+                ),
+                (
+                    MANIFEST_FILE_NAME,
+                    3,
+                    bit_number,
+                    "Subtopic bit number is not an integer.",
+                ),
+                (
+                    MANIFEST_FILE_NAME,
+                    4,
+                    bit_number,
+                    "Subtopic bit number must be between 0 and "
+                    f"{validator.MAX_SUBTOPIC_BIT_NUMBER}.",
+                ),
+                (
+                    MANIFEST_FILE_NAME,
+                    5,
+                    reported_on,
+                    "Duplicate subtopic bit number and reported on.",
+                ),
+                (
+                    MANIFEST_FILE_NAME,
+                    5,
+                    "threshold",
+                    "Value must be a finite number.",
+                ),
+            ],
+        )
+
+    def test_errors_are_truncated(self):
+        error_count = constants.Manifest.MAX_VALIDATION_ERRORS + 5
+        content = b"subtopicBitNumber,subtopicReportedOn\n" + b"".join(
+            b"%d,\n" % row_index for row_index in range(error_count)
+        )
+
+        report = validator.validate_manifest_files(
+            {MANIFEST_FILE_NAME: content}
+        )
+
+        self.assertEqual(report["error_count"], error_count)
+        self.assertEqual(
+            len(report["errors"]), constants.Manifest.MAX_VALIDATION_ERRORS
+        )
+
+
+class ManifestCommitPipelineTestCase(FakeGithubTestCase):
+    def test_stages_are_timed(self):
+        with mock.patch.object(settings, "MANIFEST_COLUMNAR_STORAGE", False):
+            result = self.validate_manifest()
+
+        self.assertEqual(
+            set(result["timings"]),
+            {
+                "site_manifest",
+                "version_history",
+                "manifest_log",
+                "config",
+                "total",
+            },
+        )
+        self.assertEqual(result["errors"], {})
+
+    def test_failing_stage_rolls_back_every_write(self):
+        with mock.patch.object(
+            controllers.ManifestController,
+            "create_config",
+            side_effect=RuntimeError("config"),
+        ):
+            with self.assertRaises(RuntimeError):
+                self.validate_manifest()
+
+        self.assertFalse(models.SiteManifest.objects.exists())
+        self.assertFalse(models.SiteManifestVersionHistory.objects.exists())
+        self.assertFalse(models.ManifestLog.objects.exists())
+
+    def test_failing_optional_stage_keeps_the_other_writes(self):
+        with mock.patch.object(
+            settings, "MANIFEST_COLUMNAR_STORAGE", True
+        ), mock.patch.object(
+            controllers.ManifestController,
+            "store_columnar_manifest_files",
+            side_effect=RuntimeError("columnar"),
+        ):
+            result = self.validate_manifest()
+
+        self.assertEqual(
+            result["errors"], {"columnar": "RuntimeError('columnar')"}
+        )
+        self.assertIn("columnar", result["timings"])
+        self.assertEqual(self.get_site_manifest().tree_sha, self.repo.tree_sha)
+        self.assertEqual(
+            models.ManifestLog.objects.filter(site=self.site).count(),
+            self.file_count * self.row_count,
+        )
+
+
+class ManifestValidationStageTestCase(FakeGithubTestCase):
+    def test_invalid_rows_stop_the_validation_before_any_write(self):
+        self.repo.files[
+            self.repo.get_file_name(1)
+        ] = b"subtopicBitNumber,subtopicReportedOn\nx,1001\n"
+        self.repo.commit()
+
+        with self.assertRaises(serializers.ValidationError):
+            self.validate_manifest()
+
+        self.assertFalse(models.SiteManifest.objects.exists())
+        self.assertFalse(models.ManifestLog.objects.exists())
+
+    def test_downloaded_files_are_closed(self):
+        blob_files = self.record_opened_blobs()
+        self.validate_manifest()
+
+        self.assertEqual(len(blob_files), self.file_count)
+        self.assertTrue(all(blob_file.closed for blob_file in blob_files))
+
+        self.repo.files[
+            self.repo.get_file_name(1)
+        ] = b"subtopicBitNumber,subtopicReportedOn\nx,1001\n"
+        self.repo.commit()
+        del blob_files[:]
+
+        with self.assertRaises(serializers.ValidationError):
+            self.validate_manifest()
+
+        self.assertEqual(len(blob_files), 1)
+        self.assertTrue(blob_files[0].closed)
+
+
+class ManifestVersionHistoryReconcileTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.user = create_user(username="admin")
+        cls.site_manifest = create_site_manifest(
+            site=cls.site,
+            user=cls.user,
+            blob_shas={
+                "manifest_plant_v1.csv": "blob1",
+                "manifest_plant_v2.csv": "blob2",
+                "manifest_plant_v3.csv": "blob3",
+            },
+        )
+
+    def get_version_history(self) -> dict:
+        return {
+            site_manifest_version_history.manifest_file_name: (
+                site_manifest_version_history.blob_sha,
+                site_manifest_version_history.latest_commit_hash,
+                site_manifest_version_history.is_primary,
+            )
+            for site_manifest_version_history in (
+                models.SiteManifestVersionHistory.objects.filter(
+                    site_manifest=self.site_manifest
+                )
+            )
+        }
+
+    def reconcile(self, csv_file_hashes: dict, primary_manifest_file_name):
+        manifest_controller = controllers.ManifestController()
+        return manifest_controller.reconcile_site_manifest_version_history(
+            site_manifest=self.site_manifest,
+            csv_file_hashes=csv_file_hashes,
+            primary_manifest_file_name=primary_manifest_file_name,
+            latest_commit_hash="commit2",
+        )
+
+    def test_differences_are_written_in_one_pass(self):
+        changes = self.reconcile(
+            csv_file_hashes={
+                "manifest_plant_v1.csv": "blob1",
+                "manifest_plant_v2.csv": "blob2b",
+                "manifest_plant_v4.csv": "blob4",
+            },
+            primary_manifest_file_name="manifest_plant_v2.csv",
+        )
+
+        self.assertEqual(changes["created"], ["manifest_plant_v4.csv"])
+        self.assertEqual(
+            sorted(changes["updated"]),
+            ["manifest_plant_v1.csv", "manifest_plant_v2.csv"],
+        )
+        self.assertEqual(changes["deleted"], ["manifest_plant_v3.csv"])
+        self.assertEqual(
+            self.get_version_history(),
+            {
+                "manifest_plant_v1.csv": ("blob1", "commit", False),
+                "manifest_plant_v2.csv": ("blob2b", "commit2", True),
+                "manifest_plant_v4.csv": ("blob4", "commit2", False),
+            },
+        )
+
+    def test_unchanged_files_are_not_written(self):
+        # only the stored entries are read
+        with self.assertNumQueries(1):
+            changes = self.reconcile(
+                csv_file_hashes={
+                    "manifest_plant_v1.csv": "blob1",
+                    "manifest_plant_v2.csv": "blob2",
+                    "manifest_plant_v3.csv": "blob3",
+                },
+                primary_manifest_file_name="manifest_plant_v1.csv",
+            )
+
+        self.assertEqual(
+            changes, {"created": [], "updated": [], "deleted": []}
+        )
+
+
+class ManifestHistoryCacheTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.user = create_user(username="admin")
+        create_site_manifest(
+            site=cls.site,
+            user=cls.user,
+            blob_shas={
+                MANIFEST_FILE_NAME: "blob1",
+                "manifest_plant_v2.csv": "blob2",
+            },
+        )
+
+    def setUp(self):
+        cache = django_cache.caches[settings.MANIFEST_HISTORY_CACHE]
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = rest_test.APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_file_versions(self) -> list:
+        manifest_history_response = self.client.get(
+            urls.reverse("manifest_history"),
+            {"site_id": self.site.id, "limit": 10},
+        )
+        self.assertEqual(manifest_history_response.status_code, 200)
+        page = manifest_history_response.json()
+        self.assertEqual(page["version_history_count"], len(page["data"]))
+        return [row["file_version"] for row in page["data"]]
+
+    def test_page_is_cached_until_the_site_is_invalidated(self):
+        self.assertEqual(self.get_file_versions(), ["v2", "v1"])
+        # update() leaves updated_on untouched, so only the generation of
+        # the site can tell the cached page is out of date
+        models.SiteManifestVersionHistory.objects.filter(
+            file_version="v1"
+        ).update(file_version="v3")
+
+        self.assertEqual(self.get_file_versions(), ["v2", "v1"])
+        history_cache.invalidate_site_manifest_history(site_id=self.site.id)
+        self.assertEqual(self.get_file_versions(), ["v3", "v2"])
+
+    def test_page_is_rebuilt_when_the_version_history_changes(self):
+        self.assertEqual(self.get_file_versions(), ["v2", "v1"])
+
+        version_history = models.SiteManifestVersionHistory.objects.get(
+            file_version="v1"
+        )
+        version_history.file_version = "v3"
+        version_history.save()
+        self.assertEqual(self.get_file_versions(), ["v3", "v2"])
+        version_history.delete()
+        self.assertEqual(self.get_file_versions(), ["v2"])
+
+    def test_history_is_only_served_to_admins(self):
+        self.client.force_authenticate(
+            user=create_user(
+                username="staff", user_type_id=constants.UserTypeNames.STAFF
+            )
+        )
+
+        manifest_history_response = self.client.get(
+            urls.reverse("manifest_history"),
+            {"site_id": self.site.id, "limit": 10},
+        )
+
+        self.assertEqual(manifest_history_response.status_code, 403)
+
+
+class ManifestDiffTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = user_models.Company.objects.create(name="Acme")
+        cls.site = user_models.Site.objects.create(
+            company=company, name="Plant"
+        )
+        cls.user = create_user(username="admin")
+        create_site_manifest(
+            site=cls.site,
+            user=cls.user,
+            blob_shas={
+                MANIFEST_FILE_NAME: "blob1",
+                "manifest_plant_v2.csv": "blob2",
+            },
+        )
+        manifest_log_loader = loaders.ManifestLogLoader(site=cls.site)
+        manifest_log_loader.load(MANIFEST_FILE_NAME, MANIFEST_CSV)
+        manifest_log_loader.load("manifest_plant_v2.csv", CHANGED_MANIFEST_CSV)
+
+    def setUp(self):
+        cache = django_cache.caches[settings.MANIFEST_HISTORY_CACHE]
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = rest_test.APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_diff(self, from_version: str = "v1", to_version: str = "v2"):
+        return self.client.get(
+            urls.reverse("manifest_diff"),
+            {
+                "site_id": self.site.id,
+                "from_version": from_version,
+                "to_version": to_version,
+            },
+        )
+
+    def test_added_removed_and_changed_subtopics(self):
+        diff_response = self.get_diff()
+
+        self.assertEqual(diff_response.status_code, 200)
+        diff = diff_response.json()
+        self.assertEqual(
+            (
+                diff["added_count"],
+                diff["removed_count"],
+                diff["changed_count"],
+            ),
+            (1, 1, 1),
+        )
+        self.assertEqual(
+            [
+                (subtopic["subtopic_bit_no"], subtopic["data"]["subtopicName"])
+                for subtopic in diff["data"]["added"] + diff["data"]["removed"]
+            ],
+            [(2, "level"), (1, "valve")],
+        )
+        changed = diff["data"]["changed"][0]
+        self.assertEqual(
+            (
+                changed["subtopic_bit_no"],
+                changed["subtopic_reported_on"],
+                changed["changed_fields"],
+                changed["from_data"]["threshold"],
+                changed["to_data"]["threshold"],
+            ),
+            (0, "1001", ["threshold"], 1.5, 2.5),
+        )
+
+    def test_join_and_in_memory_comparisons_agree(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("the full outer join only runs on PostgreSQL")
+        for from_version, to_version in (("v1", "v2"), ("v2", "v1")):
+            with self.subTest(from_version=from_version):
+                self.assertEqual(
+                    list(
+                        diffs._iter_differences_with_join(
+                            site_id=self.site.id,
+                            from_version=from_version,
+                            to_version=to_version,
+                        )
+                    ),
+                    list(
+                        diffs._iter_differences_with_orm(
+                            site_id=self.site.id,
+                            from_version=from_version,
+                            to_version=to_version,
+                        )
+                    ),
+                )
+
+    def test_diff_is_cached_by_blob_sha(self):
+        self.assertEqual(self.get_diff().json()["changed_count"], 1)
+        models.ManifestLog.objects.filter(
+            site=self.site, file_version="v2", subtopic_bit_no=0
+        ).update(data={})
+
+        self.assertEqual(self.get_diff().json()["changed_count"], 1)
+        models.SiteManifestVersionHistory.objects.filter(
+            file_version="v2"
+        ).update(blob_sha="blob3")
+        self.assertEqual(self.get_diff().json()["changed_count"], 2)
+
+    def test_unknown_version_is_not_found(self):
+        diff_response = self.get_diff(to_version="v9")
+
+        self.assertEqual(diff_response.status_code, 404)
+        self.assertFalse(diff_response.json()["result"])
+
+    def test_diff_is_only_served_to_admins(self):
+        self.client.force_authenticate(
+            user=create_user(
+                username="staff", user_type_id=constants.UserTypeNames.STAFF
+            )
+        )
+
+        self.assertEqual(self.get_diff().status_code, 403)
@@ -13,4 +13,39 @@ urlpatterns = [
         views.ManifestHistory.as_view(),
         name="manifest_history",
     ),
+    path(
+        "manifest-logs/",
+        views.ManifestLogs.as_view(),
+        name="manifest_logs",
+    ),
+    path(
+        "manifest-diff/",
+        views.ManifestDiff.as_view(),
+        name="manifest_diff",
+    ),
+    path(
+        "manifest-decode/",
+        views.ManifestDecode.as_view(),
+        name="manifest_decode",
+    ),
+    path(
+        "manifest-jobs/<int:job_id>/",
+        views.ManifestJob.as_view(),
+        name="manifest_job",
+    ),
+    path(
+        "github-cache-stats/",
+        views.GithubCacheStats.as_view(),
+        name="github_cache_stats",
+    ),
+    path(
+        "manifest-sync-runs/",
+        views.ManifestSyncRuns.as_view(),
+        name="manifest_sync_runs",
+    ),
+    path(
+        "github-webhook/",
+        views.GithubWebhook.as_view(),
+        name="github_webhook",
+    ),
 ]
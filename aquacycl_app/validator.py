@@ -0,0 +1,259 @@
+import csv
+
+import pandas as pd
+
+from aquacycl_app import loaders, models
+from aquacycl_project import constants, settings
+
+REQUIRED_COLUMNS = (
+    constants.Manifest.SUBTOPIC_BIT_NUMBER,
+    constants.Manifest.SUBTOPIC_REPORTED_ON,
+)
+
+MAX_SUBTOPIC_BIT_NUMBER = 2**31 - 1
+
+MAX_REPORTED_ON_LENGTH = models.ManifestLog._meta.get_field(
+    "subtopic_reported_on"
+).max_length
+
+
+def _row_errors(
+    manifest_file_name: str,
+    frame: pd.DataFrame,
+    mask: pd.Series,
+    column: str,
+    error: str,
+) -> list:
+    values = frame.loc[mask, column]
+    return [
+        {
+            "file": manifest_file_name,
+            "row": int(row_index) + 1,
+            "column": column,
+            "value": value,
+            "error": error,
+        }
+        for row_index, value in values.items()
+    ]
+
+
+def _file_error(manifest_file_name: str, error: str) -> dict:
+    return {
+        "file": manifest_file_name,
+        "row": None,
+        "column": None,
+        "value": None,
+        "error": error,
+    }
+
+
+def validate_manifest_chunk(
+    manifest_file_name: str,
+    frame: pd.DataFrame,
+    seen_keys: set,
+    float_columns: list = (),
+) -> list:
+    """
+    To validate a chunk of manifest rows with column wide checks
+    Params:
+        manifest_file_name: name of the manifest csv file
+        frame: chunk of the csv file read with string dtype, indexed by data row number from zero
+        seen_keys: (bit number, reported on) keys of the previous chunks, updated in place
+        float_columns: columns the loader parses as floats, whose infinite values cannot be
+                       stored as JSON
+    Returns:
+        errors: list of row errors of the chunk
+    """
+    bit_numbers = frame[constants.Manifest.SUBTOPIC_BIT_NUMBER]
+    reported_on = frame[constants.Manifest.SUBTOPIC_REPORTED_ON]
+    missing_bit_numbers = bit_numbers.isin(loaders.NULL_VALUES)
+    missing_reported_on = reported_on.isin(loaders.NULL_VALUES)
+
+    parsed_bit_numbers = pd.to_numeric(bit_numbers, errors="coerce")
+    invalid_bit_numbers = ~missing_bit_numbers & (
+        parsed_bit_numbers.isna() | (parsed_bit_numbers % 1 != 0)
+    )
+    out_of_range_bit_numbers = (
+        ~missing_bit_numbers
+        & ~invalid_bit_numbers
+        & (
+            (parsed_bit_numbers < 0)
+            | (parsed_bit_numbers > MAX_SUBTOPIC_BIT_NUMBER)
+        )
+    )
+    too_long_reported_on = reported_on.str.len() > MAX_REPORTED_ON_LENGTH
+
+    valid_keys = ~(
+        missing_bit_numbers
+        | invalid_bit_numbers
+        | out_of_range_bit_numbers
+        | missing_reported_on
+    )
+    keys = pd.Series(
+        list(
+            zip(
+                parsed_bit_numbers.where(valid_keys, -1).astype("int64"),
+                reported_on,
+            )
+        ),
+        index=frame.index,
+    )
+    duplicate_keys = valid_keys & (
+        keys.duplicated(keep="first") | keys.map(seen_keys.__contains__)
+    )
+    seen_keys.update(keys[valid_keys])
+
+    errors = []
+    for mask, column, error in (
+        (
+            missing_bit_numbers,
+            constants.Manifest.SUBTOPIC_BIT_NUMBER,
+            "Subtopic bit number is missing.",
+        ),
+        (
+            invalid_bit_numbers,
+            constants.Manifest.SUBTOPIC_BIT_NUMBER,
+            "Subtopic bit number is not an integer.",
+        ),
+        (
+            out_of_range_bit_numbers,
+            constants.Manifest.SUBTOPIC_BIT_NUMBER,
+            f"Subtopic bit number must be between 0 and "
+            f"{MAX_SUBTOPIC_BIT_NUMBER}.",
+        ),
+        (
+            missing_reported_on,
+            constants.Manifest.SUBTOPIC_REPORTED_ON,
+            "Subtopic reported on is missing.",
+        ),
+        (
+            too_long_reported_on,
+            constants.Manifest.SUBTOPIC_REPORTED_ON,
+            f"Subtopic reported on is longer than {MAX_REPORTED_ON_LENGTH} "
+            f"characters.",
+        ),
+        (
+            duplicate_keys,
+            constants.Manifest.SUBTOPIC_REPORTED_ON,
+            "Duplicate subtopic bit number and reported on.",
+        ),
+    ):
+        if mask.any():
+            errors.extend(
+                _row_errors(manifest_file_name, frame, mask, column, error)
+            )
+    for column in float_columns:
+        infinite_values = frame[column].str.fullmatch(loaders.INFINITE_PATTERN)
+        if infinite_values.any():
+            errors.extend(
+                _row_errors(
+                    manifest_file_name,
+                    frame,
+                    infinite_values,
+                    column,
+                    "Value must be a finite number.",
+                )
+            )
+    return errors
+
+
+def validate_manifest_file(
+    manifest_file_name: str,
+    content: loaders.ManifestContent,
+    chunk_size: int = None,
+) -> list:
+    """
+    To validate a manifest csv file before any of its rows are written. The file is read in
+    chunks of string columns and each check runs on a whole column of the chunk at once.
+    Params:
+        manifest_file_name: name of the manifest csv file
+        content: raw content of the csv file, as bytes or a binary file
+        chunk_size: number of rows validated at once, defaults to settings.MANIFEST_LOAD_CHUNK_SIZE
+    Returns:
+        errors: list of errors with file, data row number (from one), column, value and message
+    """
+    if len(manifest_file_name.split("_")) < 3:
+        return [
+            _file_error(
+                manifest_file_name,
+                "File name must follow manifest_<site>_<version>.csv.",
+            )
+        ]
+    try:
+        # inferred before pandas starts reading, as it rewinds the file
+        column_types = loaders.infer_column_types(content)
+        with loaders.open_manifest_content(content) as stream:
+            chunks = pd.read_csv(
+                stream,
+                dtype=str,
+                keep_default_na=False,
+                skip_blank_lines=True,
+                # selecting the columns makes the parser drop extra trailing
+                # fields like ManifestLogLoader does instead of failing
+                usecols=lambda column: True,
+                chunksize=chunk_size or settings.MANIFEST_LOAD_CHUNK_SIZE,
+            )
+            errors = []
+            seen_keys = set()
+            row_count = 0
+            float_columns = []
+            for frame in chunks:
+                if row_count == 0:
+                    float_columns = [
+                        column
+                        for column, column_type in zip(
+                            frame.columns, column_types
+                        )
+                        if column_type is float
+                    ]
+                    missing_columns = [
+                        column
+                        for column in REQUIRED_COLUMNS
+                        if column not in frame.columns
+                    ]
+                    if missing_columns:
+                        return [
+                            _file_error(
+                                manifest_file_name,
+                                f"Missing required columns: "
+                                f"{', '.join(missing_columns)}.",
+                            )
+                        ]
+                frame = frame.fillna("")
+                errors.extend(
+                    validate_manifest_chunk(
+                        manifest_file_name=manifest_file_name,
+                        frame=frame,
+                        seen_keys=seen_keys,
+                        float_columns=float_columns,
+                    )
+                )
+                row_count += len(frame)
+    except pd.errors.EmptyDataError:
+        row_count = 0
+    except (csv.Error, pd.errors.ParserError, UnicodeDecodeError) as exception:
+        return [_file_error(manifest_file_name, str(exception))]
+    if row_count == 0:
+        return [_file_error(manifest_file_name, "File has no data rows.")]
+    return errors
+
+
+def validate_manifest_files(csv_files: dict) -> dict:
+    """
+    To validate the manifest csv files of a repository
+    Params:
+        csv_files: dictionary with csv file names as keys and raw content as bytes or binary
+                   files as values
+    Returns:
+        report: dictionary with the total error_count and the first
+                constants.Manifest.MAX_VALIDATION_ERRORS errors
+    """
+    errors = []
+    for name, content in csv_files.items():
+        errors.extend(
+            validate_manifest_file(manifest_file_name=name, content=content)
+        )
+    return {
+        "error_count": len(errors),
+        "errors": errors[: constants.Manifest.MAX_VALIDATION_ERRORS],
+    }
@@ -1,8 +1,10 @@
+import json
+
 from django.contrib import auth
-from rest_framework import response, status, views
+from rest_framework import permissions, response, status, views
 
-from aquacycl_app import controllers, serializers
-from aquacycl_project import constants
+from aquacycl_app import controllers, github_client, serializers
+from aquacycl_project import constants, settings
 from tj_packages import custom_pagination
 from users import controllers as user_controllers
 
@@ -86,121 +88,39 @@ class Manifest(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        (
-            config_data,
-            config_name,
-            config_latest_commit_hash,
-            csv_file_hashes,
-            csv_file_names,
-            csv_files,
-        ) = manifest_controller.fetch_from_github_repo_link(
-            owner=owner, repo=repo
-        )
-
-        production = config_data.get("production", {})
-        customer = production.get("customer", None)
-        site_name = production.get("siteName", None)
-        primary_manifest_file_name = production.get(
-            "manifestCSVFilename", None
-        )
-
-        if not (
-            customer == site.company.manifest_config_name
-            and site_name == site.manifest_config_name
-            and primary_manifest_file_name in csv_file_names
-        ):
-            return response.Response(
-                {
-                    "result": False,
-                    "msg": "Please provide a valid link.",
-                    "validation_error_field": "site_repo_url",
-                    "validation_error_msg": "Invalid company or site name.",
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        is_site_repo_entry_exists = (
-            manifest_controller.check_if_site_repo_entry_exists(site=site)
-        )
-
-        if not is_site_repo_entry_exists:
-            site_manifest = manifest_controller.create_site_manifest(
+        if data.get("async"):
+            manifest_job_controller = controllers.ManifestJobController()
+            manifest_job = manifest_job_controller.create_manifest_job(
                 user=user,
                 site=site,
                 site_repo_url=site_repo_url,
                 owner=owner,
                 repo=repo,
             )
-            manifest_controller.create_site_manifest_version_history_objects(
-                csv_file_names=csv_file_names,
-                user=user,
-                site_manifest=site_manifest,
-                primary_manifest_file_name=primary_manifest_file_name,
-                csv_file_hashes=csv_file_hashes,
-            )
-            manifest_controller.create_manifest_log_objects(
-                csv_files=csv_files,
-                site=site,
-            )
-            manifest_controller.create_config(
-                site_manifest=site_manifest,
-                config_name=config_name,
-                config_latest_commit_hash=config_latest_commit_hash,
+            return response.Response(
+                {
+                    "result": True,
+                    "msg": "Manifest validation queued.",
+                    "data": {"job_id": manifest_job.id},
+                },
+                status=status.HTTP_202_ACCEPTED,
             )
 
-        else:
-            site_manifest = manifest_controller.get_site_manifest(site=site)
-
-            if site_manifest.site_repo_url != site_repo_url:
-                site_manifest = manifest_controller.update_site_manifest(
-                    user=user,
-                    site_manifest=site_manifest,
-                    site_repo_url=site_repo_url,
-                    owner=owner,
-                    repo=repo,
-                )
-                manifest_controller.delete_site_manifest_version_history(
-                    site_manifest=site_manifest
-                )
-                manifest_controller.create_site_manifest_version_history_objects(
-                    csv_file_names=csv_file_names,
-                    user=user,
-                    site_manifest=site_manifest,
-                    primary_manifest_file_name=primary_manifest_file_name,
-                    csv_file_hashes=csv_file_hashes,
-                )
-                manifest_controller.update_site_manifest_log(
-                    csv_files=csv_files, site=site
-                )
-                manifest_controller.delete_config(site_manifest=site_manifest)
-                manifest_controller.create_config(
-                    site_manifest=site_manifest,
-                    config_name=config_name,
-                    config_latest_commit_hash=config_latest_commit_hash,
-                )
-
-            else:
-                manifest_controller.update_site_manifest_version_history(
-                    user=user,
-                    csv_file_names=csv_file_names,
-                    site_manifest=site_manifest,
-                    primary_manifest_file_name=primary_manifest_file_name,
-                    csv_file_hashes=csv_file_hashes,
-                )
-                manifest_controller.update_site_manifest_log(
-                    csv_files=csv_files,
-                    site=site,
-                )
-                manifest_controller.update_config(
-                    site_manifest=site_manifest,
-                    config_latest_commit_hash=config_latest_commit_hash,
-                )
+        result = manifest_controller.validate_manifest(
+            user=user,
+            site=site,
+            site_repo_url=site_repo_url,
+            owner=owner,
+            repo=repo,
+        )
+        response_data = data.copy()
+        response_data["timings"] = result["timings"]
 
         return response.Response(
             {
                 "result": True,
                 "msg": "Manifest file validated successfully.",
-                "data": data,
+                "data": response_data,
             },
             status=status.HTTP_201_CREATED,
         )
@@ -299,29 +219,482 @@ class ManifestHistory(views.APIView):
 
         site_manifest = manifest_controller.get_site_manifest(site=site)
 
-        site_manifest_version_history_objects = (
-            manifest_controller.get_site_manifest_version_history(
-                site_manifest=site_manifest,
+        page = manifest_controller.get_manifest_history_page(
+            site=site,
+            site_manifest=site_manifest,
+            offset=offset,
+            limit=limit,
+        )
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "preference_company_id": preference_company_id,
+                "preference_site_id": preference_site_id,
+                "version_history_count": page["version_history_count"],
+                "next_link": page["next_link"],
+                "data": page["data"],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ManifestLogs(views.APIView):
+    """
+    API endpoint to query the manifest log rows of a site.
+    """
+
+    def get(self, request):
+        user = request.user
+        query_params = request.query_params
+
+        site_id = query_params.get("site_id", "")
+        file_version = query_params.get("file_version", "")
+        reported_on = query_params.get("subtopicReportedOn", "")
+        fields = query_params.get("fields", "")
+        contains = query_params.get("contains", "")
+        cursor = query_params.get("cursor", "")
+        limit = query_params.get("limit", "")
+
+        if not site_id:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "site id missing or empty.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if not limit:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "limit is required.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            bit_from = query_params.get("bit_from", "")
+            bit_from = int(bit_from) if bit_from else None
+            bit_to = query_params.get("bit_to", "")
+            bit_to = int(bit_to) if bit_to else None
+            limit = min(int(limit), constants.Manifest.MAX_LOG_PAGE_SIZE)
+        except ValueError:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "bit_from, bit_to and limit should be numbers.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            data_contains = json.loads(contains) if contains else None
+        except ValueError:
+            data_contains = None
+        if contains and not isinstance(data_contains, dict):
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "contains should be a JSON object.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        site = user_controller.get_site_by_id(site_id=site_id)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            user_controller.check_user_site_mapping(user=user, site=site)
+
+        manifest_controller = controllers.ManifestController()
+        if not file_version:
+            file_version = manifest_controller.get_primary_file_version(
+                site=site
+            )
+
+        data_keys = [key.strip() for key in fields.split(",") if key.strip()]
+        manifest_logs = manifest_controller.get_manifest_logs(
+            site=site,
+            file_version=file_version,
+            bit_from=bit_from,
+            bit_to=bit_to,
+            reported_on=reported_on,
+            data_contains=data_contains,
+            data_keys=data_keys,
+        )
+
+        pagination = custom_pagination.Pagination()
+        rows, next_cursor = pagination.get_cursor_paginated_response(
+            queryset=manifest_logs,
+            cursor=cursor,
+            limit=limit,
+            ordering=["subtopic_bit_no", "id"],
+        )
+        if data_keys:
+            for row in rows:
+                row["data"] = {
+                    key: row.pop(f"data_{index}")
+                    for index, key in enumerate(data_keys)
+                }
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "file_version": file_version,
+                "next_cursor": next_cursor,
+                "data": rows,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ManifestJob(views.APIView):
+    """
+    API endpoint to report the progress and outcome of a queued manifest job.
+    """
+
+    def get(self, request, job_id):
+        user = request.user
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Only Admin have access to this API.",
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        manifest_job_controller = controllers.ManifestJobController()
+        manifest_job = manifest_job_controller.get_manifest_job_by_id(
+            job_id=job_id
+        )
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "data": serializers.ManifestJobSerializer(manifest_job).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class GithubCacheStats(views.APIView):
+    """
+    API endpoint to report the hit and miss metrics of the GitHub response cache.
+    """
+
+    def get(self, request):
+        user = request.user
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Only Admin have access to this API.",
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        manifest_controller = controllers.ManifestController()
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "data": manifest_controller.get_github_response_cache_stats(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ManifestDiff(views.APIView):
+    """
+    API endpoint to compare the subtopics of two manifest versions of a site.
+    """
+
+    def get(self, request):
+        user = request.user
+        query_params = request.query_params
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Only Admin have access to this API.",
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        site_id = query_params.get("site_id", "")
+        from_version = query_params.get("from_version", "")
+        to_version = query_params.get("to_version", "")
+
+        if not (site_id and from_version and to_version):
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "site_id, from_version and to_version are required.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        site = user_controller.get_site_by_id(site_id=site_id)
+        manifest_controller = controllers.ManifestController()
+        diff = manifest_controller.get_manifest_version_diff(
+            site=site, from_version=from_version, to_version=to_version
+        )
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "from_version": from_version,
+                "to_version": to_version,
+                "added_count": len(diff["added"]),
+                "removed_count": len(diff["removed"]),
+                "changed_count": len(diff["changed"]),
+                "data": diff,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ManifestDecode(views.APIView):
+    """
+    API endpoint to decode telemetry bitfields of a site into manifest subtopics.
+    """
+
+    def get(self, request):
+        user = request.user
+        query_params = request.query_params
+
+        site_id = query_params.get("site_id", "")
+        values = query_params.get("values", "")
+
+        if not (site_id and values):
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "site_id and values are required.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            values = [int(value) for value in values.split(",")]
+        except ValueError:
+            values = None
+        if not values or any(value < 0 for value in values):
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "values should be comma separated non-negative "
+                    "integers.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(values) > constants.Manifest.MAX_DECODE_VALUES:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": f"At most {constants.Manifest.MAX_DECODE_VALUES} "
+                    f"values can be decoded at once.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        site = user_controller.get_site_by_id(site_id=site_id)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            user_controller.check_user_site_mapping(user=user, site=site)
+
+        manifest_controller = controllers.ManifestController()
+        (
+            file_version,
+            decoded_values,
+        ) = manifest_controller.decode_manifest_bitfields(
+            site=site, values=values
+        )
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Success",
+                "file_version": file_version,
+                "data": decoded_values,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ManifestSyncRuns(views.APIView):
+    """
+    API endpoint to list the manifest sync cron runs with their per-site outcome.
+    """
+
+    def get(self, request):
+        user = request.user
+        query_params = request.query_params
+
+        user_controller = user_controllers.UserController()
+        user_profile = user_controller.get_user_profile_by_user(user=user)
+        if not user_profile.user_type.id == constants.UserTypeNames.ADMIN:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Only Admin have access to this API.",
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        site_id = query_params.get("site_id", "")
+        run_status = query_params.get("status", "")
+        limit = query_params.get("limit", "")
+        offset = query_params.get("offset", 0)
+
+        if not limit:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "limit is required.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
+
+        sync_run_controller = controllers.ManifestSyncRunController()
+        sync_runs = sync_run_controller.get_manifest_sync_runs(
+            site_id=site_id, status=run_status
         )
 
         pagination = custom_pagination.Pagination()
         serialized_data, next_link = pagination.get_paginated_response(
-            site_manifest_version_history_objects,
+            sync_runs,
             offset,
             limit,
-            serializers.ManifestHistorySerializer,
+            serializers.ManifestSyncRunSerializer,
         )
 
         return response.Response(
             {
                 "result": True,
                 "msg": "Success",
-                "preference_company_id": preference_company_id,
-                "preference_site_id": preference_site_id,
-                "version_history_count": site_manifest_version_history_objects.count(),
                 "next_link": next_link,
                 "data": serialized_data,
             },
             status=status.HTTP_200_OK,
         )
+
+
+class GithubWebhook(views.APIView):
+    """
+    API endpoint to receive GitHub push webhooks and queue a resync of the pushed site manifest.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        body = request.body
+        signature = request.headers.get("X-Hub-Signature-256", "")
+        event = request.headers.get("X-GitHub-Event", "")
+
+        if not github_client.verify_webhook_signature(
+            body=body,
+            signature=signature,
+            secret=settings.GITHUB_WEBHOOK_SECRET,
+        ):
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Invalid webhook signature.",
+                },
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        if event == constants.GithubWebhookEvents.PING:
+            return response.Response(
+                {
+                    "result": True,
+                    "msg": "pong",
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        if event != constants.GithubWebhookEvents.PUSH:
+            return response.Response(
+                {
+                    "result": True,
+                    "msg": f"Ignored {event} event.",
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Invalid webhook payload.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        repository = payload.get("repository") or {}
+        owner, _, repo = repository.get("full_name", "").partition("/")
+        manifest_controller = controllers.ManifestController()
+        site_manifest = manifest_controller.get_site_manifest_by_repo(
+            owner=owner, repo=repo
+        )
+        if site_manifest is None:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Repository is not linked to any site.",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        default_branch_ref = f"refs/heads/{repository.get('default_branch')}"
+        manifest_paths = [
+            path
+            for path in github_client.get_push_changed_paths(payload)
+            if manifest_controller.is_manifest_path(path)
+        ]
+        if payload.get("ref") != default_branch_ref or not manifest_paths:
+            return response.Response(
+                {
+                    "result": True,
+                    "msg": "No manifest files changed.",
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        manifest_job_controller = controllers.ManifestJobController()
+        manifest_job = manifest_job_controller.create_resync_job(
+            site_manifest=site_manifest,
+            paths=manifest_paths,
+            commit_sha=payload.get("after"),
+        )
+
+        return response.Response(
+            {
+                "result": True,
+                "msg": "Manifest resync queued.",
+                "data": {"job_id": manifest_job.id, "paths": manifest_paths},
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
@@ -92,6 +92,13 @@ SORT_ORDER_OPTIONS = {
     "descending": 2,
 }
 
+USER_SORT_FIELDS = {
+    "first_name": "user_first_name",
+    "last_name": "user_last_name",
+    "company": "company_name",
+    "site": "site_name",
+}
+
 
 BASE_FROM_EMAIL = {
     "LOCAL": "info@aquacycl.com",
@@ -115,9 +122,45 @@ class DesignationNames:
     OTHERS = 7
 
 
+class UserCountModes:
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    NONE = "none"
+
+
 class Manifest:
     GITHUB_DOMAIN = "github.com"
     OWNER = "AquaCycl"
     REPO_NAME_HEADER = "siteDeployment"
     SUBTOPIC_BIT_NUMBER = "subtopicBitNumber"
     SUBTOPIC_REPORTED_ON = "subtopicReportedOn"
+    CONFIG_FILE_NAME = "config.json"
+    MAX_LOG_PAGE_SIZE = 1000
+    MAX_VALIDATION_ERRORS = 100
+    MAX_DECODE_VALUES = 100
+
+
+class GithubWebhookEvents:
+    PING = "ping"
+    PUSH = "push"
+
+
+class ManifestJobTypes:
+    VALIDATE = "validate"
+    RESYNC = "resync"
+
+
+class ManifestJobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ManifestSyncStatus:
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SYNCED = "synced"
+    SKIPPED = "skipped"
+    LOCKED = "locked"
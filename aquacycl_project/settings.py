@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "users",
@@ -108,6 +109,9 @@ CORS_ALLOW_HEADERS = [
     "Access-Control-Allow-Origin",
 ]
 
+# Lets browser clients read the cursor of the next page of a csv export
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor"]
+
 CORS_ALLOW_METHODS = [
     "DELETE",
     "GET",
@@ -282,8 +286,60 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "aquacycl_project/static"),
 ]
 
+# Local memory cache by default, set CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache and CACHE_LOCATION to a
+# directory to share the cache between processes on the same host
+CACHES = {
+    "default": {
+        "BACKEND": env(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": env("CACHE_LOCATION", default="aquacycl"),
+    }
+}
+
 GITHUB_USERNAME = env("GITHUB_USERNAME")
 GITHUB_TOKEN = env("GITHUB_TOKEN")
+GITHUB_API_URL = env("GITHUB_API_URL", default="https://api.github.com")
+GITHUB_REQUEST_TIMEOUT = env.int("GITHUB_REQUEST_TIMEOUT", default=30)
+GITHUB_WEBHOOK_SECRET = env("GITHUB_WEBHOOK_SECRET", default="")
+# Seconds a cached GitHub response is kept after it was last used
+GITHUB_RESPONSE_CACHE_TTL = env.int(
+    "GITHUB_RESPONSE_CACHE_TTL", default=7 * 24 * 60 * 60
+)
+
+# Manifest sync
+MANIFEST_SYNC_WORKERS = env.int("MANIFEST_SYNC_WORKERS", default=4)
+MANIFEST_SYNC_MAX_RETRIES = env.int("MANIFEST_SYNC_MAX_RETRIES", default=3)
+MANIFEST_SYNC_MAX_BACKOFF = env.int("MANIFEST_SYNC_MAX_BACKOFF", default=300)
+MANIFEST_LOAD_CHUNK_SIZE = env.int("MANIFEST_LOAD_CHUNK_SIZE", default=1000)
+MANIFEST_JOB_TIMEOUT = env.int("MANIFEST_JOB_TIMEOUT", default=1800)
+MANIFEST_JOB_MAX_ATTEMPTS = env.int("MANIFEST_JOB_MAX_ATTEMPTS", default=3)
+MANIFEST_JOB_POLL_INTERVAL = env.int("MANIFEST_JOB_POLL_INTERVAL", default=5)
+MANIFEST_LOOKUP_TTL = env.int("MANIFEST_LOOKUP_TTL", default=30)
+# keeps a columnar cache of primary manifests for the lookup table
+MANIFEST_COLUMNAR_STORAGE = env.bool(
+    "MANIFEST_COLUMNAR_STORAGE", default=False
+)
+MANIFEST_HISTORY_CACHE = env("MANIFEST_HISTORY_CACHE", default="default")
+MANIFEST_HISTORY_CACHE_TIMEOUT = env.int(
+    "MANIFEST_HISTORY_CACHE_TIMEOUT", default=300
+)
+MANIFEST_DIFF_CACHE_TIMEOUT = env.int(
+    "MANIFEST_DIFF_CACHE_TIMEOUT", default=24 * 60 * 60
+)
+# Bytes of a downloaded manifest blob kept in memory before it is spooled
+# to a temporary file, and size of the chunks read from the download stream
+MANIFEST_BLOB_MEMORY_LIMIT = env.int(
+    "MANIFEST_BLOB_MEMORY_LIMIT", default=8 * 1024 * 1024
+)
+MANIFEST_DOWNLOAD_CHUNK_SIZE = env.int(
+    "MANIFEST_DOWNLOAD_CHUNK_SIZE", default=64 * 1024
+)
+
+# User export
+USER_EXPORT_CHUNK_SIZE = env.int("USER_EXPORT_CHUNK_SIZE", default=2000)
 
 CRONJOBS = [
     (
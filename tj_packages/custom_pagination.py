@@ -1,9 +1,27 @@
+import base64
+import datetime
+import json
 import typing
 
-from django.db.models import QuerySet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
 from rest_framework import serializers
 
 
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds of datetime cursor values, which DjangoJSONEncoder
+    truncates to milliseconds, so that rows sharing a millisecond are neither
+    skipped nor repeated across pages
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
 class Pagination:
     def get_paginated_response(
         self,
@@ -72,3 +90,114 @@ class Pagination:
             next_link = False
             serialized_data = serializer_data.data
         return serialized_data, next_link, total_count
+
+    def encode_cursor(self, values: list) -> str:
+        return base64.urlsafe_b64encode(
+            json.dumps(values, cls=CursorJSONEncoder).encode("utf-8")
+        ).decode("utf-8")
+
+    def decode_cursor(self, cursor: str, ordering: list) -> list:
+        try:
+            values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode("utf-8"))
+            )
+        except (ValueError, TypeError):
+            values = None
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise serializers.ValidationError(
+                {"result": False, "msg": "Invalid cursor"},
+                code="validation_error",
+            )
+        return values
+
+    def get_cursor_filter(self, ordering: list, values: list) -> Q:
+        """
+        Builds the keyset predicate selecting the rows that come after the
+        given cursor values, following PostgreSQL ordering of NULL values
+        (last for ascending and first for descending columns)
+        """
+        cursor_filter = Q()
+        equal_filter = Q()
+        for field, value in zip(ordering, values):
+            descending = field.startswith("-")
+            field = field.lstrip("-")
+            if value is None:
+                after_filter = (
+                    Q(**{f"{field}__isnull": False}) if descending else None
+                )
+                current_equal_filter = Q(**{f"{field}__isnull": True})
+            elif descending:
+                after_filter = Q(**{f"{field}__lt": value})
+                current_equal_filter = Q(**{field: value})
+            else:
+                after_filter = Q(**{f"{field}__gt": value}) | Q(
+                    **{f"{field}__isnull": True}
+                )
+                current_equal_filter = Q(**{field: value})
+            if after_filter is not None:
+                cursor_filter |= equal_filter & after_filter
+            equal_filter &= current_equal_filter
+        return cursor_filter
+
+    def get_cursor_paginated_response(
+        self,
+        queryset: QuerySet,
+        cursor: str,
+        limit: int,
+        ordering: list,
+        Serializer: serializers.Serializer = None,
+    ) -> typing.Tuple[list, str]:
+        """
+        Keyset pagination over the given ordering. The ordering must end with a
+        unique field (eg: id) so that every row has a distinct position.
+        Returns the page and an opaque cursor for the next page, or None when
+        there are no more rows.
+        """
+        try:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError(limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                {"result": False, "msg": "limit should be a number"},
+                code="validation_error",
+            )
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            values = self.decode_cursor(cursor=cursor, ordering=ordering)
+            queryset = queryset.filter(
+                self.get_cursor_filter(ordering=ordering, values=values)
+            )
+        rows = list(queryset[: limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_row = rows[-1]
+            next_cursor = self.encode_cursor(
+                [
+                    last_row[field.lstrip("-")]
+                    if isinstance(last_row, dict)
+                    else getattr(last_row, field.lstrip("-"))
+                    for field in ordering
+                ]
+            )
+        if Serializer is not None:
+            rows = Serializer(rows, many=True).data
+        return rows, next_cursor
+
+    def get_estimated_count(self, queryset: QuerySet) -> int:
+        """
+        Returns the row count estimated by the PostgreSQL planner for the
+        queryset instead of counting the rows, falling back to an exact count
+        on other databases
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return queryset.count()
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
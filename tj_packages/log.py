@@ -20,6 +20,20 @@ def _generate_log(path):
     return logger
 
 
+def get_logger(name):
+    """Create an info level logger writing to stdout, which the cron jobs
+    append to constants.LOG_PATH."""
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    log_format = "%(levelname)s %(asctime)s %(message)s"
+    formatter = logging.Formatter(log_format)
+    stream_handler.setFormatter(formatter)
+    if not logger.handlers:
+        logger.addHandler(stream_handler)
+    return logger
+
+
 def log_error(path="log/errors.log"):
     def error_log(func):
         @functools.wraps(func)
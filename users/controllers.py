@@ -1,3 +1,4 @@
+import csv
 import datetime
 import secrets
 import string
@@ -5,19 +6,26 @@ import typing
 
 from django.contrib import auth
 from django.contrib.auth.hashers import check_password
+from django.contrib.postgres.search import TrigramSimilarity
 from django.core import exceptions, validators
 from django.db import models as django_models
-from django.db.models import Case, F, Prefetch, Q, Value, When
-from django.db.models.functions import Coalesce, Concat
+from django.db.models import F, Prefetch, Q, Value
+from django.db.models.functions import Cast, Concat, Greatest
 from rest_framework import serializers
 
 from aquacycl_project import constants, settings
-from tj_packages import encrypt_decrypt
+from tj_packages import custom_pagination, encrypt_decrypt
 from users import mailing, models
 
 User = auth.get_user_model()
 
 
+class _EchoBuffer:
+    # csv.writer target that hands each formatted line back to the caller
+    def write(self, value: str) -> str:
+        return value
+
+
 class CommonController:
     """
     To check if the user has verified the email via verification link
@@ -827,79 +835,37 @@ class UserController:
     def get_all_users(
         self,
         user_type_id: int,
-    ) -> models.User:
+    ) -> models.UserDirectory:
         """
-        To retrieve a queryset of all users for a given user type with prefetch on userprofiledetails, usersitemapping
+        To retrieve a queryset of all users for a given user type from the user directory,
+        with one row per user site mapping
         Params:
             user_type_id: id of given user type (staff, customer, admin)
         Returns:
-            user_objects: Queryset of all the user objects
+            user_objects: Queryset of the user directory rows as dictionaries
         """
         return (
-            models.User.objects.filter(
-                userprofiledetails__user_type_id=user_type_id,
-            )
-            .prefetch_related(
-                Prefetch(
-                    "userprofiledetails",
-                    queryset=models.UserProfileDetails.objects.select_related(
-                        "designation"
-                    ),
-                ),
-                Prefetch(
-                    "usersitemapping_set",
-                    queryset=models.UserSiteMapping.objects.select_related(
-                        "site__company"
-                    ),
-                ),
-            )
-            .annotate(
-                is_user_signup_complete=Case(
-                    When(
-                        userprofiledetails__date_joined__isnull=True,
-                        then=Value(False),
-                    ),
-                    default=Value(True),
-                    output_field=django_models.BooleanField(),
-                ),
-            )
-            .annotate(
-                user_site_mapping_is_active=Coalesce(
-                    "usersitemapping__is_active",
-                    Case(
-                        When(
-                            userprofiledetails__is_disabled=True,
-                            then=Value(False),
-                        ),
-                        default=Value(True),
-                        output_field=django_models.BooleanField(),
-                    ),
-                    output_field=django_models.BooleanField(),
-                ),
-            )
+            models.UserDirectory.objects.filter(user_type_id=user_type_id)
             .values(
-                user_id=F("id"),
-                user_site_mapping_id=F("usersitemapping__id"),
-                is_user_signup_complete=F("is_user_signup_complete"),
-                user_first_name=F("first_name"),
-                user_last_name=F("last_name"),
-                user_email=F("email"),
-                company_id=F("usersitemapping__site__company_id"),
-                company_name=F("usersitemapping__site__company__name"),
-                site_id=F("usersitemapping__site_id"),
-                site_name=F("usersitemapping__site__name"),
-                country_code=F("userprofiledetails__country_code"),
-                mobile_number=F("userprofiledetails__mobile_number"),
-                user_site_mapping_is_active=F("user_site_mapping_is_active"),
-            )
-            .order_by(
-                "-userprofiledetails__updated_on",
-                "-usersitemapping__updated_on",
+                "user_id",
+                "user_site_mapping_id",
+                "is_user_signup_complete",
+                "user_first_name",
+                "user_last_name",
+                "user_email",
+                "company_id",
+                "company_name",
+                "site_id",
+                "site_name",
+                "country_code",
+                "mobile_number",
+                "user_site_mapping_is_active",
             )
+            .order_by("-profile_updated_on", "-site_mapping_updated_on", "-id")
         )
 
     def convert_user_objects_to_list_for_csv(
-        self, user_type_id: int, user_objects: models.User
+        self, user_type_id: int, user_objects: models.UserDirectory
     ) -> tuple:
         """
         To convert the user objects queryset into a list of tuples for CSV
@@ -911,61 +877,61 @@ class UserController:
             user_objects: List of tuples queryset of user objects
         """
         has_non_blank_others_designation = user_objects.filter(
-            userprofiledetails__others_designation_name__isnull=False,
-            userprofiledetails__others_designation_name__gt="",
+            others_designation_name__isnull=False,
+            others_designation_name__gt="",
         ).exists()
 
         user_objects = user_objects.annotate(
             user_mobile_number=Concat(
-                F("userprofiledetails__country_code"),
+                F("country_code"),
                 Value(" "),
-                F("userprofiledetails__mobile_number"),
+                F("mobile_number"),
                 output_field=django_models.CharField(),
             ),
         )
 
         if user_type_id == constants.UserTypeNames.CUSTOMER:
             values_list_fields = [
-                "first_name",
-                "last_name",
-                "email",
+                "user_first_name",
+                "user_last_name",
+                "user_email",
                 "user_mobile_number",
-                "usersitemapping__site__company__name",
-                "usersitemapping__site__name",
-                "userprofiledetails__designation__name",
+                "company_name",
+                "site_name",
+                "designation_name",
             ]
             if has_non_blank_others_designation:
                 values_list_fields.extend(
                     [
-                        "userprofiledetails__others_designation_name",
+                        "others_designation_name",
                     ]
                 )
             values_list_fields.extend(
                 [
-                    "userprofiledetails__site_address",
-                    "userprofiledetails__date_joined",
+                    "site_address",
+                    "date_joined",
                 ]
             )
 
         else:
             values_list_fields = [
-                "first_name",
-                "last_name",
-                "email",
+                "user_first_name",
+                "user_last_name",
+                "user_email",
                 "user_mobile_number",
-                "usersitemapping__site__company__name",
-                "usersitemapping__site__name",
-                "userprofiledetails__designation__name",
+                "company_name",
+                "site_name",
+                "designation_name",
             ]
             if has_non_blank_others_designation:
                 values_list_fields.extend(
                     [
-                        "userprofiledetails__others_designation_name",
+                        "others_designation_name",
                     ]
                 )
             values_list_fields.extend(
                 [
-                    "userprofiledetails__date_joined",
+                    "date_joined",
                 ]
             )
 
@@ -973,18 +939,84 @@ class UserController:
 
         return (has_non_blank_others_designation, user_objects)
 
+    def get_user_csv_headers(
+        self, user_type_id: int, has_non_blank_others_designation: bool
+    ) -> list:
+        """
+        To get the header row of the user CSV export
+        Params:
+            user_type_id: id of given user type (staff, customer)
+            has_non_blank_others_designation: whether the other designation name column is exported
+        Returns:
+            headers: List of the column names
+        """
+        headers = [
+            "First name",
+            "Last name",
+            "Email",
+            "Mobile number",
+            "Company",
+            "Site",
+            "Designation",
+        ]
+        if has_non_blank_others_designation:
+            headers.extend(["Other designation name"])
+        headers.extend(
+            ["Site Address", "Date joined"]
+            if user_type_id == constants.UserTypeNames.CUSTOMER
+            else ["Date joined"]
+        )
+        return headers
+
+    def iter_user_csv_rows(self, user_objects: typing.Iterable):
+        """
+        To format the user tuples returned by convert_user_objects_to_list_for_csv as CSV rows
+        Params:
+            user_objects: Iterable of the user tuples ending on the date joined
+        Yields:
+            row: List of the column values with the date joined formatted
+        """
+        for user_object in user_objects:
+            date_joined = (
+                user_object[-1].strftime(constants.DATE_FORMAT)
+                if isinstance(user_object[-1], datetime.date)
+                else user_object[-1]
+            )
+            yield list(user_object[:-1]) + [date_joined]
+
+    def iter_user_csv_lines(
+        self, headers: list, user_objects: django_models.QuerySet
+    ):
+        """
+        To stream the user CSV export line by line. The queryset is read through a server
+        side cursor in chunks of settings.USER_EXPORT_CHUNK_SIZE rows, so memory use does
+        not grow with the export and no count query is made.
+        Params:
+            headers: List of the column names
+            user_objects: Queryset of the user tuples ending on the date joined
+        Yields:
+            line: CSV formatted line
+        """
+        writer = csv.writer(_EchoBuffer())
+        yield writer.writerow(headers)
+        for row in self.iter_user_csv_rows(
+            user_objects.iterator(chunk_size=settings.USER_EXPORT_CHUNK_SIZE)
+        ):
+            yield writer.writerow(row)
+
     def get_user_objects_by_search(
         self,
-        user_objects: models.User,
+        user_objects: models.UserDirectory,
         search_text: str,
-    ) -> models.User:
+    ) -> models.UserDirectory:
         """
         To retrieve a queryset of user objects for a given search text
         Params:
             user_objects: Queryset of the user objects
             search_text: Text to search for
         Returns:
-            user_objects: Queryset of filtered user objects based on the search text
+            user_objects: Queryset of filtered user objects based on the search text, ranked by
+                          the trigram similarity of the best matching name, email, company or site
         """
 
         try:
@@ -994,24 +1026,69 @@ class UserController:
             first = search_text.split(" ")[0]
             last = ""
 
-        return user_objects.filter(
+        # each table is searched on its own so that every icontains predicate
+        # can use the trigram index of its column, the rows are then matched
+        # by id instead of ORing predicates across the joined tables
+        matching_user_ids = models.User.objects.filter(
             (Q(first_name__icontains=first) & Q(last_name__icontains=last))
             | Q(first_name__icontains=search_text)
             | Q(last_name__icontains=search_text)
             | Q(email__icontains=search_text)
-            | Q(country_code__icontains=search_text)
+        ).values("id")
+        matching_profile_user_ids = models.UserProfileDetails.objects.filter(
+            Q(country_code__icontains=search_text)
             | Q(mobile_number__icontains=search_text)
-            | Q(company_name__icontains=search_text)
-            | Q(site_name__icontains=search_text)
-            | Q(userprofiledetails__designation__name__icontains=search_text)
-            | Q(userprofiledetails__site_address__icontains=search_text)
-        ).order_by("-userprofiledetails__updated_on")
+            | Q(site_address__icontains=search_text)
+            | Q(
+                designation_id__in=models.DesignationMaster.objects.filter(
+                    name__icontains=search_text
+                ).values("id")
+            )
+        ).values("user_id")
+        matching_site_ids = models.Site.objects.filter(
+            Q(name__icontains=search_text)
+            | Q(
+                company_id__in=models.Company.objects.filter(
+                    name__icontains=search_text
+                ).values("id")
+            )
+        ).values("id")
+
+        return (
+            user_objects.filter(
+                Q(user_id__in=matching_user_ids)
+                | Q(user_id__in=matching_profile_user_ids)
+                | Q(site_id__in=matching_site_ids)
+            )
+            .alias(
+                # similarity() returns real, which cursors would compare to
+                # their double precision values, so the rank is cast to double
+                search_rank=Cast(
+                    Greatest(
+                        TrigramSimilarity(
+                            Concat(
+                                F("user_first_name"),
+                                Value(" "),
+                                F("user_last_name"),
+                                output_field=django_models.CharField(),
+                            ),
+                            search_text,
+                        ),
+                        TrigramSimilarity("user_email", search_text),
+                        TrigramSimilarity("company_name", search_text),
+                        TrigramSimilarity("site_name", search_text),
+                    ),
+                    output_field=django_models.FloatField(),
+                )
+            )
+            .order_by("-search_rank", "-profile_updated_on", "-id")
+        )
 
     def get_user_objects_by_company(
         self,
-        user_objects: models.User,
+        user_objects: models.UserDirectory,
         company_filter: list,
-    ) -> models.User:
+    ) -> models.UserDirectory:
         """
         To retrieve a queryset of user objects based on the list of company ids filter
         Params:
@@ -1020,15 +1097,13 @@ class UserController:
         Returns:
             user_objects: Queryset of filtered user objects based on the list of company ids
         """
-        return user_objects.filter(company_id__in=company_filter).order_by(
-            "-userprofiledetails__updated_on"
-        )
+        return user_objects.filter(company_id__in=company_filter)
 
     def get_user_objects_by_site(
         self,
-        user_objects: models.User,
+        user_objects: models.UserDirectory,
         site_filter: list,
-    ) -> models.User:
+    ) -> models.UserDirectory:
         """
         To retrieve a queryset of user objects based on the list of site ids filter
         Params:
@@ -1037,9 +1112,7 @@ class UserController:
         Returns:
             user_objects: Queryset of filtered user objects based on the list of site ids
         """
-        return user_objects.filter(site_id__in=site_filter).order_by(
-            "-userprofiledetails__updated_on"
-        )
+        return user_objects.filter(site_id__in=site_filter)
 
     def get_sort_field(
         self,
@@ -1054,69 +1127,76 @@ class UserController:
         """
         return ("" if sort_order[1] == 1 else "-") + sort_order[0]
 
-    def get_user_objects_first_name_sorted(
-        self,
-        user_objects: models.User,
-        first_name_sort: tuple,
-    ) -> models.User:
-        """
-        To sort the given user queryset based on first name and given sort order
-        Params:
-            user_objects: Queryset of the user objects
-            first_name_sort: Tuple of (sort_field, sort_order)
-        Returns:
-            user_objects: sorted user queryset based on first name and given sort order
-        """
-        sort_field = self.get_sort_field(sort_order=first_name_sort)
-        return user_objects.order_by(sort_field)
-
-    def get_user_objects_last_name_sorted(
-        self,
-        user_objects: models.User,
-        last_name_sort: tuple,
-    ) -> models.User:
-        """
-        To sort the given user queryset based on last name and given sort order
-        Params:
-            user_objects: Queryset of the user objects
-            last_name_sort: Tuple of (sort_field, sort_order)
-        Returns:
-            user_objects: sorted user queryset based on last name and given sort order
-        """
-        sort_field = self.get_sort_field(sort_order=last_name_sort)
-        return user_objects.order_by(sort_field)
-
-    def get_user_objects_company_sorted(
-        self,
-        user_objects: models.User,
-        company_sort: tuple,
-    ) -> models.User:
+    def get_sort_spec(self, sort: list, legacy_sorts: list) -> list:
         """
-        To sort the given user queryset based on company name and given sort order
+        To validate the requested sort keys and merge them with the single column sort
+        params, which are appended in the order given for keys the sort list does not name
         Params:
-            user_objects: Queryset of the user objects
-            company_sort: Tuple of (sort_field, sort_order)
+            sort: List of (sort_key, sort_order) pairs in priority order
+            legacy_sorts: List of (sort_key, sort_order) pairs of the single column sort
+                          params, sort_order 0 when the param is not set
         Returns:
-            user_objects: sorted user queryset based on company name and given sort order
+            sort_spec: List of (sort_field, sort_order) pairs in priority order
         """
-        sort_field = self.get_sort_field(sort_order=company_sort)
-        return user_objects.order_by(sort_field)
+        sort_orders = [
+            order for order in constants.SORT_ORDER_OPTIONS.values() if order
+        ]
+        sort_spec = []
+        sort_keys = set()
+        try:
+            for sort_key, sort_order in sort:
+                if (
+                    sort_key not in constants.USER_SORT_FIELDS
+                    or sort_key in sort_keys
+                    or int(sort_order) not in sort_orders
+                ):
+                    raise ValueError(sort_key)
+                sort_keys.add(sort_key)
+                sort_spec.append(
+                    (constants.USER_SORT_FIELDS[sort_key], int(sort_order))
+                )
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {
+                    "result": False,
+                    "msg": "Invalid sort",
+                    "validation_error_field": "sort",
+                },
+                code="validation_error",
+            )
+        for sort_key, sort_order in legacy_sorts:
+            if sort_order and sort_key not in sort_keys:
+                sort_keys.add(sort_key)
+                sort_spec.append(
+                    (constants.USER_SORT_FIELDS[sort_key], sort_order)
+                )
+        return sort_spec
 
-    def get_user_objects_site_sorted(
+    def get_user_objects_sorted(
         self,
-        user_objects: models.User,
-        site_sort: tuple,
-    ) -> models.User:
+        user_objects: models.UserDirectory,
+        sort_spec: list,
+    ) -> models.UserDirectory:
         """
-        To sort the given user queryset based on site name and given sort order
+        To sort the given user queryset on every field of the sort spec in priority order.
+        Rows are tie broken on the directory row id, in the direction of the last sort field
+        so that a single field sort reads its (user_type, field, id) index in one direction.
         Params:
             user_objects: Queryset of the user objects
-            site_sort: Tuple of (sort_field, sort_order)
+            sort_spec: List of (sort_field, sort_order) pairs in priority order
         Returns:
-            user_objects: sorted user queryset based on site name and given sort order
-        """
-        sorted_field = self.get_sort_field(sort_order=site_sort)
-        return user_objects.order_by(sorted_field)
+            user_objects: sorted user queryset, left in its current order if the spec is empty
+        """
+        if not sort_spec:
+            return user_objects
+        ordering = [
+            self.get_sort_field(sort_order=sort_order)
+            for sort_order in sort_spec
+        ]
+        ordering.append(
+            self.get_sort_field(sort_order=("id", sort_spec[-1][1]))
+        )
+        return user_objects.order_by(*ordering)
 
     def get_paginated_response(
         self,
@@ -1137,22 +1217,111 @@ class UserController:
         try:
             offset = int(offset)
             previous_limit = int(limit)
+            if offset < 0 or previous_limit < 1:
+                raise ValueError(offset, previous_limit)
         except ValueError:
             raise serializers.ValidationError(
                 {"result": False, "msg": "limit or offset should be numbers"},
                 code="validation_error",
             )
 
-        limit = offset + previous_limit
-        queryset_data = queryset[int(offset) : limit]
+        # one extra row tells whether a next page exists without counting
+        # or fetching the rest of the queryset
+        user_data = list(queryset[offset : offset + previous_limit + 1])
+        next_link = len(user_data) > previous_limit
+        return user_data[:previous_limit], next_link
 
-        if len(queryset) > limit:
-            next_link = True
-            user_data = queryset_data
-        else:
-            next_link = False
-            user_data = queryset_data
-        return user_data, next_link
+    def get_cursor_paginated_response(
+        self,
+        queryset: django_models.QuerySet,
+        cursor: str,
+        limit: int,
+    ) -> typing.Tuple[list, str]:
+        """
+        Keyset pagination method for user queryset, keyed on the active sort columns of the
+        queryset, with the user directory row id appended when the sort does not include it
+        Params:
+            queryset: Queryset of the user objects as dictionaries or tuples
+            cursor: Opaque cursor returned for the previous page, empty for the first page
+            limit: Pagination limit
+        Returns:
+            user_data: List of the user objects of the page
+            next_cursor: Cursor of the next page, None if there are no more rows
+        """
+        try:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError(limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                {"result": False, "msg": "limit should be a number"},
+                code="validation_error",
+            )
+
+        cursor_fields = {}
+        ordering = []
+        for index, field in enumerate(queryset.query.order_by):
+            cursor_fields[f"cursor_{index}"] = F(field.lstrip("-"))
+            ordering.append(
+                ("-" if field.startswith("-") else "") + f"cursor_{index}"
+            )
+        if "id" not in [
+            field.lstrip("-") for field in queryset.query.order_by
+        ]:
+            cursor_fields["cursor_id"] = F("id")
+            ordering.append("cursor_id")
+        queryset = queryset.annotate(**cursor_fields).order_by(*ordering)
+
+        pagination = custom_pagination.Pagination()
+        if cursor:
+            values = pagination.decode_cursor(cursor=cursor, ordering=ordering)
+            queryset = queryset.filter(
+                pagination.get_cursor_filter(ordering=ordering, values=values)
+            )
+        rows = list(queryset[: limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_row = rows[-1]
+            next_cursor = pagination.encode_cursor(
+                [last_row[name] for name in cursor_fields]
+                if isinstance(last_row, dict)
+                else list(last_row[-len(cursor_fields) :])
+            )
+
+        # annotations added after values_list are appended to each tuple
+        user_data = []
+        for row in rows:
+            if isinstance(row, dict):
+                for name in cursor_fields:
+                    row.pop(name)
+                user_data.append(row)
+            else:
+                user_data.append(row[: -len(cursor_fields)])
+        return user_data, next_cursor
+
+    def get_user_count(
+        self,
+        queryset: django_models.QuerySet,
+        count_mode: str = constants.UserCountModes.EXACT,
+    ) -> int:
+        """
+        To count the rows of a user queryset
+        Params:
+            queryset: Queryset of the user objects
+            count_mode: "exact" for a COUNT query, "estimated" for the planner estimate or
+                        "none" to skip counting
+        Returns:
+            user_count: Number of rows, estimated number of rows or None
+        """
+        if count_mode == constants.UserCountModes.NONE:
+            return None
+        if count_mode == constants.UserCountModes.ESTIMATED:
+            return custom_pagination.Pagination().get_estimated_count(
+                queryset=queryset
+            )
+        return queryset.count()
 
     def get_user_with_profile_and_site_by_id(
         self, user_id: int
@@ -0,0 +1,232 @@
+import zlib
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users import models
+
+REBUILD_BATCH_SIZE = 1000
+
+# First key of the two-key advisory lock space reserved for directory
+# refreshes, the second key is the user id or 0 for the whole directory
+USER_DIRECTORY_LOCK_NAMESPACE = zlib.crc32(b"users.user_directory") >> 1
+
+
+def build_user_directory_row(
+    user_profile: models.UserProfileDetails,
+    user_site_mapping: models.UserSiteMapping = None,
+) -> models.UserDirectory:
+    """
+    To build the directory row of a user profile and one of its site mappings
+    Params:
+        user_profile: profile of the user with its user and designation loaded
+        user_site_mapping: site mapping of the row, None for users without site mappings
+    Returns:
+        user_directory: unsaved directory row
+    """
+    user = user_profile.user
+    site = user_site_mapping.site if user_site_mapping else None
+    company = site.company if site else None
+    designation = user_profile.designation
+    return models.UserDirectory(
+        user_id=user_profile.user_id,
+        user_site_mapping=user_site_mapping,
+        user_type_id=user_profile.user_type_id,
+        is_user_signup_complete=user_profile.date_joined is not None,
+        user_first_name=user.first_name,
+        user_last_name=user.last_name,
+        user_email=user.email,
+        company=company,
+        company_name=company.name if company else None,
+        site=site,
+        site_name=site.name if site else None,
+        country_code=user_profile.country_code,
+        mobile_number=user_profile.mobile_number,
+        designation_name=designation.name if designation else None,
+        others_designation_name=user_profile.others_designation_name,
+        site_address=user_profile.site_address,
+        date_joined=user_profile.date_joined,
+        user_site_mapping_is_active=(
+            user_site_mapping.is_active
+            if user_site_mapping
+            else not user_profile.is_disabled
+        ),
+        profile_updated_on=user_profile.updated_on,
+        site_mapping_updated_on=(
+            user_site_mapping.updated_on if user_site_mapping else None
+        ),
+    )
+
+
+def iter_user_directory_rows(user_ids: list = None):
+    """
+    To build the directory rows of the given users, or of every user with a profile. Profiles
+    are read in batches of REBUILD_BATCH_SIZE along with the site mappings of the batch.
+    Params:
+        user_ids: ids of the users, None for every user
+    Yields:
+        user_directory: unsaved directory row
+    """
+    user_profiles = models.UserProfileDetails.objects.select_related(
+        "user", "designation"
+    ).order_by("id")
+    if user_ids is not None:
+        user_profiles = user_profiles.filter(user_id__in=user_ids)
+    last_user_profile_id = 0
+    while True:
+        batch = list(
+            user_profiles.filter(id__gt=last_user_profile_id)[
+                :REBUILD_BATCH_SIZE
+            ]
+        )
+        if not batch:
+            return
+        last_user_profile_id = batch[-1].id
+        user_site_mappings = {}
+        for user_site_mapping in (
+            models.UserSiteMapping.objects.select_related("site__company")
+            .filter(user_id__in=[profile.user_id for profile in batch])
+            .order_by("id")
+        ):
+            user_site_mappings.setdefault(
+                user_site_mapping.user_id, []
+            ).append(user_site_mapping)
+        for user_profile in batch:
+            for user_site_mapping in user_site_mappings.get(
+                user_profile.user_id
+            ) or [None]:
+                yield build_user_directory_row(
+                    user_profile=user_profile,
+                    user_site_mapping=user_site_mapping,
+                )
+
+
+def lock_user_directory(user_ids: list = None):
+    """
+    To hold the PostgreSQL advisory locks of a directory refresh until the current transaction
+    ends. A refresh of some users takes the lock of each user, in id order so that refreshes of
+    overlapping users cannot deadlock, and shares the whole directory lock that a full rebuild
+    takes exclusively. Other databases get no locking.
+    Params:
+        user_ids: ids of the users, None to lock the whole directory
+    Returns:
+        None
+    """
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        if user_ids is None:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, 0)",
+                [USER_DIRECTORY_LOCK_NAMESPACE],
+            )
+            return
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock_shared(%s, 0)",
+            [USER_DIRECTORY_LOCK_NAMESPACE],
+        )
+        for user_id in sorted(set(user_ids)):
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, %s)",
+                [USER_DIRECTORY_LOCK_NAMESPACE, user_id],
+            )
+
+
+def refresh_user_directory(user_ids: list = None) -> int:
+    """
+    To rebuild the directory rows of the given users, or the whole directory. Concurrent
+    refreshes of the same users are serialised so that they do not insert the same rows.
+    Params:
+        user_ids: ids of the users, None to rebuild every row
+    Returns:
+        row_count: number of rows written
+    """
+    user_directory_objects = models.UserDirectory.objects.all()
+    if user_ids is not None:
+        user_directory_objects = user_directory_objects.filter(
+            user_id__in=user_ids
+        )
+    row_count = 0
+    with transaction.atomic():
+        lock_user_directory(user_ids=user_ids)
+        user_directory_objects.delete()
+        batch = []
+        for user_directory in iter_user_directory_rows(user_ids=user_ids):
+            batch.append(user_directory)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                models.UserDirectory.objects.bulk_create(batch)
+                row_count += len(batch)
+                batch = []
+        models.UserDirectory.objects.bulk_create(batch)
+        row_count += len(batch)
+    return row_count
+
+
+def schedule_user_directory_refresh(user_id: int):
+    """
+    To rebuild the directory rows of a user once the current transaction commits, so that
+    rows are built from committed data and writes rolled back leave the directory alone
+    Params:
+        user_id: id of the user
+    Returns:
+        None
+    """
+    transaction.on_commit(lambda: refresh_user_directory(user_ids=[user_id]))
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.UserProfileDetails)
+@receiver(post_save, sender=models.UserProfileDetails)
+@receiver(post_delete, sender=models.UserSiteMapping)
+@receiver(post_save, sender=models.UserSiteMapping)
+def refresh_user_directory_of_instance(sender, instance, **kwargs):
+    """
+    To refresh the directory rows of the user of a saved or deleted user, profile or site
+    mapping. Site mappings created with bulk_create send no signal, the invite and site
+    update flows save the profile afterwards which refreshes the user.
+    """
+    update_fields = kwargs.get("update_fields")
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    user_id = instance.id if sender is models.User else instance.user_id
+    schedule_user_directory_refresh(user_id=user_id)
+
+
+@receiver(post_save, sender=models.Company)
+def update_user_directory_company_name(sender, instance, **kwargs):
+    """
+    To copy the name of a saved company to its directory rows
+    """
+    transaction.on_commit(
+        lambda: models.UserDirectory.objects.filter(company=instance).update(
+            company_name=instance.name
+        )
+    )
+
+
+@receiver(post_save, sender=models.Site)
+def update_user_directory_site_name(sender, instance, **kwargs):
+    """
+    To copy the name and company of a saved site to its directory rows
+    """
+    transaction.on_commit(
+        lambda: models.UserDirectory.objects.filter(site=instance).update(
+            site_name=instance.name,
+            company_id=instance.company_id,
+            company_name=instance.company.name,
+        )
+    )
+
+
+@receiver(post_save, sender=models.DesignationMaster)
+def update_user_directory_designation_name(sender, instance, **kwargs):
+    """
+    To copy the name of a saved designation to the directory rows of its users
+    """
+    transaction.on_commit(
+        lambda: models.UserDirectory.objects.filter(
+            user__userprofiledetails__designation=instance
+        ).update(designation_name=instance.name)
+    )
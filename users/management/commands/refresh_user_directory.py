@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from users import directory
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the user_directory read model from the user, profile and "
+        "site mapping tables, for writes that bypassed the model signals"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Rebuild only the rows of this user, can be repeated",
+        )
+
+    def handle(self, *args, **options):
+        row_count = directory.refresh_user_directory(
+            user_ids=options["user_ids"]
+        )
+        self.stdout.write(f"{row_count} user directory rows written")
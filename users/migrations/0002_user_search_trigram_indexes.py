@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-17 14:05
+
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # icontains is compiled to UPPER(column::text) LIKE UPPER(pattern),
+        # so the trigram indexes are built on that expression
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_first_name_trgm ON auth_user USING gin ((UPPER(first_name::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_first_name_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_last_name_trgm ON auth_user USING gin ((UPPER(last_name::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_last_name_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_email_trgm ON auth_user USING gin ((UPPER(email::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_email_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS user_profile_details_country_code_trgm ON user_profile_details USING gin ((UPPER(country_code::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS user_profile_details_country_code_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS user_profile_details_mobile_number_trgm ON user_profile_details USING gin ((UPPER(mobile_number::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS user_profile_details_mobile_number_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS user_profile_details_site_address_trgm ON user_profile_details USING gin ((UPPER(site_address::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS user_profile_details_site_address_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS designation_master_name_trgm ON designation_master USING gin ((UPPER(name::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS designation_master_name_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS company_name_trgm ON company USING gin ((UPPER(name::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS company_name_trgm',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS site_name_trgm ON site USING gin ((UPPER(name::text)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS site_name_trgm',
+        ),
+    ]
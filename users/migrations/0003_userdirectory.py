@@ -0,0 +1,123 @@
+# Generated by Django 3.2 on 2026-10-17 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_user_directory(apps, schema_editor):
+    UserProfileDetails = apps.get_model('users', 'UserProfileDetails')
+    UserSiteMapping = apps.get_model('users', 'UserSiteMapping')
+    UserDirectory = apps.get_model('users', 'UserDirectory')
+
+    user_site_mappings = {}
+    for user_site_mapping in UserSiteMapping.objects.select_related('site__company').order_by('id'):
+        user_site_mappings.setdefault(user_site_mapping.user_id, []).append(user_site_mapping)
+
+    rows = []
+    for user_profile in UserProfileDetails.objects.select_related('user', 'designation').order_by('id'):
+        user = user_profile.user
+        designation = user_profile.designation
+        for user_site_mapping in user_site_mappings.get(user_profile.user_id) or [None]:
+            site = user_site_mapping.site if user_site_mapping else None
+            company = site.company if site else None
+            rows.append(
+                UserDirectory(
+                    user_id=user_profile.user_id,
+                    user_site_mapping=user_site_mapping,
+                    user_type_id=user_profile.user_type_id,
+                    is_user_signup_complete=user_profile.date_joined is not None,
+                    user_first_name=user.first_name,
+                    user_last_name=user.last_name,
+                    user_email=user.email,
+                    company=company,
+                    company_name=company.name if company else None,
+                    site=site,
+                    site_name=site.name if site else None,
+                    country_code=user_profile.country_code,
+                    mobile_number=user_profile.mobile_number,
+                    designation_name=designation.name if designation else None,
+                    others_designation_name=user_profile.others_designation_name,
+                    site_address=user_profile.site_address,
+                    date_joined=user_profile.date_joined,
+                    user_site_mapping_is_active=(
+                        user_site_mapping.is_active if user_site_mapping else not user_profile.is_disabled
+                    ),
+                    profile_updated_on=user_profile.updated_on,
+                    site_mapping_updated_on=user_site_mapping.updated_on if user_site_mapping else None,
+                )
+            )
+    UserDirectory.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_user_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_user_signup_complete', models.BooleanField(default=False)),
+                ('user_first_name', models.CharField(blank=True, default='', max_length=150)),
+                ('user_last_name', models.CharField(blank=True, default='', max_length=150)),
+                ('user_email', models.CharField(blank=True, default='', max_length=254)),
+                ('company_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('site_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('country_code', models.CharField(blank=True, default='', max_length=24)),
+                ('mobile_number', models.CharField(blank=True, default='', max_length=16)),
+                ('designation_name', models.CharField(blank=True, max_length=64, null=True)),
+                ('others_designation_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('site_address', models.CharField(blank=True, max_length=500, null=True)),
+                ('date_joined', models.DateField(blank=True, null=True)),
+                ('user_site_mapping_is_active', models.BooleanField(default=True)),
+                ('profile_updated_on', models.DateTimeField(blank=True, null=True)),
+                ('site_mapping_updated_on', models.DateTimeField(blank=True, null=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.company')),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.site')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('user_site_mapping', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.usersitemapping')),
+                ('user_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.usertype')),
+            ],
+            options={
+                'db_table': 'user_directory',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', '-profile_updated_on', '-site_mapping_updated_on'], name='user_dir_type_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'company', '-profile_updated_on'], name='user_dir_type_company'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'site', '-profile_updated_on'], name='user_dir_type_site'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'user_first_name'], name='user_dir_type_first_name'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'user_last_name'], name='user_dir_type_last_name'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'company_name'], name='user_dir_type_company_name'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'site_name'], name='user_dir_type_site_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdirectory',
+            constraint=models.UniqueConstraint(condition=models.Q(('user_site_mapping__isnull', True)), fields=('user',), name='user_dir_user_without_site'),
+        ),
+        migrations.RunPython(populate_user_directory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2 on 2026-10-17 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userdirectory'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_updated',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_company',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_site',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_first_name',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_last_name',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_company_name',
+        ),
+        migrations.RemoveIndex(
+            model_name='userdirectory',
+            name='user_dir_type_site_name',
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', '-profile_updated_on', '-site_mapping_updated_on', '-id'], name='user_dir_type_updated_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'company', '-profile_updated_on', '-site_mapping_updated_on', '-id'], name='user_dir_type_company_upd_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'site', '-profile_updated_on', '-site_mapping_updated_on', '-id'], name='user_dir_type_site_upd_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'user_first_name', 'id'], name='user_dir_type_first_name_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'user_last_name', 'id'], name='user_dir_type_last_name_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'company_name', 'id'], name='user_dir_type_company_name_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userdirectory',
+            index=models.Index(fields=['user_type', 'site_name', 'id'], name='user_dir_type_site_name_id'),
+        ),
+    ]
@@ -286,3 +286,103 @@ class UserSiteMapping(models.Model):
     class Meta:
         db_table = "user_site_mapping"
         unique_together = ["user", "site"]
+
+
+class UserDirectory(models.Model):
+    """
+    Flattened read model of the user listing with one row per user site mapping, or a
+    single row for users without site mappings. Rows are rebuilt from the user, profile
+    and site mapping tables by users.directory whenever one of them is written.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_site_mapping = models.OneToOneField(
+        UserSiteMapping, blank=True, null=True, on_delete=models.CASCADE
+    )
+    user_type = models.ForeignKey(UserType, on_delete=models.CASCADE)
+    is_user_signup_complete = models.BooleanField(default=False)
+    user_first_name = models.CharField(max_length=150, blank=True, default="")
+    user_last_name = models.CharField(max_length=150, blank=True, default="")
+    user_email = models.CharField(max_length=254, blank=True, default="")
+    company = models.ForeignKey(
+        Company, blank=True, null=True, on_delete=models.CASCADE
+    )
+    company_name = models.CharField(max_length=100, blank=True, null=True)
+    site = models.ForeignKey(
+        Site, blank=True, null=True, on_delete=models.CASCADE
+    )
+    site_name = models.CharField(max_length=100, blank=True, null=True)
+    country_code = models.CharField(max_length=24, blank=True, default="")
+    mobile_number = models.CharField(max_length=16, blank=True, default="")
+    designation_name = models.CharField(max_length=64, blank=True, null=True)
+    others_designation_name = models.CharField(
+        max_length=100, blank=True, null=True
+    )
+    site_address = models.CharField(max_length=500, blank=True, null=True)
+    date_joined = models.DateField(blank=True, null=True)
+    user_site_mapping_is_active = models.BooleanField(default=True)
+    profile_updated_on = models.DateTimeField(blank=True, null=True)
+    site_mapping_updated_on = models.DateTimeField(blank=True, null=True)
+
+    def __unicode__(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.user_email} - {self.site_name}"
+
+    class Meta:
+        db_table = "user_directory"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(user_site_mapping__isnull=True),
+                name="user_dir_user_without_site",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    "user_type",
+                    "-profile_updated_on",
+                    "-site_mapping_updated_on",
+                    "-id",
+                ],
+                name="user_dir_type_updated_id",
+            ),
+            models.Index(
+                fields=[
+                    "user_type",
+                    "company",
+                    "-profile_updated_on",
+                    "-site_mapping_updated_on",
+                    "-id",
+                ],
+                name="user_dir_type_company_upd_id",
+            ),
+            models.Index(
+                fields=[
+                    "user_type",
+                    "site",
+                    "-profile_updated_on",
+                    "-site_mapping_updated_on",
+                    "-id",
+                ],
+                name="user_dir_type_site_upd_id",
+            ),
+            models.Index(
+                fields=["user_type", "user_first_name", "id"],
+                name="user_dir_type_first_name_id",
+            ),
+            models.Index(
+                fields=["user_type", "user_last_name", "id"],
+                name="user_dir_type_last_name_id",
+            ),
+            models.Index(
+                fields=["user_type", "company_name", "id"],
+                name="user_dir_type_company_name_id",
+            ),
+            models.Index(
+                fields=["user_type", "site_name", "id"],
+                name="user_dir_type_site_name_id",
+            ),
+        ]
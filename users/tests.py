@@ -1,3 +1,371 @@
-# from django.test import TestCase
+import csv
+import datetime
+import io
+from unittest import mock
 
-# Create your tests here.
+from django import test, urls
+from django.contrib import auth
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework import test as rest_test
+
+from aquacycl_project import constants, settings
+from users import controllers, directory, models
+
+User = auth.get_user_model()
+
+FIRST_NAMES = ["Ann", "Bob", "Cid"]
+COMPANY_NAMES = ["Acme", "Beta", None]
+SITE_NAMES = ["North", None]
+
+
+class UserDirectoryPaginationTestCase(test.TestCase):
+    """
+    Walks the user listing page by page with offsets and with cursors, over
+    sorts with repeated values and NULLs, and checks that both walks return
+    every row once in the order of the unpaginated queryset
+    """
+
+    limit = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        user_type, _ = models.UserType.objects.get_or_create(
+            id=constants.UserTypeNames.CUSTOMER,
+            defaults={"name": "Customer"},
+        )
+        updated_on = timezone.now()
+        for index in range(23):
+            user = User.objects.create_user(
+                username=f"user{index}",
+                email=f"user{index}@example.com",
+                first_name=FIRST_NAMES[index % len(FIRST_NAMES)],
+                last_name=f"Smith{index % 4}",
+            )
+            models.UserDirectory.objects.create(
+                user=user,
+                user_type=user_type,
+                user_first_name=user.first_name,
+                user_last_name=user.last_name,
+                user_email=user.email,
+                company_name=COMPANY_NAMES[index % len(COMPANY_NAMES)],
+                site_name=SITE_NAMES[index % len(SITE_NAMES)],
+                date_joined=datetime.date(2024, 1, 1 + index % 28),
+                # several rows share an update time and every fifth has none
+                profile_updated_on=(
+                    None
+                    if index % 5 == 0
+                    else updated_on + datetime.timedelta(seconds=index // 3)
+                ),
+            )
+
+    def setUp(self):
+        self.user_controller = controllers.UserController()
+
+    def get_user_objects(self, sort: list = (), search_text: str = ""):
+        user_objects = self.user_controller.get_all_users(
+            user_type_id=constants.UserTypeNames.CUSTOMER
+        )
+        if search_text:
+            user_objects = self.user_controller.get_user_objects_by_search(
+                user_objects=user_objects, search_text=search_text
+            )
+        return self.user_controller.get_user_objects_sorted(
+            user_objects=user_objects,
+            sort_spec=self.user_controller.get_sort_spec(
+                sort=list(sort), legacy_sorts=[]
+            ),
+        )
+
+    def walk_offset_pages(self, queryset) -> list:
+        rows = []
+        offset = 0
+        while True:
+            page, next_link = self.user_controller.get_paginated_response(
+                queryset=queryset, offset=offset, limit=self.limit
+            )
+            rows.extend(page)
+            offset += self.limit
+            if not next_link:
+                return rows
+
+    def walk_cursor_pages(self, queryset) -> list:
+        rows = []
+        cursor = ""
+        while True:
+            (
+                page,
+                cursor,
+            ) = self.user_controller.get_cursor_paginated_response(
+                queryset=queryset, cursor=cursor, limit=self.limit
+            )
+            self.assertLessEqual(len(page), self.limit)
+            rows.extend(page)
+            if cursor is None:
+                return rows
+
+    def test_cursor_walk_matches_offset_walk(self):
+        ascending = constants.SORT_ORDER_OPTIONS["ascending"]
+        descending = constants.SORT_ORDER_OPTIONS["descending"]
+        for sort in (
+            [],
+            [("first_name", ascending)],
+            [("company", descending)],
+            [("site", ascending)],
+            [("first_name", ascending), ("company", descending)],
+            [("company", ascending), ("site", descending)],
+            [("site", ascending), ("last_name", ascending)],
+        ):
+            with self.subTest(sort=sort):
+                user_objects = self.get_user_objects(sort=sort)
+                expected_rows = list(user_objects)
+
+                self.assertEqual(len(expected_rows), 23)
+                self.assertEqual(
+                    self.walk_offset_pages(user_objects), expected_rows
+                )
+                self.assertEqual(
+                    self.walk_cursor_pages(user_objects), expected_rows
+                )
+
+    def test_cursor_walk_of_search_results(self):
+        user_objects = self.get_user_objects(search_text="Bob Smith")
+        expected_rows = list(user_objects)
+
+        self.assertTrue(expected_rows)
+        self.assertNotIn("search_rank", expected_rows[0])
+        self.assertEqual(self.walk_offset_pages(user_objects), expected_rows)
+        self.assertEqual(self.walk_cursor_pages(user_objects), expected_rows)
+
+    def test_streamed_export_matches_paged_export(self):
+        user_objects = self.get_user_objects(
+            sort=[("company", constants.SORT_ORDER_OPTIONS["ascending"])]
+        )
+        (
+            has_non_blank_others_designation,
+            user_objects,
+        ) = self.user_controller.convert_user_objects_to_list_for_csv(
+            user_type_id=constants.UserTypeNames.CUSTOMER,
+            user_objects=user_objects,
+        )
+        headers = self.user_controller.get_user_csv_headers(
+            user_type_id=constants.UserTypeNames.CUSTOMER,
+            has_non_blank_others_designation=has_non_blank_others_designation,
+        )
+
+        with mock.patch.object(settings, "USER_EXPORT_CHUNK_SIZE", 5):
+            streamed_export = "".join(
+                self.user_controller.iter_user_csv_lines(
+                    headers=headers, user_objects=user_objects
+                )
+            )
+        for walk_pages in (self.walk_offset_pages, self.walk_cursor_pages):
+            with self.subTest(walk_pages=walk_pages.__name__):
+                paged_export = io.StringIO()
+                writer = csv.writer(paged_export)
+                writer.writerow(headers)
+                writer.writerows(
+                    self.user_controller.iter_user_csv_rows(
+                        walk_pages(user_objects)
+                    )
+                )
+
+                self.assertEqual(streamed_export, paged_export.getvalue())
+        self.assertEqual(len(streamed_export.splitlines()), 24)
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(serializers.ValidationError):
+            self.user_controller.get_cursor_paginated_response(
+                queryset=self.get_user_objects(),
+                cursor="bm90IGEgY3Vyc29y",
+                limit=self.limit,
+            )
+
+    def test_limit_below_one_is_rejected(self):
+        admin_user = User.objects.create_user(
+            username="admin", email="admin@example.com"
+        )
+        user_type, _ = models.UserType.objects.get_or_create(
+            id=constants.UserTypeNames.ADMIN, defaults={"name": "Admin"}
+        )
+        models.UserProfileDetails.objects.create(
+            user=admin_user, user_type=user_type
+        )
+        client = rest_test.APIClient()
+        client.force_authenticate(user=admin_user)
+
+        for params in (
+            {"limit": 0},
+            {"limit": -1, "cursor": ""},
+            {"limit": 4, "offset": -1},
+        ):
+            for url_name in ("user_master", "export_to_csv"):
+                with self.subTest(params=params, url_name=url_name):
+                    user_master_response = client.get(
+                        urls.reverse(url_name),
+                        {
+                            "user_type_id": constants.UserTypeNames.CUSTOMER,
+                            **params,
+                        },
+                    )
+
+                    self.assertEqual(user_master_response.status_code, 400)
+                    self.assertFalse(user_master_response.json()["result"])
+
+
+class UserDirectorySignalsTestCase(test.TestCase):
+    """
+    Writes users, profiles, site mappings and the named rows they point at
+    and checks that the directory rows are rebuilt once the writes commit
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_type, _ = models.UserType.objects.get_or_create(
+            id=constants.UserTypeNames.CUSTOMER,
+            defaults={"name": "Customer"},
+        )
+        cls.designation = models.DesignationMaster.objects.create(
+            name="Engineer"
+        )
+        cls.company = models.Company.objects.create(name="Acme")
+        cls.site = models.Site.objects.create(
+            company=cls.company, name="North"
+        )
+
+    def create_user(self, username: str, site_names: list = ()):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(
+                username=username,
+                email=f"{username}@example.com",
+                first_name="Ann",
+                last_name="Smith",
+            )
+            models.UserProfileDetails.objects.create(
+                user=user,
+                user_type=self.user_type,
+                designation=self.designation,
+            )
+            for site_name in site_names:
+                models.UserSiteMapping.objects.create(
+                    user=user,
+                    site=models.Site.objects.create(
+                        company=self.company, name=site_name
+                    ),
+                )
+        return user
+
+    def get_directory_rows(self, user) -> list:
+        return list(
+            models.UserDirectory.objects.filter(user=user)
+            .order_by("site_name")
+            .values_list(
+                "user_first_name",
+                "company_name",
+                "site_name",
+                "designation_name",
+            )
+        )
+
+    def test_user_without_site_mappings_has_one_row(self):
+        user = self.create_user(username="ann")
+
+        self.assertEqual(
+            self.get_directory_rows(user), [("Ann", None, None, "Engineer")]
+        )
+
+    def test_one_row_per_site_mapping(self):
+        user = self.create_user(username="ann", site_names=["East", "West"])
+
+        self.assertEqual(
+            self.get_directory_rows(user),
+            [
+                ("Ann", "Acme", "East", "Engineer"),
+                ("Ann", "Acme", "West", "Engineer"),
+            ],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.UserSiteMapping.objects.filter(
+                user=user, site__name="West"
+            ).get().delete()
+
+        self.assertEqual(
+            self.get_directory_rows(user),
+            [("Ann", "Acme", "East", "Engineer")],
+        )
+
+    def test_user_save_refreshes_rows(self):
+        user = self.create_user(username="ann", site_names=["East"])
+        user.first_name = "Bea"
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.save()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            self.get_directory_rows(user),
+            [("Bea", "Acme", "East", "Engineer")],
+        )
+
+    def test_last_login_save_is_skipped(self):
+        user = self.create_user(username="ann")
+        user.last_login = timezone.now()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.save(update_fields=["last_login"])
+
+        self.assertEqual(callbacks, [])
+
+    def test_renames_are_copied_to_rows(self):
+        user = self.create_user(username="ann", site_names=["East"])
+        site = models.Site.objects.get(name="East")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.name = "Acme Water"
+            self.company.save()
+            site.name = "East Bay"
+            site.save()
+            self.designation.name = "Operator"
+            self.designation.save()
+
+        self.assertEqual(
+            self.get_directory_rows(user),
+            [("Ann", "Acme Water", "East Bay", "Operator")],
+        )
+
+    def test_rolled_back_writes_leave_rows_alone(self):
+        user = self.create_user(username="ann")
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    user.first_name = "Bea"
+                    user.save()
+                    raise RuntimeError
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(
+            self.get_directory_rows(user), [("Ann", None, None, "Engineer")]
+        )
+
+    def test_full_rebuild_matches_refreshed_rows(self):
+        first_user = self.create_user(username="ann", site_names=["East"])
+        second_user = self.create_user(username="bea")
+        expected_rows = [
+            self.get_directory_rows(first_user),
+            self.get_directory_rows(second_user),
+        ]
+        models.UserDirectory.objects.all().delete()
+
+        row_count = directory.refresh_user_directory()
+
+        self.assertEqual(row_count, 2)
+        self.assertEqual(
+            [
+                self.get_directory_rows(first_user),
+                self.get_directory_rows(second_user),
+            ],
+            expected_rows,
+        )
@@ -5,7 +5,7 @@ import re
 
 from django.contrib import auth
 from django.core import exceptions
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import parsers, permissions, response, status, views
 
 from aquacycl_project import constants
@@ -740,8 +740,11 @@ class UserMaster(views.APIView):
         last_name_sort = query_params.get("last_name_sort", "0")
         company_sort = query_params.get("company_sort", "0")
         site_sort = query_params.get("site_sort", "0")
+        sort_str = query_params.get("sort", "[]")
         limit = query_params.get("limit", "")
         offset = query_params.get("offset", "0")
+        cursor = query_params.get("cursor", None)
+        count_mode = query_params.get("count", constants.UserCountModes.EXACT)
 
         if user_id:
             if not user_id.isdigit():
@@ -767,6 +770,20 @@ class UserMaster(views.APIView):
                 status=status.HTTP_200_OK,
             )
 
+        if count_mode not in [
+            constants.UserCountModes.EXACT,
+            constants.UserCountModes.ESTIMATED,
+            constants.UserCountModes.NONE,
+        ]:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Invalid count",
+                    "validation_error_field": "count",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         if not user_type_id:
             return response.Response(
                 {
@@ -883,6 +900,29 @@ class UserMaster(views.APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+        sort = []
+        if sort_str:
+            try:
+                sort = ast.literal_eval(f"{sort_str}")
+            except Exception:
+                return response.Response(
+                    {
+                        "result": False,
+                        "msg": "Invalid sort.",
+                        "validation_error_field": "sort",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        sort_spec = user_controller.get_sort_spec(
+            sort=sort,
+            legacy_sorts=[
+                ("first_name", int(first_name_sort)),
+                ("last_name", int(last_name_sort)),
+                ("company", int(company_sort)),
+                ("site", int(site_sort)),
+            ],
+        )
+
         user_objects = user_controller.get_all_users(
             user_type_id=int(user_type_id)
         )
@@ -890,7 +930,7 @@ class UserMaster(views.APIView):
             user_objects = user_controller.get_user_objects_by_search(
                 user_objects=user_objects, search_text=search_text
             )
-            if len(user_objects) == 0:
+            if not user_objects.exists():
                 return response.Response(
                     {
                         "result": False,
@@ -909,31 +949,13 @@ class UserMaster(views.APIView):
                 user_objects=user_objects, site_filter=site_filter
             )
 
-        user_objects_count = len(user_objects)
-
-        if int(first_name_sort):
-            user_objects = user_controller.get_user_objects_first_name_sorted(
-                user_objects=user_objects,
-                first_name_sort=("first_name", int(first_name_sort)),
-            )
-
-        if int(last_name_sort):
-            user_objects = user_controller.get_user_objects_last_name_sorted(
-                user_objects=user_objects,
-                last_name_sort=("last_name", int(last_name_sort)),
-            )
-
-        if int(company_sort):
-            user_objects = user_controller.get_user_objects_company_sorted(
-                user_objects=user_objects,
-                company_sort=("company_name", int(company_sort)),
-            )
+        user_objects_count = user_controller.get_user_count(
+            queryset=user_objects, count_mode=count_mode
+        )
 
-        if int(site_sort):
-            user_objects = user_controller.get_user_objects_site_sorted(
-                user_objects=user_objects,
-                site_sort=("site_name", int(site_sort)),
-            )
+        user_objects = user_controller.get_user_objects_sorted(
+            user_objects=user_objects, sort_spec=sort_spec
+        )
 
         if not limit:
             return response.Response(
@@ -944,17 +966,33 @@ class UserMaster(views.APIView):
                 }
             )
 
-        (user_objects, next_link,) = user_controller.get_paginated_response(
-            queryset=user_objects,
-            offset=offset,
-            limit=limit,
-        )
+        next_cursor = None
+        if cursor is not None:
+            (
+                user_objects,
+                next_cursor,
+            ) = user_controller.get_cursor_paginated_response(
+                queryset=user_objects,
+                cursor=cursor,
+                limit=limit,
+            )
+            next_link = next_cursor is not None
+        else:
+            (
+                user_objects,
+                next_link,
+            ) = user_controller.get_paginated_response(
+                queryset=user_objects,
+                offset=offset,
+                limit=limit,
+            )
 
         return response.Response(
             {
                 "result": True,
                 "msg": "Success",
                 "next_link": next_link,
+                "next_cursor": next_cursor,
                 "user_count": user_objects_count,
                 "data": user_objects,
             },
@@ -1342,8 +1380,11 @@ class ExportToCSV(views.APIView):
         last_name_sort = query_params.get("last_name_sort", "0")
         company_sort = query_params.get("company_sort", "0")
         site_sort = query_params.get("site_sort", "0")
+        sort_str = query_params.get("sort", "[]")
         limit = query_params.get("limit", "")
         offset = query_params.get("offset", "0")
+        cursor = query_params.get("cursor", None)
+        stream = query_params.get("stream", "0")
 
         if not user_type_id:
             return response.Response(
@@ -1378,6 +1419,16 @@ class ExportToCSV(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        if stream not in ["0", "1"]:
+            return response.Response(
+                {
+                    "result": False,
+                    "msg": "Invalid stream",
+                    "validation_error_field": "stream",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         if (
             not first_name_sort.isdigit()
             or int(first_name_sort)
@@ -1461,6 +1512,29 @@ class ExportToCSV(views.APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+        sort = []
+        if sort_str:
+            try:
+                sort = ast.literal_eval(f"{sort_str}")
+            except Exception:
+                return response.Response(
+                    {
+                        "result": False,
+                        "msg": "Invalid sort.",
+                        "validation_error_field": "sort",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        sort_spec = user_controller.get_sort_spec(
+            sort=sort,
+            legacy_sorts=[
+                ("first_name", int(first_name_sort)),
+                ("last_name", int(last_name_sort)),
+                ("company", int(company_sort)),
+                ("site", int(site_sort)),
+            ],
+        )
+
         user_objects = user_controller.get_all_users(
             user_type_id=int(user_type_id)
         )
@@ -1479,29 +1553,9 @@ class ExportToCSV(views.APIView):
                 user_objects=user_objects, site_filter=site_filter
             )
 
-        if int(first_name_sort):
-            user_objects = user_controller.get_user_objects_first_name_sorted(
-                user_objects=user_objects,
-                first_name_sort=("first_name", int(first_name_sort)),
-            )
-
-        if int(last_name_sort):
-            user_objects = user_controller.get_user_objects_last_name_sorted(
-                user_objects=user_objects,
-                last_name_sort=("last_name", int(last_name_sort)),
-            )
-
-        if int(company_sort):
-            user_objects = user_controller.get_user_objects_company_sorted(
-                user_objects=user_objects,
-                company_sort=("company_name", int(company_sort)),
-            )
-
-        if int(site_sort):
-            user_objects = user_controller.get_user_objects_site_sorted(
-                user_objects=user_objects,
-                site_sort=("site_name", int(site_sort)),
-            )
+        user_objects = user_controller.get_user_objects_sorted(
+            user_objects=user_objects, sort_spec=sort_spec
+        )
 
         (
             has_non_blank_others_designation,
@@ -1509,6 +1563,30 @@ class ExportToCSV(views.APIView):
         ) = user_controller.convert_user_objects_to_list_for_csv(
             user_type_id=int(user_type_id), user_objects=user_objects
         )
+        headers = user_controller.get_user_csv_headers(
+            user_type_id=int(user_type_id),
+            has_non_blank_others_designation=has_non_blank_others_designation,
+        )
+
+        file_name = (
+            "staff_data_"
+            if int(user_type_id) == constants.UserTypeNames.STAFF
+            else "customer_data_"
+        )
+        file_name += datetime.datetime.now().strftime(constants.DATE_FORMAT)
+        file_name += ".csv"
+
+        if int(stream):
+            response_data = StreamingHttpResponse(
+                user_controller.iter_user_csv_lines(
+                    headers=headers, user_objects=user_objects
+                ),
+                content_type="text/csv",
+            )
+            response_data[
+                "Content-Disposition"
+            ] = f"attachment; filename={file_name}"
+            return response_data
 
         if not limit:
             return response.Response(
@@ -1519,50 +1597,35 @@ class ExportToCSV(views.APIView):
                 }
             )
 
-        (user_objects, next_link,) = user_controller.get_paginated_response(
-            queryset=user_objects,
-            offset=offset,
-            limit=limit,
-        )
-
-        file_name = (
-            "staff_data_"
-            if int(user_type_id) == constants.UserTypeNames.STAFF
-            else "customer_data_"
-        )
-        file_name += datetime.datetime.now().strftime(constants.DATE_FORMAT)
-        file_name += ".csv"
+        next_cursor = None
+        if cursor is not None:
+            (
+                user_objects,
+                next_cursor,
+            ) = user_controller.get_cursor_paginated_response(
+                queryset=user_objects,
+                cursor=cursor,
+                limit=limit,
+            )
+        else:
+            (
+                user_objects,
+                next_link,
+            ) = user_controller.get_paginated_response(
+                queryset=user_objects,
+                offset=offset,
+                limit=limit,
+            )
 
         response_data = HttpResponse(content_type="text/csv")
         response_data[
             "Content-Disposition"
         ] = f"attachment; filename={file_name}"
+        if next_cursor:
+            response_data["X-Next-Cursor"] = next_cursor
         writer = csv.writer(response_data)
-        headers = [
-            "First name",
-            "Last name",
-            "Email",
-            "Mobile number",
-            "Company",
-            "Site",
-            "Designation",
-        ]
-        if has_non_blank_others_designation:
-            headers.extend(["Other designation name"])
-        headers.extend(
-            ["Site Address", "Date joined"]
-            if int(user_type_id) == constants.UserTypeNames.CUSTOMER
-            else ["Date joined"]
-        )
         writer.writerow(headers)
-        for object in user_objects:
-            date_joined = (
-                object[-1].strftime(constants.DATE_FORMAT)
-                if isinstance(object[-1], datetime.date)
-                else object[-1]
-            )
-            row = list(object[:-1]) + [date_joined]
-            writer.writerow(row)
+        writer.writerows(user_controller.iter_user_csv_rows(user_objects))
         return response_data
 
 